@@ -1,5 +1,4 @@
 import threading
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from itertools import permutations
 
@@ -7,20 +6,27 @@ import structlog
 from eth_typing import Address, BlockNumber
 from web3 import Web3
 from web3.contract import Contract
-from web3.middleware import latest_block_based_cache_middleware
 
 
 import beamer.agent.metrics
-from beamer.agent.chain import POLL_PERIOD, EventMonitor, EventProcessor
+from beamer.agent.async_engine import AsyncEngine, AsyncEventMonitor
+from beamer.agent.chain import POLL_PERIOD, EventMonitor, EventProcessor, EventRouter
 from beamer.agent.config import Config
 from beamer.agent.contracts import ContractInfo, make_contracts
+from beamer.agent.l1_resolution import RelayerScheduler, stop_relayer_daemons
 from beamer.agent.state_machine import Context
-from beamer.agent.tracker import Tracker
+from beamer.agent.storage import EventStore
+from beamer.agent.tracker import ClaimTracker, Tracker
+from beamer.agent.transactions import TransactionManager
 from beamer.agent.typing import URL, ChainId, TransferDirection
-from beamer.agent.util import make_web3
+from beamer.agent.util import make_async_web3, make_web3
 
 log = structlog.get_logger(__name__)
 
+# The time for which responses to requests for the latest state of L1 are
+# taken from the cache, in seconds. This is about the L1 block time.
+_L1_LATEST_MAX_AGE = 12
+
 
 def _get_contracts_info(config: Config, chain_id: ChainId) -> dict[str, ContractInfo]:
     info = config.deployment_info.get(chain_id)
@@ -61,11 +67,18 @@ class Agent:
         self._config = config
         self._stopped = threading.Event()
         self._stopped.set()
+        if config.data_dir is not None:
+            config.data_dir.mkdir(parents=True, exist_ok=True)
         self._init()
 
     def _init_l1_chain(self) -> _BaseChain:
-        l1_w3 = make_web3(self._config.rpc_urls["l1"], self._config.account)
-        l1_w3.middleware_onion.add(latest_block_based_cache_middleware)
+        l1_w3 = make_web3(
+            self._config.rpc_urls["l1"],
+            self._config.account,
+            backup_urls=self._config.backup_rpc_urls.get("l1", ()),
+            cache_size=self._config.rpc_cache_size,
+            latest_max_age=_L1_LATEST_MAX_AGE,
+        )
         chain_id = ChainId(l1_w3.eth.chain_id)
         return _BaseChain(w3=l1_w3, id=chain_id, rpc_url=self._config.rpc_urls["l1"])
 
@@ -74,7 +87,12 @@ class Agent:
         for chain_name, rpc_url in self._config.rpc_urls.items():
             if chain_name == "l1":
                 continue
-            w3 = make_web3(rpc_url, self._config.account)
+            w3 = make_web3(
+                rpc_url,
+                self._config.account,
+                backup_urls=self._config.backup_rpc_urls.get(chain_name, ()),
+                cache_size=self._config.rpc_cache_size,
+            )
             chain_id = ChainId(w3.eth.chain_id)
             if chain_id in chains:
                 continue
@@ -82,14 +100,34 @@ class Agent:
             contracts = make_contracts(w3, contracts_info)
             request_manager = contracts["RequestManager"]
             fill_manager = contracts["FillManager"]
-            self._event_monitors[chain_id] = EventMonitor(
-                web3=w3,
-                contracts=(request_manager, fill_manager),
-                deployment_block=_get_deployment_block(contracts_info),
-                poll_period=POLL_PERIOD,
-                on_new_events=[],
-                on_sync_done=[],
-            )
+            self._transaction_managers[chain_id] = TransactionManager(w3)
+            if self._engine is None:
+                self._event_monitors[chain_id] = EventMonitor(
+                    web3=w3,
+                    contracts=(request_manager, fill_manager),
+                    deployment_block=_get_deployment_block(contracts_info),
+                    poll_period=POLL_PERIOD,
+                    on_new_events=[],
+                    on_sync_done=[],
+                    event_store=self._event_store,
+                    event_router=self._event_router,
+                    ws_url=self._config.ws_urls.get(chain_name),
+                )
+            else:
+                event_monitor = AsyncEventMonitor(
+                    web3=w3,
+                    async_web3=make_async_web3(w3),
+                    contracts=(request_manager, fill_manager),
+                    deployment_block=_get_deployment_block(contracts_info),
+                    poll_period=POLL_PERIOD,
+                    on_new_events=[],
+                    on_sync_done=[],
+                    event_store=self._event_store,
+                    event_router=self._event_router,
+                    ws_url=self._config.ws_urls.get(chain_name),
+                )
+                self._engine.add_monitor(event_monitor)
+                self._event_monitors[chain_id] = event_monitor
             chains[chain_id] = _Chain(
                 w3=w3,
                 id=chain_id,
@@ -133,7 +171,7 @@ class Agent:
 
         context = Context(
             requests=Tracker(),
-            claims=Tracker(),
+            claims=ClaimTracker(),
             source_chain_id=source_chain.id,
             target_chain_id=target_chain.id,
             request_manager=source_chain.request_manager,
@@ -148,20 +186,33 @@ class Agent:
             l1_resolutions={},
             l1_invalidations={},
             logger=logger,
+            transaction_managers=self._transaction_managers,
         )
-        event_processor = EventProcessor(context)
-        self._event_monitors[direction.source].subscribe(event_processor)
+        event_processor = EventProcessor(context, self._event_store)
+        self._subscribe(self._event_monitors[direction.source], event_processor)
         if source_chain.id != target_chain.id:
-            self._event_monitors[direction.target].subscribe(event_processor)
+            self._subscribe(self._event_monitors[direction.target], event_processor)
         self._event_processors[direction] = event_processor
 
+    def _subscribe(self, event_monitor: EventMonitor, event_processor: EventProcessor) -> None:
+        if self._engine is None:
+            event_monitor.subscribe(event_processor)
+        else:
+            assert isinstance(event_monitor, AsyncEventMonitor)
+            self._engine.subscribe(event_monitor, event_processor)
+
     def _init(self) -> None:
-        # Just add one worker, as this effectively serializes the work
-        # This is necessary as we use the account for all resolutions and
-        # would otherwise run into nonce problems
-        self._task_pool = ThreadPoolExecutor(max_workers=1)
+        self._event_store = None
+        if self._config.data_dir is not None:
+            self._event_store = EventStore(self._config.data_dir.joinpath("events.db"))
+        # Relayers for different rollups run in parallel. They coordinate
+        # their L1 nonces via a lock file, since they all use our account.
+        self._task_pool = RelayerScheduler()
         self._event_processors: dict[TransferDirection, EventProcessor] = {}
         self._event_monitors: dict[ChainId, EventMonitor] = {}
+        self._transaction_managers: dict[ChainId, TransactionManager] = {}
+        self._event_router = EventRouter()
+        self._engine = AsyncEngine() if self._config.engine == "asyncio" else None
         l1 = self._init_l1_chain()
         chains = self._init_chains()
         chain_ids = list(chains.keys())
@@ -176,16 +227,22 @@ class Agent:
 
     def start(self) -> None:
         assert self._stopped.is_set()
+        for transaction_manager in self._transaction_managers.values():
+            transaction_manager.start()
         for event_processor in self._event_processors.values():
             beamer.agent.metrics.init(
                 config=self._config,
                 source_rpc_url=event_processor.context.source_rpc_url,
                 target_rpc_url=event_processor.context.target_rpc_url,
             )
-            event_processor.start()
-
-        for event_monitor in self._event_monitors.values():
-            event_monitor.start()
+            if self._engine is None:
+                event_processor.start()
+
+        if self._engine is None:
+            for event_monitor in self._event_monitors.values():
+                event_monitor.start()
+        else:
+            self._engine.start()
         self._stopped.clear()
 
     def get_context(self, direction: TransferDirection) -> Context:
@@ -197,11 +254,21 @@ class Agent:
 
     def stop(self) -> None:
         assert not self._stopped.is_set()
-        for event_processor in self._event_processors.values():
-            event_processor.stop()
-        for event_monitor in self._event_monitors.values():
-            event_monitor.stop()
+        if self._engine is None:
+            for event_processor in self._event_processors.values():
+                event_processor.stop()
+            for event_monitor in self._event_monitors.values():
+                event_monitor.stop()
+        else:
+            self._engine.stop()
+        # The event monitors and processors are done with the event store.
+        # It is opened again for the next start.
+        if self._event_store is not None:
+            self._event_store.close()
+        for transaction_manager in self._transaction_managers.values():
+            transaction_manager.stop()
         self._task_pool.shutdown(wait=True, cancel_futures=False)
+        stop_relayer_daemons()
         self._init()
         self._stopped.set()
 
@@ -0,0 +1,339 @@
+import asyncio
+import threading
+import time
+from typing import Coroutine, Optional
+
+import requests.exceptions
+from web3 import Web3
+from web3.contract import Contract
+from web3.types import FilterParams
+
+from beamer.agent.chain import (
+    _STOP_TIMEOUT,
+    BACKFILL_WORKERS,
+    SYNC_BACKLOG,
+    EventMonitor,
+    EventProcessor,
+    EventRouter,
+    _NewEventsCallback,
+    _SyncDoneCallback,
+)
+from beamer.agent.events import (
+    Event,
+    EventFetcher,
+    LatestBlockUpdatedEvent,
+    _ResolveTimestampsCallback,
+)
+from beamer.agent.storage import EventStore
+from beamer.agent.typing import URL, BlockNumber
+from beamer.agent.util import wrap_thread_func
+
+
+class AsyncEventFetcher(EventFetcher):
+    """An EventFetcher that talks to the RPC via an async Web3 instance.
+
+    The synchronous ``web3`` is only used for the contracts' metadata; all
+    requests made while fetching go through ``async_web3``."""
+
+    def __init__(
+        self,
+        web3: Web3,
+        async_web3: Web3,
+        contracts: tuple[Contract, ...],
+        start_block: BlockNumber,
+        num_workers: int = 1,
+        resolve_timestamps: Optional[_ResolveTimestampsCallback] = None,
+    ):
+        # The base class' thread pool is not needed since ranges are fetched
+        # concurrently on the event loop.
+        super().__init__(web3, contracts, start_block, resolve_timestamps=resolve_timestamps)
+        self._num_workers = num_workers
+        self._async_web3 = async_web3
+
+    async def _fetch_range_async(
+        self, from_block: BlockNumber, to_block: BlockNumber
+    ) -> Optional[tuple[list[Event], float]]:
+        self._log.debug(
+            "Fetching events",
+            contracts=self._contract_addresses,
+            from_block=from_block,
+            to_block=to_block,
+        )
+        try:
+            before_query = time.monotonic()
+            params: FilterParams = dict(
+                fromBlock=from_block, toBlock=to_block, address=self._contract_addresses
+            )
+            logs = await self._async_web3.eth.get_logs(params)  # type: ignore
+            after_query = time.monotonic()
+
+        except (requests.exceptions.ReadTimeout, ValueError):
+            # As in EventFetcher, the caller reduces the range.
+            return None
+
+        except requests.exceptions.ConnectionError as exc:
+            self._log.error("Connection error", exc=exc)
+            raise exc
+
+        else:
+            # Resolving block timestamps may block, so keep it off the event loop.
+            events = await asyncio.to_thread(self._decode, logs)
+            return events, after_query - before_query
+
+    async def fetch_async(self, max_events: Optional[int] = None) -> list[Event]:
+        self._set_caught_up(False)
+        try:
+            block_data = await self._async_web3.eth.get_block("latest")  # type: ignore
+            block_number = BlockNumber(block_data["number"])
+        except requests.exceptions.RequestException:
+            return []
+
+        if block_number < self._next_block_number:
+            self._set_caught_up(True)
+            return []
+
+        result: list[Event] = []
+        from_block = self._next_block_number
+        while from_block <= block_number and (max_events is None or len(result) < max_events):
+            ranges = self._split_range(from_block, block_number)
+            try:
+                range_results = await asyncio.gather(
+                    *(self._fetch_range_async(*range_) for range_ in ranges)
+                )
+            except requests.exceptions.ConnectionError:
+                break
+
+            durations = []
+            for (_, end), range_result in zip(ranges, range_results):
+                # As in EventFetcher, ranges after a timed out one are dropped
+                # to keep the events ordered, and the range is adjusted once.
+                if range_result is None:
+                    self._reduce_blocks_to_fetch()
+                    break
+                events, duration = range_result
+                result.extend(events)
+                durations.append(duration)
+                from_block = BlockNumber(end + 1)
+            else:
+                self._adjust_blocks_to_fetch(max(durations, default=0.0))
+
+        self._next_block_number = from_block
+        self._set_caught_up(from_block - 1 == block_number)
+        try:
+            if from_block - 1 != block_number:
+                block_data = await self._async_web3.eth.get_block(from_block - 1)  # type: ignore
+        except requests.exceptions.RequestException:
+            return result
+        else:
+            result.append(LatestBlockUpdatedEvent(chain_id=self._chain_id, block_data=block_data))
+        return result
+
+
+class AsyncEventMonitor(EventMonitor):
+    """An EventMonitor that runs as a task of an :class:`AsyncEngine`
+    instead of in its own thread."""
+
+    def __init__(
+        self,
+        web3: Web3,
+        async_web3: Web3,
+        contracts: tuple[Contract, ...],
+        deployment_block: BlockNumber,
+        on_new_events: list[_NewEventsCallback],
+        on_sync_done: list[_SyncDoneCallback],
+        poll_period: float,
+        event_store: Optional[EventStore] = None,
+        event_router: Optional[EventRouter] = None,
+        ws_url: Optional[URL] = None,
+    ):
+        super().__init__(
+            web3=web3,
+            contracts=contracts,
+            deployment_block=deployment_block,
+            on_new_events=on_new_events,
+            on_sync_done=on_sync_done,
+            poll_period=poll_period,
+            event_store=event_store,
+            event_router=event_router,
+            ws_url=ws_url,
+        )
+        self._async_web3 = async_web3
+
+    def add_listener(
+        self, on_new_events: _NewEventsCallback, on_sync_done: _SyncDoneCallback
+    ) -> None:
+        self._on_new_events.append(on_new_events)
+        self._on_sync_done.append(on_sync_done)
+
+    async def run(self) -> None:
+        self._log.info(
+            "EventMonitor started",
+            addresses=[c.address for c in self._contracts],
+        )
+        start_block, stored_events = self._load_stored_events()
+        stored_events = self._drop_finished_requests(stored_events)
+        for start in range(0, len(stored_events), SYNC_BACKLOG):
+            end = start + SYNC_BACKLOG
+            await self._deliver_past_events_async(stored_events[start:end])
+        del stored_events
+
+        fetcher = AsyncEventFetcher(
+            self._web3,
+            self._async_web3,
+            self._contracts,
+            start_block,
+            num_workers=BACKFILL_WORKERS,
+            resolve_timestamps=self._block_timestamps.resolve,
+        )
+        try:
+            current_block = await self._get_block_number()
+            while fetcher.synced_block < current_block:
+                synced_block = fetcher.synced_block
+                events = await self._fetch_async(fetcher, max_events=SYNC_BACKLOG)
+                await self._deliver_past_events_async(self._drop_finished_requests(events))
+                if fetcher.synced_block == synced_block:
+                    # Fetching failed, so back off instead of retrying at once.
+                    await asyncio.sleep(self._poll_period.next(events))
+            self._call_on_sync_done()
+            self._log.info("Sync done")
+            if self._subscription is not None:
+                self._subscription.start()
+            await self._follow(fetcher)
+        finally:
+            if self._subscription is not None:
+                self._subscription.stop()
+            fetcher.close()
+
+    async def _get_block_number(self) -> BlockNumber:
+        while True:
+            try:
+                return await self._async_web3.eth.block_number  # type: ignore
+            except requests.exceptions.RequestException as exc:
+                self._log.warning("Failed to get the latest block number", exc=exc)
+            await asyncio.sleep(self._poll_period.next([]))
+
+    async def _follow(self, fetcher: AsyncEventFetcher) -> None:
+        while True:
+            if self._subscription is not None and self._subscription.connected:
+                notifications = await asyncio.to_thread(self._subscription.take, _STOP_TIMEOUT / 2)
+                if self._needs_fetch(notifications):
+                    events = await self._fetch_async(fetcher)
+                    self._fetched(fetcher)
+                else:
+                    events = self._apply_notifications(fetcher, notifications)
+                if events:
+                    self._call_on_new_events(events)
+                continue
+
+            events = await self._fetch_async(fetcher)
+            if events:
+                self._call_on_new_events(events)
+            await asyncio.sleep(self._poll_period.next(events))
+
+    async def _deliver_past_events_async(self, events: list[Event]) -> None:
+        if not events:
+            return
+        # The event processors run in worker threads, so waiting for them
+        # must not block the event loop.
+        while not await asyncio.to_thread(
+            self._event_router.wait_for_backlog, SYNC_BACKLOG, _STOP_TIMEOUT / 2
+        ):
+            pass
+        self._call_on_new_events(events)
+
+    async def _fetch_async(
+        self, fetcher: AsyncEventFetcher, max_events: Optional[int] = None
+    ) -> list[Event]:
+        events = await fetcher.fetch_async(max_events)
+        self._store_events(events, fetcher.synced_block)
+        return events
+
+
+class AsyncEngine:
+    """Runs event monitors and event processors on a single asyncio event loop.
+
+    The event monitors' RPC requests are non-blocking. Event processors are
+    woken up by their event monitors and run their processing step in a worker
+    thread, because the state machines make blocking calls, e.g. to send
+    transactions. A processor never runs more than one step at a time, so
+    event handling keeps the same semantics as with the threaded engine."""
+
+    def __init__(self) -> None:
+        self._monitors: list[AsyncEventMonitor] = []
+        self._wakeups: dict[EventProcessor, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def add_monitor(self, monitor: AsyncEventMonitor) -> None:
+        self._monitors.append(monitor)
+
+    def subscribe(self, monitor: AsyncEventMonitor, event_processor: EventProcessor) -> None:
+        wakeup = self._wakeups.setdefault(event_processor, asyncio.Event())
+        monitor.subscribe(event_processor)
+        monitor.add_listener(lambda _events: wakeup.set(), wakeup.set)
+
+    def start(self) -> None:
+        self._ready = threading.Event()
+        self._thread = threading.Thread(
+            name="AsyncEngine", target=wrap_thread_func(self._thread_func)
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        assert self._loop is not None and self._stopped is not None
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join(_STOP_TIMEOUT)
+        # Processing steps might still be running in worker threads if the
+        # loop did not stop in time, so skip the final snapshots then, like
+        # EventProcessor.stop does for its own thread.
+        if self._thread.is_alive():
+            return
+        for event_processor in self._wakeups:
+            event_processor.stop()
+
+    def _thread_func(self) -> None:
+        asyncio.run(self._main())
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._ready.set()
+
+        coros: list[Coroutine] = [monitor.run() for monitor in self._monitors]
+        coros.extend(
+            self._run_processor(event_processor, wakeup)
+            for event_processor, wakeup in self._wakeups.items()
+        )
+        tasks = [asyncio.create_task(coro) for coro in coros]
+        stopped = asyncio.create_task(self._stopped.wait())
+        done, _ = await asyncio.wait([stopped, *tasks], return_when=asyncio.FIRST_COMPLETED)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Tasks other than the stop task only finish because of an error.
+        # Re-raise it so that the agent shuts down, as with the threaded engine.
+        for task in done:
+            if task is not stopped:
+                task.result()
+
+    async def _run_processor(self, event_processor: EventProcessor, wakeup: asyncio.Event) -> None:
+        event_processor.context.logger.info("EventProcessor started")
+        loop = asyncio.get_running_loop()
+
+        def on_completion() -> None:
+            loop.call_soon_threadsafe(wakeup.set)
+
+        event_processor.context.completions.add_listener(on_completion)
+
+        while True:
+            # While syncing, only new events need processing, see
+            # EventProcessor.process().
+            timeout = event_processor.seconds_until_due() if event_processor.synced else None
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            await asyncio.to_thread(event_processor.process)
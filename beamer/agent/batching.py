@@ -0,0 +1,192 @@
+from typing import Any, Callable, Optional, Sequence
+
+import requests.exceptions
+from hexbytes import HexBytes
+from web3 import HTTPProvider, Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.contracts import prepare_transaction
+from web3._utils.encoding import FriendlyJsonSerde
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3._utils.request import make_post_request
+from web3.contract import ContractFunction
+from web3.types import BlockIdentifier, RPCEndpoint, RPCResponse
+
+from beamer.agent.typing import URL
+
+# A pseudo RPC method whose parameters are a list of (method, params) pairs.
+# Requests for this method are sent as JSON-RPC batch requests. Since it is a
+# regular request as far as web3 is concerned, it passes through the whole
+# middleware stack, e.g. the rate limiter, as a single request. The result is
+# the list of responses, in the order of the requests.
+BATCH_METHOD = RPCEndpoint("beamer_batch")
+
+# The maximum number of requests sent in a single batch. Larger batches are
+# split up.
+MAX_BATCH_SIZE = 100
+
+
+class _BatchRejected(ValueError):
+    pass
+
+
+def _is_rejection(exc: requests.exceptions.HTTPError) -> bool:
+    """Whether ``exc`` means that the RPC does not accept batch requests, as
+    opposed to e.g. rate limiting us."""
+    return (
+        exc.response is not None
+        and 400 <= exc.response.status_code < 500
+        and exc.response.status_code != 429
+    )
+
+
+class BatchingHTTPProvider(HTTPProvider):
+    """An HTTP provider that sends the requests made via :data:`BATCH_METHOD`
+    as JSON-RPC batch requests.
+
+    All other requests are sent on their own. If the RPC rejects a batch
+    request, the requests of this and all later batches are sent one by one
+    instead.
+    """
+
+    def __init__(self, endpoint_uri: URL, request_kwargs: Optional[Any] = None):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        # Cleared when the RPC rejects a batch request.
+        self._batches_supported = True
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method != BATCH_METHOD:
+            return self._send_single(method, params)
+
+        batch = list(params)
+        responses = []
+        for start in range(0, len(batch), MAX_BATCH_SIZE):
+            end = start + MAX_BATCH_SIZE
+            responses.extend(self._send_requests(batch[start:end]))
+        return RPCResponse(jsonrpc="2.0", id=0, result=responses)
+
+    def _send_requests(self, batch: Sequence[tuple[RPCEndpoint, Any]]) -> list[RPCResponse]:
+        if len(batch) > 1 and self._batches_supported:
+            try:
+                return self._send_batch(batch)
+            except _BatchRejected:
+                self._batches_supported = False
+        return [self._send_single(method, params) for method, params in batch]
+
+    def _post(self, methods: Sequence[RPCEndpoint], data: bytes) -> bytes:
+        """Send ``data``, which contains requests for ``methods``, and return
+        the raw response. This is the only place where requests are sent."""
+        return make_post_request(
+            self.endpoint_uri, data, **self.get_request_kwargs()  # type: ignore
+        )
+
+    def _send_single(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(self._post([method], data))
+
+    def _send_batch(self, batch: Sequence[tuple[RPCEndpoint, Any]]) -> list[RPCResponse]:
+        ids = [next(self.request_counter) for _ in batch]
+        payload = [
+            dict(jsonrpc="2.0", method=method, params=params, id=request_id)
+            for (method, params), request_id in zip(batch, ids)
+        ]
+        data = FriendlyJsonSerde().json_encode(payload).encode()  # type: ignore
+        try:
+            raw_response = self._post([method for method, _ in batch], data)
+        except requests.exceptions.HTTPError as exc:
+            if _is_rejection(exc):
+                raise _BatchRejected(exc) from exc
+            raise
+        responses = self.decode_rpc_response(raw_response)
+        if not isinstance(responses, list):
+            # Some RPCs reply to batch requests with a single error.
+            raise _BatchRejected(responses)
+
+        by_id = {response.get("id"): response for response in responses}
+        result = []
+        for (method, params), request_id in zip(batch, ids):
+            response = by_id.get(request_id)
+            if response is None:
+                # Some RPCs leave out the responses to some of the requests,
+                # e.g. if the batch is larger than they allow.
+                response = self._send_single(method, params)
+            result.append(response)
+        return result
+
+
+def batch_call(
+    functions: Sequence[ContractFunction],
+    block_identifier: BlockIdentifier = "latest",
+    return_exceptions: bool = False,
+) -> list[Any]:
+    """Call the given contract functions and return their results.
+
+    If the functions share a Web3 instance that uses a
+    :class:`BatchingHTTPProvider`, the underlying eth_call requests are sent
+    in a single batch. Otherwise, the functions are called one by one.
+
+    If a call fails, its error is raised, unless ``return_exceptions`` is
+    true. Then, the error is returned in place of the call's result.
+    """
+    if not functions:
+        return []
+
+    w3: Web3 = functions[0].web3
+    same_web3 = all(func.web3 is w3 for func in functions)
+    if len(functions) == 1 or not same_web3 or not isinstance(w3.provider, BatchingHTTPProvider):
+        return [_call_single(func, block_identifier, return_exceptions) for func in functions]
+
+    requests = []
+    for func in functions:
+        transaction = prepare_transaction(
+            func.address,
+            w3,
+            fn_identifier=func.function_identifier,
+            contract_abi=func.contract_abi,
+            fn_abi=func.abi,
+            transaction={},
+            fn_args=func.args,
+            fn_kwargs=func.kwargs,
+        )
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)  # type: ignore
+        requests.append((RPCEndpoint("eth_call"), [transaction, block_identifier]))
+
+    responses = w3.manager.request_blocking(BATCH_METHOD, requests)
+    results = []
+    for func, response in zip(functions, responses):
+        try:
+            results.append(_decode_result(func, response))
+        except ValueError as exc:
+            if not return_exceptions:
+                raise
+            results.append(exc)
+    return results
+
+
+def _call_single(
+    func: ContractFunction, block_identifier: BlockIdentifier, return_exceptions: bool
+) -> Any:
+    try:
+        return func.call(block_identifier=block_identifier)
+    except ValueError as exc:
+        if not return_exceptions:
+            raise
+        return exc
+
+
+def _decode_result(func: ContractFunction, response: RPCResponse) -> Any:
+    if "error" in response:
+        raise ValueError(response["error"])
+    return decode_output(func, HexBytes(response["result"]))
+
+
+def decode_output(func: ContractFunction, data: bytes) -> Any:
+    """Decode the return data of a call to ``func`` the same way web3 does."""
+    output_types = get_abi_output_types(func.abi)
+    output_data = func.web3.codec.decode(output_types, data)
+    normalizers: list[Callable[..., Any]] = list(BASE_RETURN_NORMALIZERS)
+    normalizers.extend(func._return_data_normalizers or ())  # pylint:disable=protected-access
+    normalized_data = map_abi_data(normalizers, output_types, output_data)
+    if len(normalized_data) == 1:
+        return normalized_data[0]
+    return normalized_data
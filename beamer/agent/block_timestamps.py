@@ -0,0 +1,97 @@
+from typing import Iterable, Optional, cast
+
+import lru
+import requests.exceptions
+import structlog
+from web3 import Web3
+from web3.types import RPCEndpoint, Timestamp
+
+from beamer.agent.batching import BATCH_METHOD, BatchingHTTPProvider
+from beamer.agent.storage import EventStore
+from beamer.agent.typing import BlockNumber, ChainId
+
+
+class BlockTimestamps:
+    """Resolves block numbers to block timestamps.
+
+    Timestamps are looked up in memory, then in the event store, if any, and
+    only the remaining ones are requested from the RPC. These are requested
+    with JSON-RPC batch requests of up to ``batch_size`` blocks. Newly
+    resolved timestamps are persisted in the event store.
+    """
+
+    def __init__(
+        self, web3: Web3, event_store: Optional[EventStore] = None, batch_size: int = 100
+    ):
+        self._web3 = web3
+        self._chain_id = ChainId(web3.eth.chain_id)
+        self._event_store = event_store
+        self._batch_size = batch_size
+        self._cache = cast(dict[BlockNumber, Timestamp], lru.LRU(10_000))
+        self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
+
+    def add(self, block_number: BlockNumber, timestamp: Timestamp) -> None:
+        """Remember the timestamp of a block that is known already."""
+        self._cache[block_number] = timestamp
+
+    def resolve(self, block_numbers: Iterable[BlockNumber]) -> dict[BlockNumber, Timestamp]:
+        """Return the timestamps of the given blocks. Blocks whose timestamp
+        could not be resolved, e.g. due to RPC errors, are left out."""
+        result = {}
+        missing = set()
+        for block_number in block_numbers:
+            timestamp = self._cache.get(block_number)
+            if timestamp is None:
+                missing.add(block_number)
+            else:
+                result[block_number] = timestamp
+
+        if missing and self._event_store is not None:
+            stored = self._event_store.load_block_timestamps(self._chain_id, missing)
+            missing.difference_update(stored)
+            self._update(result, stored)
+
+        if missing:
+            fetched = self._fetch(sorted(missing))
+            if fetched and self._event_store is not None:
+                self._event_store.store_block_timestamps(self._chain_id, fetched)
+            self._update(result, fetched)
+
+        return result
+
+    def _update(
+        self, result: dict[BlockNumber, Timestamp], timestamps: dict[BlockNumber, Timestamp]
+    ) -> None:
+        for block_number, timestamp in timestamps.items():
+            self._cache[block_number] = timestamp
+        result.update(timestamps)
+
+    def _fetch(self, block_numbers: list[BlockNumber]) -> dict[BlockNumber, Timestamp]:
+        result = {}
+        try:
+            for start in range(0, len(block_numbers), self._batch_size):
+                end = start + self._batch_size
+                result.update(self._fetch_batch(block_numbers[start:end]))
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            self._log.warning("Failed to fetch block timestamps", exc=exc)
+        return result
+
+    def _fetch_batch(self, block_numbers: list[BlockNumber]) -> dict[BlockNumber, Timestamp]:
+        if not isinstance(self._web3.provider, BatchingHTTPProvider) or len(block_numbers) == 1:
+            return {
+                block_number: self._web3.eth.get_block(block_number)["timestamp"]
+                for block_number in block_numbers
+            }
+
+        batch = [
+            (RPCEndpoint("eth_getBlockByNumber"), [hex(block_number), False])
+            for block_number in block_numbers
+        ]
+        responses = self._web3.manager.request_blocking(BATCH_METHOD, batch)
+
+        result = {}
+        for block_number, response in zip(block_numbers, responses):
+            block = response.get("result")
+            if block is not None:
+                result[block_number] = Timestamp(int(block["timestamp"], 16))
+        return result
@@ -1,21 +1,38 @@
-import os
-import sys
+import functools
 import threading
 import time
-import traceback
-from typing import Callable
+from typing import Any, Callable, Collection, Hashable, Iterable, Optional
 
 import structlog
 from web3 import Web3
-from web3.contract import Contract
-from web3.types import Wei
-
-from beamer.agent.events import Event, EventFetcher
+from web3.contract import Contract, ContractFunction
+from web3.types import BlockData, TxReceipt, Wei
+
+import beamer.agent.metrics
+from beamer.agent.block_timestamps import BlockTimestamps
+from beamer.agent.events import (
+    ClaimMade,
+    ClaimStakeWithdrawn,
+    DepositWithdrawn,
+    Event,
+    EventFetcher,
+    FinalityPeriodUpdated,
+    LatestBlockUpdatedEvent,
+    RequestCreated,
+    RequestFilled,
+    SourceChainEvent,
+    TargetChainEvent,
+    TxEvent,
+)
 from beamer.agent.models.claim import Claim
 from beamer.agent.models.request import Request
+from beamer.agent.multicall import CallAggregator
+from beamer.agent.snapshot import restore_context, snapshot_context
 from beamer.agent.state_machine import Context, process_event
-from beamer.agent.typing import BlockNumber, ChainId
-from beamer.agent.util import TransactionFailed, load_ERC20_abi, transact
+from beamer.agent.storage import EventStore, make_event_key
+from beamer.agent.subscriptions import Notifications, SubscriptionListener
+from beamer.agent.typing import URL, BlockNumber, ChainId, ClaimId, RequestId, TransferDirection
+from beamer.agent.util import TransactionFailed, load_ERC20_abi, transact, wrap_thread_func
 
 
 _ERC20_ABI = load_ERC20_abi()
@@ -26,22 +43,242 @@ _STOP_TIMEOUT = 2
 
 POLL_PERIOD: float = 5
 
+# The minimum time between two polls of a chain, in seconds.
+MIN_POLL_PERIOD: float = 1
+
+# The time after which a chain is polled if its subscriptions delivered
+# nothing, in seconds. This guards against subscriptions that silently stall.
+SUBSCRIPTION_TIMEOUT: float = 60
+
+# The maximum number of concurrent eth_getLogs requests per chain while syncing.
+BACKFILL_WORKERS = 4
+
+# The minimum time between two snapshots of an event processor's state, in seconds.
+SNAPSHOT_PERIOD: float = 60
+
+# The maximum number of events that may wait for an event processor while
+# syncing. Event monitors hold back further events until the event processors
+# caught up, so that past events are not all in memory at once.
+SYNC_BACKLOG = 10_000
+
 
 _SyncDoneCallback = Callable[[], None]
 _NewEventsCallback = Callable[[list[Event]], None]
 
 
-def _wrap_thread_func(func: Callable) -> Callable:
-    def wrapper(*args, **kwargs):  # type: ignore
-        try:
-            return func(*args, **kwargs)
-        except Exception:
-            traceback.print_exception(*sys.exc_info())
-            os._exit(1)
-            # should never be reached
-            return None
+def find_finished_requests(events: Iterable[Event]) -> set[RequestId]:
+    """Return the IDs of the requests whose whole lifecycle is contained in
+    ``events``, i.e. that were created, whose deposit was withdrawn and whose
+    claims all had their stakes withdrawn. Nothing can happen to these
+    requests anymore."""
+    created: set[RequestId] = set()
+    withdrawn: set[RequestId] = set()
+    # The claims of each request whose stakes were not withdrawn yet.
+    open_claims: dict[RequestId, set[ClaimId]] = {}
+    for event in events:
+        if isinstance(event, RequestCreated):
+            created.add(event.request_id)
+        elif isinstance(event, DepositWithdrawn):
+            withdrawn.add(event.request_id)
+        elif isinstance(event, ClaimMade):
+            open_claims.setdefault(event.request_id, set()).add(event.claim_id)
+        elif isinstance(event, ClaimStakeWithdrawn):
+            open_claims.get(event.request_id, set()).discard(event.claim_id)
+
+    return {request_id for request_id in created & withdrawn if not open_claims.get(request_id)}
+
+
+class EventRouter:
+    """Delivers events to the event processors they are relevant for.
+
+    A single router is shared by the event monitors of all chains. Each event
+    is only passed to the event processor of its transfer direction. The
+    direction is taken from the event itself where possible, e.g. from
+    RequestCreated and RequestFilled, and otherwise looked up by the event's
+    request ID. Events of requests with an unknown direction are delivered to
+    all event processors they could be relevant for.
+    """
+
+    def __init__(self) -> None:
+        # This lock protects the following objects:
+        #   - self._event_processors
+        #   - self._directions
+        #   - self._dropped_requests
+        self._lock = threading.Lock()
+        self._event_processors: dict[TransferDirection, "EventProcessor"] = {}
+        self._directions: dict[RequestId, TransferDirection] = {}
+        # Requests dropped by drop_finished_requests, whose events are not
+        # delivered anymore. Only needed until all event processors synced.
+        self._dropped_requests: set[RequestId] = set()
+
+    def add_event_processor(self, event_processor: "EventProcessor") -> None:
+        context = event_processor.context
+        direction = TransferDirection(context.source_chain_id, context.target_chain_id)
+        with self._lock:
+            assert self._event_processors.get(direction, event_processor) is event_processor
+            self._event_processors[direction] = event_processor
+            # Requests restored from a snapshot will not see their
+            # RequestCreated event again.
+            for request in context.requests:
+                self._directions[request.id] = direction
+        context.requests.add_remove_listener(self._forget_request)
+
+    def _forget_request(self, request_id: RequestId) -> None:
+        # Events of removed requests are of no interest to any event
+        # processor anymore, so there is no need to keep their direction.
+        with self._lock:
+            self._directions.pop(request_id, None)
+
+    def route(self, events: list[Event]) -> None:
+        batches: dict[TransferDirection, list[Event]] = {}
+        with self._lock:
+            for event in events:
+                for direction in self._get_directions(event):
+                    batches.setdefault(direction, []).append(event)
+            event_processors = list(self._event_processors.values())
+            have_dropped_requests = bool(self._dropped_requests)
+
+        for direction, batch in batches.items():
+            self._event_processors[direction].add_events(batch)
+
+        # Once all past events were delivered, no more events of dropped
+        # requests can arrive.
+        if have_dropped_requests and all(
+            event_processor.synced for event_processor in event_processors
+        ):
+            with self._lock:
+                self._dropped_requests.clear()
+
+    def drop_finished_requests(self, events: list[Event]) -> list[Event]:
+        """Return ``events`` without the events of requests whose whole
+        lifecycle is contained in them, see :func:`find_finished_requests`.
+
+        Processing those events would only create requests and claims that
+        are removed again right away. Requests that are known already, e.g.
+        from a snapshot, are kept. The event processors are told to drop any
+        events of the dropped requests they get from other chains, e.g. fills.
+        """
+        finished = find_finished_requests(events)
+        if not finished:
+            return events
+
+        dropped: dict[TransferDirection, set[RequestId]] = {}
+        with self._lock:
+            for event in events:
+                if not isinstance(event, RequestCreated) or event.request_id not in finished:
+                    continue
+                if event.request_id in self._directions:
+                    finished.discard(event.request_id)
+                    continue
+                direction = TransferDirection(event.chain_id, event.target_chain_id)
+                dropped.setdefault(direction, set()).add(event.request_id)
+                self._dropped_requests.add(event.request_id)
+            event_processors = dict(self._event_processors)
+
+        for direction, request_ids in dropped.items():
+            event_processor = event_processors.get(direction)
+            if event_processor is not None:
+                event_processor.drop_requests(request_ids)
+        for request_id in finished:
+            beamer.agent.metrics.discard_request_trace(request_id)
+        return [event for event in events if getattr(event, "request_id", None) not in finished]
+
+    def wait_for_backlog(self, max_events: int, timeout: float) -> bool:
+        """Wait until none of the event processors has more than
+        ``max_events`` events waiting, see
+        :meth:`EventProcessor.wait_for_backlog`. Return False if that did not
+        happen within ``timeout`` seconds."""
+        with self._lock:
+            event_processors = list(self._event_processors.values())
+        deadline = time.monotonic() + timeout
+        return all(
+            event_processor.wait_for_backlog(max_events, max(0, deadline - time.monotonic()))
+            for event_processor in event_processors
+        )
+
+    def _get_directions(self, event: Event) -> list[TransferDirection]:
+        if getattr(event, "request_id", None) in self._dropped_requests:
+            return []
+        if isinstance(event, RequestCreated):
+            direction = TransferDirection(event.chain_id, event.target_chain_id)
+            self._directions[event.request_id] = direction
+        elif isinstance(event, RequestFilled):
+            direction = TransferDirection(event.source_chain_id, event.chain_id)
+        elif isinstance(event, FinalityPeriodUpdated):
+            direction = TransferDirection(event.chain_id, event.target_chain_id)
+        else:
+            request_id = getattr(event, "request_id", None)
+            known_direction = self._directions.get(request_id)  # type: ignore
+            if known_direction is None:
+                return [
+                    direction
+                    for direction in self._event_processors
+                    if _is_relevant(event, direction)
+                ]
+            direction = known_direction
+
+        if direction in self._event_processors and _is_relevant(event, direction):
+            return [direction]
+        return []
+
+
+def _is_relevant(event: Event, direction: TransferDirection) -> bool:
+    if isinstance(event, SourceChainEvent):
+        return event.chain_id == direction.source
+    if isinstance(event, TargetChainEvent):
+        return event.chain_id == direction.target
+    return event.chain_id in direction
+
+
+class _AdaptivePollPeriod:
+    """Computes the time until a chain should be polled again.
+
+    The chain's block time is estimated from the timestamps of the blocks
+    seen so far, and the next poll is scheduled for when the next block is
+    expected. If that block is not there yet, the chain is polled again with
+    an exponentially growing delay. The delay always stays between
+    ``min_period`` and ``max_period``.
+    """
+
+    def __init__(self, max_period: float, min_period: float = MIN_POLL_PERIOD):
+        self._max_period = max_period
+        self._min_period = min(min_period, max_period)
+        self._block_time: Optional[float] = None
+        self._last_block: Optional[BlockData] = None
+        self._num_misses = 0
+
+    def next(self, events: list[Event]) -> float:
+        """Return the delay until the next poll, given the events of the
+        current poll."""
+        block = None
+        for event in events:
+            if isinstance(event, LatestBlockUpdatedEvent):
+                block = event.block_data
+
+        if block is None:
+            self._num_misses += 1
+            delay = self._min_period * 2**self._num_misses
+        else:
+            self._num_misses = 0
+            self._update_block_time(block)
+            if self._block_time is None:
+                delay = self._max_period
+            else:
+                delay = block["timestamp"] + self._block_time - time.time()
+        return min(self._max_period, max(self._min_period, delay))
+
+    def _update_block_time(self, block: BlockData) -> None:
+        last_block = self._last_block
+        self._last_block = block
+        if last_block is None or block["number"] <= last_block["number"]:
+            return
 
-    return wrapper
+        num_blocks = block["number"] - last_block["number"]
+        block_time = (block["timestamp"] - last_block["timestamp"]) / num_blocks
+        if self._block_time is None:
+            self._block_time = block_time
+        else:
+            self._block_time = 0.8 * self._block_time + 0.2 * block_time
 
 
 class EventMonitor:
@@ -53,15 +290,30 @@ class EventMonitor:
         on_new_events: list[_NewEventsCallback],
         on_sync_done: list[_SyncDoneCallback],
         poll_period: float,
+        event_store: Optional[EventStore] = None,
+        event_router: Optional[EventRouter] = None,
+        ws_url: Optional[URL] = None,
     ):
         self._web3 = web3
         self._chain_id = ChainId(self._web3.eth.chain_id)
         self._contracts = contracts
         self._deployment_block = deployment_block
+        self._event_store = event_store
+        self._event_key = make_event_key(self._chain_id, (c.address for c in contracts))
+        self._block_timestamps = BlockTimestamps(web3, event_store)
         self._stop = False
         self._on_new_events = on_new_events
         self._on_sync_done = on_sync_done
-        self._poll_period = poll_period
+        self._event_router = EventRouter() if event_router is None else event_router
+        self._on_new_events.append(self._event_router.route)
+        self._poll_period = _AdaptivePollPeriod(poll_period)
+        self._subscription = None
+        if ws_url is not None:
+            self._subscription = SubscriptionListener(ws_url, [c.address for c in contracts])
+        # The block up to which events were fetched after the subscriptions
+        # were (re)established. None means that they still need to be fetched.
+        self._backfilled_block: Optional[BlockNumber] = None
+        self._last_notification_time = time.monotonic()
         self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
 
         for contract in contracts:
@@ -71,16 +323,18 @@ class EventMonitor:
 
     def start(self) -> None:
         self._thread = threading.Thread(
-            name=f"EventMonitor[cid={self._chain_id}]", target=_wrap_thread_func(self._thread_func)
+            name=f"EventMonitor[cid={self._chain_id}]", target=wrap_thread_func(self._thread_func)
         )
         self._thread.start()
 
     def stop(self) -> None:
         self._stop = True
+        if self._subscription is not None:
+            self._subscription.stop()
         self._thread.join(_STOP_TIMEOUT)
 
     def subscribe(self, event_processor: "EventProcessor") -> None:
-        self._on_new_events.append(event_processor.add_events)
+        self._event_router.add_event_processor(event_processor)
         self._on_sync_done.append(event_processor.mark_sync_done)
 
     def _thread_func(self) -> None:
@@ -88,21 +342,135 @@ class EventMonitor:
             "EventMonitor started",
             addresses=[c.address for c in self._contracts],
         )
-        fetcher = EventFetcher(self._web3, self._contracts, self._deployment_block)
+        start_block, stored_events = self._load_stored_events()
+        stored_events = self._drop_finished_requests(stored_events)
+        for start in range(0, len(stored_events), SYNC_BACKLOG):
+            end = start + SYNC_BACKLOG
+            self._deliver_past_events(stored_events[start:end])
+        del stored_events
+
+        fetcher = EventFetcher(
+            self._web3,
+            self._contracts,
+            start_block,
+            num_workers=BACKFILL_WORKERS,
+            resolve_timestamps=self._block_timestamps.resolve,
+        )
+        try:
+            self._run(fetcher)
+        finally:
+            fetcher.close()
+        self._log.info("EventMonitor stopped")
+
+    def _run(self, fetcher: EventFetcher) -> None:
         current_block = self._web3.eth.block_number
-        events = []
-        while fetcher.synced_block < current_block:
-            events.extend(fetcher.fetch())
-        if events:
-            self._call_on_new_events(events)
+        while fetcher.synced_block < current_block and not self._stop:
+            events = self._fetch(fetcher, max_events=SYNC_BACKLOG)
+            self._deliver_past_events(self._drop_finished_requests(events))
+        if self._stop:
+            return
         self._call_on_sync_done()
         self._log.info("Sync done")
+        if self._subscription is not None:
+            self._subscription.start()
         while not self._stop:
-            events = fetcher.fetch()
+            if self._subscription is not None and self._subscription.connected:
+                notifications = self._subscription.take(_STOP_TIMEOUT / 2)
+                if self._needs_fetch(notifications):
+                    events = self._fetch(fetcher)
+                    self._fetched(fetcher)
+                else:
+                    events = self._apply_notifications(fetcher, notifications)
+                if events:
+                    self._call_on_new_events(events)
+                continue
+
+            events = self._fetch(fetcher)
             if events:
                 self._call_on_new_events(events)
-            time.sleep(self._poll_period)
-        self._log.info("EventMonitor stopped")
+            time.sleep(self._poll_period.next(events))
+
+    def _load_stored_events(self) -> tuple[BlockNumber, list[Event]]:
+        """Return the block to start fetching events from and the stored
+        events preceding it."""
+        if self._event_store is None:
+            return self._deployment_block, []
+
+        checkpoint, events = self._event_store.load(self._event_key)
+        if checkpoint is None:
+            return self._deployment_block, []
+
+        self._log.info("Loaded stored events", checkpoint=checkpoint, num_events=len(events))
+        return max(self._deployment_block, BlockNumber(checkpoint + 1)), events
+
+    def _drop_finished_requests(self, events: list[Event]) -> list[Event]:
+        result = self._event_router.drop_finished_requests(events)
+        if len(result) < len(events):
+            self._log.debug(
+                "Dropped events of finished requests", num_events=len(events) - len(result)
+            )
+        return result
+
+    def _deliver_past_events(self, events: list[Event]) -> None:
+        """Deliver events fetched while syncing, once the event processors
+        are done with most of the events delivered before."""
+        if not events:
+            return
+        while not self._event_router.wait_for_backlog(SYNC_BACKLOG, _STOP_TIMEOUT / 2):
+            if self._stop:
+                return
+        self._call_on_new_events(events)
+
+    def _store_events(self, events: list[Event], synced_block: BlockNumber) -> None:
+        if self._event_store is not None:
+            self._event_store.update(self._event_key, events, synced_block)
+
+    def _fetch(self, fetcher: EventFetcher, max_events: Optional[int] = None) -> list[Event]:
+        events = fetcher.fetch(max_events)
+        self._store_events(events, fetcher.synced_block)
+        return events
+
+    def _needs_fetch(self, notifications: Optional[Notifications]) -> bool:
+        """Return whether events must be fetched via polling instead of
+        being taken from ``notifications``."""
+        if notifications is not None:
+            self._last_notification_time = time.monotonic()
+            if notifications.reconnected:
+                self._log.info("Subscriptions established, fetching missed events")
+                self._backfilled_block = None
+        elif time.monotonic() - self._last_notification_time > SUBSCRIPTION_TIMEOUT:
+            self._last_notification_time = time.monotonic()
+            return True
+        return self._backfilled_block is None
+
+    def _fetched(self, fetcher: EventFetcher) -> None:
+        # Notifications taken from now on only contain what happened after
+        # the fetch, except for logs of blocks that were fetched already.
+        if self._backfilled_block is None and fetcher.caught_up:
+            self._backfilled_block = fetcher.synced_block
+
+    def _apply_notifications(
+        self, fetcher: EventFetcher, notifications: Optional[Notifications]
+    ) -> list[Event]:
+        if notifications is None:
+            return []
+
+        assert self._backfilled_block is not None
+        latest_block = None
+        for block_data in notifications.heads:
+            self._block_timestamps.add(block_data["number"], block_data["timestamp"])
+            if latest_block is None or block_data["number"] > latest_block["number"]:
+                latest_block = block_data
+
+        # Logs of reorged blocks are not handled, as with polling.
+        logs = [
+            log
+            for log in notifications.logs
+            if log["blockNumber"] > self._backfilled_block and not log["removed"]
+        ]
+        events = fetcher.add_notifications(logs, latest_block)
+        self._store_events(events, fetcher.synced_block)
+        return events
 
     def _call_on_new_events(self, events: list[Event]) -> None:
         for on_new_events in self._on_new_events:
@@ -114,14 +482,25 @@ class EventMonitor:
 
 
 class EventProcessor:
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, event_store: Optional[EventStore] = None):
         # This lock protects the following objects:
         #   - self._events
+        #   - self._dropped_requests
+        #   - self._num_new_events
         #   - self._num_syncs_done
+        #   - self._synced_blocks
         self._lock = threading.Lock()
+        # Notified when new events are taken for processing.
+        self._events_taken = threading.Condition(self._lock)
         self._have_new_events = threading.Event()
         self._events: list[Event] = []
+        # The number of events added since they were last taken for processing.
+        self._num_new_events = 0
+        # Requests whose events are dropped, see drop_requests. Only needed
+        # until the sync is done.
+        self._dropped_requests: set[RequestId] = set()
         self._stop = False
+        self._thread: Optional[threading.Thread] = None
         # The number of times we synced with a chain:
         # 0 = we're still waiting for sync to complete for chains
         # 1 = one of the chains was synced, if there is only one chain, sync done.
@@ -129,13 +508,29 @@ class EventProcessor:
         self._num_syncs_done = 0
         self._context = context
         self._chain_ids = {self._context.source_chain_id, self._context.target_chain_id}
+        # The block number, per chain, up to which events were delivered to us.
+        self._synced_blocks: dict[ChainId, BlockNumber] = {}
+        # Events up to these block numbers are already reflected in the state
+        # restored from a snapshot and must be skipped.
+        self._restored_blocks: dict[ChainId, BlockNumber] = {}
+        self._event_store = event_store
+        self._snapshot_key = "%d:%d:%s:%s" % (
+            context.source_chain_id,
+            context.target_chain_id,
+            context.request_manager.address,
+            context.fill_manager.address,
+        )
+        self._last_snapshot_time = time.monotonic()
+        if event_store is not None:
+            self._restore_snapshot(event_store)
+        context.completions.add_listener(self._have_new_events.set)
 
     @property
     def context(self) -> Context:
         return self._context
 
     @property
-    def _synced(self) -> bool:
+    def synced(self) -> bool:
         with self._lock:
             return self._num_syncs_done == len(self._chain_ids)
 
@@ -143,156 +538,513 @@ class EventProcessor:
         with self._lock:
             assert self._num_syncs_done < len(self._chain_ids)
             self._num_syncs_done += 1
+        self._have_new_events.set()
 
     def start(self) -> None:
         self._thread = threading.Thread(
-            name="EventProcessor", target=_wrap_thread_func(self._thread_func)
+            name="EventProcessor", target=wrap_thread_func(self._thread_func)
         )
         self._thread.start()
 
     def stop(self) -> None:
         self._stop = True
-        self._thread.join(_STOP_TIMEOUT)
+        self._have_new_events.set()
+        if self._thread is not None:
+            self._thread.join(_STOP_TIMEOUT)
+            # Only store the final snapshot if the thread stopped, otherwise
+            # the state might still be changing.
+            if self._thread.is_alive():
+                return
+        if self.synced:
+            self._store_snapshot()
 
     def add_events(self, events: list[Event]) -> None:
         with self._lock:
-            self._events.extend(events)
+            for event in events:
+                if isinstance(event, LatestBlockUpdatedEvent):
+                    self._synced_blocks[event.chain_id] = event.block_data["number"]
+                elif isinstance(event, TxEvent):
+                    restored_block = self._restored_blocks.get(event.chain_id)
+                    if restored_block is not None and event.block_number <= restored_block:
+                        continue
+                    if getattr(event, "request_id", None) in self._dropped_requests:
+                        continue
+                self._events.append(event)
+                self._num_new_events += 1
             self._context.logger.debug("New events", events=events)
         self._have_new_events.set()
 
+    def drop_requests(self, request_ids: Iterable[RequestId]) -> None:
+        """Drop all events of the given requests, both those added already
+        and those added later. The requests must not be known to the
+        context."""
+        with self._lock:
+            self._dropped_requests.update(request_ids)
+
+    def wait_for_backlog(self, max_events: int, timeout: float) -> bool:
+        """Wait until at most ``max_events`` of the added events were not
+        taken for processing yet. Return False if that did not happen within
+        ``timeout`` seconds.
+
+        Events that could not be processed and wait for other events do not
+        count, as they only get processed after more events were added."""
+        with self._events_taken:
+            return self._events_taken.wait_for(lambda: self._num_new_events <= max_events, timeout)
+
+    def _restore_snapshot(self, event_store: EventStore) -> None:
+        data = event_store.load_snapshot(self._snapshot_key)
+        if data is None:
+            return
+
+        restored = restore_context(self._context, data)
+        if restored is None:
+            self._context.logger.info("Ignoring incompatible snapshot")
+            return
+
+        events, synced_blocks = restored
+        self._events.extend(events)
+        self._synced_blocks.update(synced_blocks)
+        self._restored_blocks.update(synced_blocks)
+        self._context.logger.info(
+            "Restored snapshot",
+            synced_blocks=synced_blocks,
+            num_requests=len(self._context.requests),
+            num_claims=len(self._context.claims),
+            num_events=len(events),
+        )
+
+    def _store_snapshot(self) -> None:
+        if self._event_store is None:
+            return
+
+        t1 = time.time()
+        with self._lock:
+            events = self._events[:]
+            synced_blocks = dict(self._synced_blocks)
+        data = snapshot_context(self._context, events, synced_blocks)
+        self._event_store.store_snapshot(self._snapshot_key, data)
+        self._last_snapshot_time = time.monotonic()
+        t2 = time.time()
+        self._context.logger.debug(
+            "Stored snapshot",
+            synced_blocks=synced_blocks,
+            duration=round((t2 - t1) * 1e3, 3),
+        )
+
     def _thread_func(self) -> None:
         self._context.logger.info("EventProcessor started")
 
-        # Wait until all past events are fetched and in the queue
-        # so the agent can sync to the current state
-        while not self._synced and not self._stop:
-            self._have_new_events.wait(POLL_PERIOD)
-            self._have_new_events.clear()
-
         while not self._stop:
-            if self._have_new_events.wait(POLL_PERIOD):
+            # While syncing, only new events need processing, see process().
+            timeout = self.seconds_until_due() if self.synced else POLL_PERIOD
+            if self._have_new_events.wait(timeout):
                 self._have_new_events.clear()
-            if self._events:
-                self._process_events()
-
-            process_requests(self._context)
-            process_claims(self._context)
+            self.process()
 
         self._context.logger.info("EventProcessor stopped")
 
+    def process(self) -> None:
+        """Process new events, then act upon the current requests and claims.
+
+        Past events are processed as they are delivered while syncing, but
+        requests and claims are only acted upon once all past events were
+        processed, so that no fills or claims are sent based on outdated
+        state."""
+        # Check this before taking the events, so that the events processed
+        # below include all past events if we are synced.
+        synced = self.synced
+        # Apply the outcomes of our transactions first, so that the state
+        # machines know which transactions are still pending.
+        self._context.completions.run_pending()
+        if self._events:
+            self._process_events()
+        if not synced:
+            return
+
+        # Only requests and claims whose inputs changed are evaluated.
+        due = self._context.schedule.take_due(time.time())
+        prefetch_calls(self._context, due)
+        process_requests(self._context, due)
+        process_claims(self._context, due)
+
+        if time.monotonic() - self._last_snapshot_time >= SNAPSHOT_PERIOD:
+            self._store_snapshot()
+
+    def seconds_until_due(self) -> float:
+        """Return the time until :meth:`process` needs to be called, unless
+        new events arrive before."""
+        timeout = self._context.schedule.seconds_until_due(time.time())
+        snapshot_timeout = self._last_snapshot_time + SNAPSHOT_PERIOD - time.monotonic()
+        return max(0, min(timeout, snapshot_timeout))
+
+    def _trace_request_created(self, event: RequestCreated) -> None:
+        # Requests seen while syncing were created long ago, and requests
+        # that were not added are of no interest to us.
+        if self.synced and event.request_id in self._context.requests:
+            beamer.agent.metrics.end_request_stage(event.request_id, "queue", time.time())
+        else:
+            beamer.agent.metrics.discard_request_trace(event.request_id)
+
     def _process_events(self) -> None:
-        iteration = 0
-        created_events: list[Event] = []
-        while True:
-            t1 = time.time()
-            with self._lock:
+        t1 = time.time()
+        with self._lock:
+            num_taken = len(self._events)
+            if self._dropped_requests:
+                events = [
+                    event
+                    for event in self._events
+                    if getattr(event, "request_id", None) not in self._dropped_requests
+                ]
+            else:
                 events = self._events[:]
-
-            unprocessed: list[Event] = []
-            any_state_changed = False
-            for event in events:
-                state_changed, new_events = process_event(event, self._context)
-                any_state_changed |= state_changed
-
-                if new_events:
-                    created_events.extend(new_events)
-                if not state_changed:
-                    unprocessed.append(event)
-
-            # Return the unprocessed events to the event list.
-            # Note that the event list might have been changed in the meantime
-            # by one of the event monitors. Placing unprocessed events at the
-            # back of the list, as opposed to the front, may avoid an extra
-            # iteration over all events.
-            with self._lock:
-                del self._events[: len(events)]
-                self._events.extend(unprocessed)
-
-            t2 = time.time()
-            self._context.logger.debug(
-                "Finished iteration",
-                iteration=iteration,
-                any_state_changed=any_state_changed,
-                num_events=len(self._events),
-                duration=round((t2 - t1) * 1e3, 3),
-            )
-            iteration += 1
-            if not any_state_changed:
-                break
-
-        # New events might be created by event handlers. If they would be
-        # processed directly, there would be a chance of skipping certain states
-        # in the request/claim state machines accidentally. So instead they are
-        # collected and attached to the events list after the current batch of
-        # events has been processed.
+            # All past events were added once we are synced, so the events of
+            # dropped requests were all skipped above.
+            if self._num_syncs_done == len(self._chain_ids):
+                self._dropped_requests.clear()
+            self._num_new_events = 0
+            self._events_taken.notify_all()
+
+        # Events that cannot be processed yet are parked under the request
+        # they belong to. They are only retried when another event of the
+        # same request changed the state, instead of retrying all of them
+        # until nothing changes anymore. Since state changes made by
+        # process_requests and process_claims can also unblock events, all
+        # parked events are retried again on the next call.
+        parked: dict[Hashable, list[tuple[int, Event]]] = {}
+        created_events: list[Event] = []
+        num_processed = 0
+
+        def process(index: int, event: Event) -> bool:
+            nonlocal num_processed
+            num_processed += 1
+            state_changed, new_events = process_event(event, self._context)
+            if new_events:
+                created_events.extend(new_events)
+            if state_changed and isinstance(event, RequestCreated):
+                self._trace_request_created(event)
+            key = _dependency_key(event, self._context)
+            if not state_changed:
+                parked.setdefault(key, []).append((index, event))
+            elif key is not None:
+                self._context.schedule.mark(key)
+            return state_changed
+
+        for index, event in enumerate(events):
+            if not process(index, event):
+                continue
+            key = _dependency_key(event, self._context)
+            any_state_changed = True
+            while any_state_changed and key in parked:
+                any_state_changed = False
+                for waiting_index, waiting_event in parked.pop(key):
+                    any_state_changed |= process(waiting_index, waiting_event)
+
+        # Return the unprocessed events to the event list, in their original
+        # order. Note that the event list might have been changed in the
+        # meantime by one of the event monitors. Placing unprocessed events at
+        # the back of the list, as opposed to the front, may avoid an extra
+        # iteration over all events.
+        unprocessed = [event for waiting in parked.values() for event in waiting]
+        unprocessed.sort(key=lambda waiting: waiting[0])
         with self._lock:
+            del self._events[:num_taken]
+            self._events.extend(event for _, event in unprocessed)
+
+            # New events might be created by event handlers. If they would be
+            # processed directly, there would be a chance of skipping certain
+            # states in the request/claim state machines accidentally. So
+            # instead they are collected and attached to the events list after
+            # the current batch of events has been processed.
             self._events.extend(created_events)
 
+        t2 = time.time()
+        self._context.logger.debug(
+            "Processed events",
+            num_events=len(events),
+            num_processed=num_processed,
+            num_unprocessed=len(unprocessed),
+            duration=round((t2 - t1) * 1e3, 3),
+        )
+
+
+def _dependency_key(event: Event, context: Context) -> Hashable:
+    """Return the key of the request an event belongs to, if any."""
+    request_id = getattr(event, "request_id", None)
+    if request_id is not None:
+        return request_id
+    claim_id = getattr(event, "claim_id", None)
+    if claim_id is not None:
+        claim = context.claims.get(claim_id)
+        return claim_id if claim is None else claim.request_id
+    return None
+
+
+def process_requests(context: Context, request_ids: Optional[Collection[Hashable]] = None) -> None:
+    """Act upon the requests with the given IDs, or all requests if
+    ``request_ids`` is None."""
+    if request_ids is None:
+        requests = list(context.requests)
+    else:
+        requests = [
+            request
+            for request in map(context.requests.get, request_ids)  # type: ignore
+            if request is not None
+        ]
 
-def process_requests(context: Context) -> None:
     to_remove = []
-    for request in context.requests:
+    for request in requests:
+        if request.transaction_pending:
+            continue
+
+        state = request.current_state
         if request.is_pending:
             fill_request(request, context)
+            if request.is_pending and not request.transaction_pending:
+                # The balance, allowance and expiry depend on the target
+                # chain's state, and filling becomes unsafe at some point.
+                context.schedule.wake_on_block(request.target_chain_id, request.id)
+                unsafe_time = request.valid_until - context.config.unsafe_fill_time
+                context.schedule.wake_at(unsafe_time, request.id)
 
         elif request.is_filled:
             claim_request(request, context)
+            if (
+                request.is_filled
+                and not request.transaction_pending
+                and request.filler == context.address
+            ):
+                context.schedule.wake_on_block(request.source_chain_id, request.id)
 
         elif request.is_withdrawn or request.is_ignored:
-            active_claims = any(claim.request_id == request.id for claim in context.claims)
-            if not active_claims:
+            if not context.claims.has_claims(request.id):
                 context.logger.debug("Removing request", request=request)
                 to_remove.append(request.id)
 
+        if request.current_state != state:
+            context.schedule.mark(request.id)
+
     for request_id in to_remove:
         context.requests.remove(request_id)
 
 
-def process_claims(context: Context) -> None:
+def process_claims(context: Context, request_ids: Optional[Collection[Hashable]] = None) -> None:
+    """Act upon the claims of the requests with the given IDs, or all claims
+    if ``request_ids`` is None."""
+    if request_ids is None:
+        claims = list(context.claims)
+    else:
+        claims = [
+            claim
+            for request_id in request_ids
+            for claim in context.claims.for_request(request_id)  # type: ignore
+        ]
+
     to_remove = []
-    for claim in context.claims:
+    for claim in claims:
         request = context.requests.get(claim.request_id)
         # As per definition an invalid or expired request cannot be claimed
         # This gives us a chronological order. The agent should never garbage collect
         # a request which has active claims
         assert request is not None, "Active claim for non-existent request"
 
-        if claim.is_ignored:
-            continue
+        state = claim.current_state
+        if _process_claim(claim, request, context):
+            to_remove.append(claim.id)
+            # The request may be removable now.
+            context.schedule.mark(request.id)
+        elif claim.current_state != state:
+            context.schedule.mark(request.id)
+        elif not claim.is_ignored and not claim.transaction_pending:
+            # Withdrawing and challenging depend on the claim's termination
+            # and the challenge back off.
+            context.schedule.wake_on_block(request.source_chain_id, request.id, claim.termination)
+            if claim.challenge_back_off_timestamp > time.time():
+                context.schedule.wake_at(claim.challenge_back_off_timestamp, request.id)
+            if request.is_l1_resolved or claim.is_invalidated_l1_resolved:
+                context.schedule.wake_on_block(request.source_chain_id, request.id)
 
-        if claim.is_started:
-            # If the claim is not valid, we might need to send a non-fill-proof
-            if not claim.valid_claim_for_request(request):
-                maybe_invalidate(claim, context)
-            else:
-                claim.start_challenge()
+    for claim_id in to_remove:
+        context.claims.remove(claim_id)
 
-            continue
 
-        if claim.is_withdrawn:
-            context.logger.debug("Removing withdrawn claim", claim=claim)
-            to_remove.append(claim.id)
-            continue
+def _process_claim(claim: Claim, request: Request, context: Context) -> bool:
+    """Act upon a single claim. Return whether the claim can be removed."""
+    if claim.is_ignored:
+        return False
 
-        if claim.is_invalidated_l1_resolved:
-            maybe_withdraw(claim, context)
-            continue
+    if claim.is_started:
+        # If the claim is not valid, we might need to send a non-fill-proof
+        if not claim.valid_claim_for_request(request):
+            maybe_invalidate(claim, context)
+        else:
+            claim.start_challenge()
 
-        # Check if claim is an honest claim. Honest claims can be ignored.
-        # This only counts for claims, where the agent is not the filler
-        if claim.valid_claim_for_request(request) and request.filler != context.address:
-            claim.ignore()
-            continue
+        return False
+
+    if claim.is_withdrawn:
+        context.logger.debug("Removing withdrawn claim", claim=claim)
+        return True
+
+    if claim.is_invalidated_l1_resolved:
+        maybe_withdraw(claim, context)
+        return False
+
+    # Check if claim is an honest claim. Honest claims can be ignored.
+    # This only counts for claims, where the agent is not the filler
+    if claim.valid_claim_for_request(request) and request.filler != context.address:
+        claim.ignore()
+        return False
+
+    if claim.transaction_pending:
+        return False
+
+    if claim.is_claimer_winning or claim.is_challenger_winning:
+        maybe_withdraw(claim, context)
+        maybe_challenge(claim, context)
+
+    return False
 
-        if claim.transaction_pending:
+
+def prefetch_calls(context: Context, request_ids: Optional[Collection[Hashable]] = None) -> None:
+    """Fetch the results of the view calls needed to act upon the requests
+    with the given IDs, or all requests if ``request_ids`` is None, and their
+    claims, see :func:`process_requests` and :func:`process_claims`.
+
+    The calls of all requests are sent together, in one request per chain,
+    instead of one by one as the requests are processed."""
+    if request_ids is None:
+        requests = list(context.requests)
+    else:
+        requests = [
+            request
+            for request in map(context.requests.get, request_ids)  # type: ignore
+            if request is not None
+        ]
+
+    calls: dict[ChainId, list[ContractFunction]] = {}
+    for request in requests:
+        if request.transaction_pending:
             continue
+        if request.is_pending:
+            calls.setdefault(request.target_chain_id, []).extend(_fill_calls(request, context))
+        claiming = request.is_filled and request.filler == context.address
+        if claiming or context.claims.has_claims(request.id):
+            calls.setdefault(request.source_chain_id, []).append(
+                context.request_manager.functions.claimStake()
+            )
 
-        if claim.is_claimer_winning or claim.is_challenger_winning:
-            maybe_withdraw(claim, context)
-            maybe_challenge(claim, context)
+    for chain_id, functions in calls.items():
+        block = context.latest_blocks.get(chain_id)
+        if block is not None:
+            _get_aggregator(context, chain_id, functions[0].web3).prefetch(
+                functions, block["number"]
+            )
 
-    for claim_id in to_remove:
-        context.claims.remove(claim_id)
+
+def _get_aggregator(context: Context, chain_id: ChainId, w3: Web3) -> CallAggregator:
+    aggregator = context.call_aggregators.get(chain_id)
+    if aggregator is None:
+        aggregator = CallAggregator(w3)
+        context.call_aggregators[chain_id] = aggregator
+    return aggregator
+
+
+def _aggregate_calls(
+    context: Context, chain_id: ChainId, functions: list[ContractFunction]
+) -> list[Any]:
+    """Call the view functions, all on the chain with ``chain_id``, together.
+    Results are reused until the latest block of that chain changes."""
+    aggregator = _get_aggregator(context, chain_id, functions[0].web3)
+    block_number = context.latest_blocks[chain_id]["number"]
+    return aggregator.call(functions, block_number)
+
+
+def _invalidate_calls(context: Context, chain_id: ChainId) -> None:
+    aggregator = context.call_aggregators.get(chain_id)
+    if aggregator is not None:
+        aggregator.invalidate()
+
+
+def _transact(context: Context, chain_id: ChainId, func: ContractFunction, **kwargs: Any) -> Any:
+    """Send a transaction and wait for its receipt."""
+    manager = context.transaction_managers.get(chain_id)
+    if manager is None:
+        return transact(func, **kwargs)
+    return manager.transact(func, **kwargs)
+
+
+def _submit(
+    context: Context,
+    chain_id: ChainId,
+    func: ContractFunction,
+    request_id: RequestId,
+    on_success: Callable[[TxReceipt], None],
+    on_failure: Callable[[TransactionFailed], None],
+    **kwargs: Any,
+) -> None:
+    """Send a transaction without waiting for its receipt.
+
+    Once the transaction is mined, either ``on_success`` or ``on_failure`` is
+    called by the event processor, so they may modify the context, and the
+    request with ``request_id`` is evaluated again. If the chain has no
+    transaction manager, the transaction is sent with
+    :func:`~beamer.agent.util.transact` and the callbacks are called directly.
+    """
+    manager = context.transaction_managers.get(chain_id)
+    if manager is None:
+        try:
+            receipt = transact(func, **kwargs)
+        except TransactionFailed as exc:
+            on_failure(exc)
+        else:
+            on_success(receipt)
+        return
+
+    def succeeded(receipt: TxReceipt) -> None:
+        on_success(receipt)
+        context.schedule.mark(request_id)
+
+    def failed(exc: TransactionFailed) -> None:
+        on_failure(exc)
+        # Do not retry right away, the transaction would likely fail again.
+        context.schedule.wake_on_block(chain_id, request_id)
+
+    def on_done(receipt: Optional[TxReceipt], exc: Optional[TransactionFailed]) -> None:
+        if exc is None:
+            assert receipt is not None
+            context.completions.put(functools.partial(succeeded, receipt))
+        else:
+            context.completions.put(functools.partial(failed, exc))
+
+    try:
+        manager.submit(func, on_done, **kwargs)
+    except TransactionFailed as exc:
+        on_failure(exc)
+
+
+def _token_symbol(token: Contract) -> str:
+    """Return the token's symbol for logging, or its address if it has none."""
+    try:
+        return token.functions.symbol().call()
+    except Exception:  # pylint:disable=broad-except
+        # The symbol is optional in ERC20 and some tokens return bytes32.
+        return token.address
+
+
+def _target_token(request: Request, context: Context) -> Contract:
+    w3 = context.fill_manager.web3
+    return w3.eth.contract(abi=_ERC20_ABI, address=request.target_token_address)
+
+
+def _fill_calls(request: Request, context: Context) -> list[ContractFunction]:
+    """Return the view calls that :func:`fill_request` makes: our balance and
+    the fill manager's allowance of the requested token."""
+    token = _target_token(request, context)
+    address = context.fill_manager.web3.eth.default_account
+    return [
+        token.functions.balanceOf(address),
+        token.functions.allowance(context.address, context.fill_manager.address),
+    ]
 
 
 def fill_request(request: Request, context: Context) -> None:
@@ -308,10 +1060,10 @@ def fill_request(request: Request, context: Context) -> None:
         request.ignore()
         return
 
-    w3 = context.fill_manager.web3
-    token = w3.eth.contract(abi=_ERC20_ABI, address=request.target_token_address)
-    address = w3.eth.default_account
-    balance = token.functions.balanceOf(address).call()
+    token = _target_token(request, context)
+    balance, current_allowance = _aggregate_calls(
+        context, request.target_chain_id, _fill_calls(request, context)
+    )
     if balance < request.amount:
         context.logger.info(
             "Unable to fill request", balance=balance, request_amount=request.amount
@@ -331,16 +1083,16 @@ def fill_request(request: Request, context: Context) -> None:
         )
         return
 
-    if (
-        token.functions.allowance(context.address, context.fill_manager.address).call()
-        < request.amount
-    ):
+    if current_allowance < request.amount:
+        # The fill's gas estimation needs the allowance, so wait for the approval.
         func = token.functions.approve(context.fill_manager.address, allowance)
         try:
-            transact(func)
+            _transact(context, request.target_chain_id, func)
         except TransactionFailed as exc:
             context.logger.error("approve failed", request_id=request.id, exc=exc)
             return
+        finally:
+            _invalidate_calls(context, request.target_chain_id)
 
     func = context.fill_manager.functions.fillRequest(
         sourceChainId=request.source_chain_id,
@@ -349,19 +1101,31 @@ def fill_request(request: Request, context: Context) -> None:
         amount=request.amount,
         nonce=request.nonce,
     )
-    try:
-        receipt = transact(func)
-    except TransactionFailed as exc:
+
+    def on_success(receipt: TxReceipt) -> None:
+        beamer.agent.metrics.end_request_stage(request.id, "receipt", time.time())
+        request.transaction_pending = False
+        # The fill changed our token balance.
+        _invalidate_calls(context, request.target_chain_id)
+        # Our RequestFilled event may have been processed already.
+        if request.is_pending:
+            request.try_to_fill()
+        context.logger.info(
+            "Filled request",
+            request=request,
+            txn_hash=receipt["transactionHash"].hex(),
+            token=_token_symbol(token),
+        )
+
+    def on_failure(exc: TransactionFailed) -> None:
+        beamer.agent.metrics.discard_request_trace(request.id)
+        request.transaction_pending = False
+        _invalidate_calls(context, request.target_chain_id)
         context.logger.error("fillRequest failed", request_id=request.id, exc=exc)
-        return
 
-    request.try_to_fill()
-    context.logger.info(
-        "Filled request",
-        request=request,
-        txn_hash=receipt.transactionHash.hex(),
-        token=token.functions.symbol().call(),
-    )
+    beamer.agent.metrics.end_request_stage(request.id, "checks", time.time())
+    request.transaction_pending = True
+    _submit(context, request.target_chain_id, func, request.id, on_success, on_failure)
 
 
 def claim_request(request: Request, context: Context) -> None:
@@ -374,12 +1138,25 @@ def claim_request(request: Request, context: Context) -> None:
         request.ignore()
         return
 
-    stake = context.request_manager.functions.claimStake().call()
+    (stake,) = _aggregate_calls(
+        context, request.source_chain_id, [context.request_manager.functions.claimStake()]
+    )
 
     func = context.request_manager.functions.claimRequest(request.id, request.fill_id)
-    try:
-        receipt = transact(func, value=stake)
-    except TransactionFailed as exc:
+
+    def on_success(receipt: TxReceipt) -> None:
+        request.transaction_pending = False
+        # Our ClaimMade event may have been processed already.
+        if request.is_filled:
+            request.try_to_claim()
+        context.logger.info(
+            "Claimed request",
+            request=request,
+            txn_hash=receipt["transactionHash"].hex(),
+        )
+
+    def on_failure(exc: TransactionFailed) -> None:
+        request.transaction_pending = False
         context.logger.error(
             "claimRequest failed",
             request_id=request.id,
@@ -387,13 +1164,10 @@ def claim_request(request: Request, context: Context) -> None:
             exc=exc,
             stake=stake,
         )
-        return
 
-    request.try_to_claim()
-    context.logger.info(
-        "Claimed request",
-        request=request,
-        txn_hash=receipt.transactionHash.hex(),
+    request.transaction_pending = True
+    _submit(
+        context, request.source_chain_id, func, request.id, on_success, on_failure, value=stake
     )
 
 
@@ -429,7 +1203,9 @@ def maybe_challenge(claim: Claim, context: Context) -> bool:
         if request.filler is not None and claim.latest_claim_made.challenger_stake_total > 0:
             return False
 
-    initial_claim_stake = context.request_manager.functions.claimStake().call()
+    (initial_claim_stake,) = _aggregate_calls(
+        context, request.source_chain_id, [context.request_manager.functions.claimStake()]
+    )
     stake = claim.get_minimum_challenge_stake(initial_claim_stake)
 
     # TODO: have a central variable and proper L1 cost calculations
@@ -439,21 +1215,23 @@ def maybe_challenge(claim: Claim, context: Context) -> bool:
         stake = max(stake, Wei(l1_cost - own_challenge_stake))
 
     func = context.request_manager.functions.challengeClaim(claim.id)
-    try:
-        receipt = transact(func, value=stake)
-    except TransactionFailed as exc:
+
+    def on_success(receipt: TxReceipt) -> None:
+        context.logger.info(
+            "Challenged claim",
+            claim=claim,
+            txn_hash=receipt["transactionHash"].hex(),
+        )
+
+    def on_failure(exc: TransactionFailed) -> None:
+        claim.transaction_pending = False
         context.logger.error("challengeClaim failed", claim=claim, exc=exc, stake=stake)
-        return False
 
     claim.transaction_pending = True
-
-    context.logger.info(
-        "Challenged claim",
-        claim=claim,
-        txn_hash=receipt.transactionHash.hex(),
+    _submit(
+        context, request.source_chain_id, func, request.id, on_success, on_failure, value=stake
     )
-
-    return True
+    return claim.transaction_pending
 
 
 def maybe_invalidate(claim: Claim, context: Context) -> None:
@@ -511,37 +1289,43 @@ def maybe_withdraw(claim: Claim, context: Context) -> None:
 
 
 def _withdraw(claim: Claim, context: Context) -> None:
+    # Do not send another withdrawal while one is not mined yet.
+    if claim.transaction_pending:
+        return
+
     func = context.request_manager.functions.withdraw(claim.id)
-    try:
-        receipt = transact(func)
-    except TransactionFailed as exc:
+
+    def on_success(receipt: TxReceipt) -> None:
+        context.logger.info("Withdrew", claim=claim.id, txn_hash=receipt["transactionHash"].hex())
+
+    def on_failure(exc: TransactionFailed) -> None:
         # Ignore the exception when the claim has been withdrawn already
         if "Claim already withdrawn" in str(exc):
-            claim.transaction_pending = True
             context.logger.warning("Claim already withdrawn", claim=claim)
             return
 
+        claim.transaction_pending = False
         context.logger.error("Withdraw failed", claim=claim, exc=exc)
-        return
 
     claim.transaction_pending = True
-    context.logger.info("Withdrew", claim=claim.id, txn_hash=receipt.transactionHash.hex())
+    _submit(context, context.source_chain_id, func, claim.request_id, on_success, on_failure)
 
 
 def _invalidate(request: Request, claim: Claim, context: Context) -> None:
     func = context.fill_manager.functions.invalidateFill(
         request.id, claim.latest_claim_made.fill_id, request.source_chain_id
     )
-    try:
-        receipt = transact(func)
-    except TransactionFailed as exc:
+
+    def on_success(receipt: TxReceipt) -> None:
+        context.logger.info(
+            "Invalidated fill",
+            request=request.id,
+            fill_id=request.fill_id,
+            claim=claim.id,
+            txn_hash=receipt["transactionHash"].hex(),
+        )
+
+    def on_failure(exc: TransactionFailed) -> None:
         context.logger.error("Calling invalidateFill failed", claim=claim, exc=exc)
-        return
 
-    context.logger.info(
-        "Invalidated fill",
-        request=request.id,
-        fill_id=request.fill_id,
-        claim=claim.id,
-        txn_hash=receipt.transactionHash.hex(),
-    )
+    _submit(context, request.target_chain_id, func, request.id, on_success, on_failure)
@@ -46,6 +46,12 @@ def _sigint_handler(agent: Agent) -> None:
     metavar="DIR",
     help="The directory containing contract deployment files.",
 )
+@click.option(
+    "--data-dir",
+    type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+    metavar="DIR",
+    help="The directory where the agent stores fetched events. Optional.",
+)
 @click.option(
     "--fill-wait-time",
     type=int,
@@ -62,6 +68,17 @@ def _sigint_handler(agent: Agent) -> None:
     type=click.Choice(("debug", "info", "warning", "error", "critical")),
     help="The log level. Default: info",
 )
+@click.option(
+    "--engine",
+    type=click.Choice(("threads", "asyncio")),
+    help="How to run event monitoring and processing. Default: threads",
+)
+@click.option(
+    "--rpc-cache-size",
+    type=int,
+    metavar="ENTRIES",
+    help="The maximum number of RPC responses cached per chain. Default: 10000",
+)
 @click.option(
     "--metrics-prometheus-port",
     type=int,
@@ -70,6 +87,12 @@ def _sigint_handler(agent: Agent) -> None:
     show_default=True,
     help="Provide Prometheus metrics on PORT.",
 )
+@click.option(
+    "--metrics-trace-spans",
+    is_flag=True,
+    default=None,
+    help="Log how long requests spend in each stage until they are filled.",
+)
 @click.option(
     "--chain",
     type=str,
@@ -89,12 +112,16 @@ def agent(
     account_path: Optional[Path],
     account_password: Optional[str],
     deployment_dir: Optional[Path],
+    data_dir: Optional[Path],
     fill_wait_time: Optional[int],
     log_level: Optional[str],
+    engine: Optional[str],
+    rpc_cache_size: Optional[int],
     chain: tuple[str],
     source_chain: Optional[str],
     target_chain: Optional[str],
     metrics_prometheus_port: Optional[int],
+    metrics_trace_spans: Optional[bool],
     unsafe_fill_time: Optional[int],
 ) -> None:
     """Start Beamer Bridge Agent"""
@@ -107,8 +134,12 @@ def agent(
     options = {
         "fill-wait-time": fill_wait_time,
         "log-level": log_level,
+        "engine": engine,
+        "rpc-cache-size": rpc_cache_size,
         "deployment-dir": deployment_dir,
+        "data-dir": data_dir,
         "metrics.prometheus-port": metrics_prometheus_port,
+        "metrics.trace-spans": metrics_trace_spans,
         "source-chain": source_chain,
         "target-chain": target_chain,
         "account.path": account_path,
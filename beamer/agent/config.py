@@ -1,6 +1,6 @@
 import copy
 import itertools
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Optional
 
@@ -8,6 +8,7 @@ import toml
 from eth_account.signers.local import LocalAccount
 
 from beamer.agent.contracts import DeploymentInfo, load_deployment_info
+from beamer.agent.rpc_cache import DEFAULT_MAX_ENTRIES
 from beamer.agent.typing import URL
 from beamer.agent.util import TokenChecker, account_from_keyfile
 
@@ -26,6 +27,13 @@ class Config:
     unsafe_fill_time: int
     prometheus_metrics_port: Optional[int]
     log_level: str
+    data_dir: Optional[Path] = None
+    engine: str = "threads"
+    ws_urls: dict[str, URL] = field(default_factory=dict)
+    # Further RPC URLs per chain, in addition to the ones in rpc_urls.
+    backup_rpc_urls: dict[str, list[URL]] = field(default_factory=dict)
+    rpc_cache_size: int = DEFAULT_MAX_ENTRIES
+    trace_spans: bool = False
 
 
 def _set_value(config: dict[str, Any], key: str, value: Any) -> None:
@@ -79,9 +87,11 @@ def _default_config() -> dict:
         "fill-wait-time": 120,
         "unsafe-fill-time": 600,
         "log-level": "info",
+        "engine": "threads",
+        "rpc-cache-size": DEFAULT_MAX_ENTRIES,
         "account": {},
         "rpc_urls": {},
-        "metrics": {},
+        "metrics": {"trace-spans": False},
         "tokens": {},
     }
 
@@ -110,9 +120,20 @@ def load(config_path: Path, options: dict[str, Any]) -> Config:
         raise ConfigError(f"missing settings: {missing}")
 
     rpc_urls = {}
+    ws_urls = {}
+    backup_rpc_urls = {}
 
     for chain_name, chain_info in config["chains"].items():
-        rpc_urls[chain_name] = URL(chain_info["rpc-url"])
+        rpc_url = chain_info["rpc-url"]
+        if isinstance(rpc_url, list):
+            if not rpc_url:
+                raise ConfigError(f"no RPC URL for chain {chain_name}")
+            rpc_url, *backup_urls = rpc_url
+            if backup_urls:
+                backup_rpc_urls[chain_name] = [URL(url) for url in backup_urls]
+        rpc_urls[chain_name] = URL(rpc_url)
+        if "ws-url" in chain_info:
+            ws_urls[chain_name] = URL(chain_info["ws-url"])
 
     path = Path(_get_value(config, "account.path"))
     password = _get_value(config, "account.password")
@@ -121,6 +142,10 @@ def load(config_path: Path, options: dict[str, Any]) -> Config:
     deployment_info = load_deployment_info(Path(config["deployment-dir"]))
     token_checker = TokenChecker(list(config["tokens"].values()))
 
+    data_dir = _lookup_value(config, "data-dir")
+    if data_dir is not None:
+        data_dir = Path(data_dir)
+
     return Config(
         account=account,
         deployment_info=deployment_info,
@@ -129,5 +154,11 @@ def load(config_path: Path, options: dict[str, Any]) -> Config:
         fill_wait_time=config["fill-wait-time"],
         unsafe_fill_time=config["unsafe-fill-time"],
         prometheus_metrics_port=_lookup_value(config, "metrics.prometheus-port"),
+        trace_spans=_get_value(config, "metrics.trace-spans"),
         log_level=_get_value(config, "log-level"),
+        data_dir=data_dir,
+        engine=_get_value(config, "engine"),
+        ws_urls=ws_urls,
+        backup_rpc_urls=backup_rpc_urls,
+        rpc_cache_size=_get_value(config, "rpc-cache-size"),
     )
@@ -1,16 +1,30 @@
+import functools
+import sys
 import time
-from dataclasses import dataclass
-from typing import Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterable, Optional, cast
 
 import requests.exceptions
 import structlog
 from eth_abi.codec import ABICodec
+from eth_utils import to_checksum_address
 from eth_utils.abi import event_abi_to_log_topic
 from hexbytes import HexBytes
 from web3 import HTTPProvider, Web3
-from web3.contract import Contract, get_event_data
-from web3.types import ABIEvent, BlockData, ChecksumAddress, FilterParams, LogReceipt, Wei
+from web3.contract import Contract
+from web3.exceptions import MismatchedABI
+from web3.types import (
+    ABIEvent,
+    BlockData,
+    ChecksumAddress,
+    FilterParams,
+    LogReceipt,
+    Timestamp,
+    Wei,
+)
 
+import beamer.agent.metrics
 from beamer.agent.typing import (
     BlockNumber,
     ChainId,
@@ -23,22 +37,22 @@ from beamer.agent.typing import (
 )
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Event:
     chain_id: ChainId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SourceChainEvent(Event):
     pass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TargetChainEvent(Event):
     pass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LatestBlockUpdatedEvent(Event):
     block_data: BlockData
 
@@ -49,35 +63,35 @@ class LatestBlockUpdatedEvent(Event):
         return f"<LatestBlockUpdatedEvent chain_id={chain_id} block_number={number} hash={hash_}>"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class InitiateL1ResolutionEvent(Event):
     request_id: RequestId
     claim_id: ClaimId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class InitiateL1InvalidationEvent(Event):
     claim_id: ClaimId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TxEvent(Event):
     block_number: BlockNumber
     tx_hash: HexBytes
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FinalityPeriodUpdated(TxEvent, SourceChainEvent):
     target_chain_id: ChainId
     finality_period: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RequestEvent(TxEvent):
     request_id: RequestId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RequestCreated(RequestEvent, SourceChainEvent):
     target_chain_id: ChainId
     source_token_address: ChecksumAddress
@@ -87,28 +101,30 @@ class RequestCreated(RequestEvent, SourceChainEvent):
     amount: TokenAmount
     nonce: Nonce
     valid_until: Termination
+    block_timestamp: Optional[Timestamp] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RequestFilled(RequestEvent, TargetChainEvent):
     fill_id: FillId
     source_chain_id: ChainId
     target_token_address: ChecksumAddress
     filler: ChecksumAddress
     amount: TokenAmount
+    block_timestamp: Optional[Timestamp] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DepositWithdrawn(RequestEvent, SourceChainEvent):
     receiver: ChecksumAddress
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ClaimEvent(TxEvent):
     claim_id: ClaimId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ClaimMade(ClaimEvent, SourceChainEvent):
     request_id: RequestId
     fill_id: FillId
@@ -119,29 +135,30 @@ class ClaimMade(ClaimEvent, SourceChainEvent):
     termination: Termination
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ClaimStakeWithdrawn(ClaimEvent, SourceChainEvent):
     request_id: RequestId
     stake_recipient: ChecksumAddress
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RequestResolved(TxEvent, SourceChainEvent):
     request_id: RequestId
     filler: ChecksumAddress
     fill_id: FillId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FillInvalidatedResolved(TxEvent, SourceChainEvent):
     request_id: RequestId
     fill_id: FillId
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FillInvalidated(TxEvent, TargetChainEvent):
     request_id: RequestId
     fill_id: FillId
+    block_timestamp: Optional[Timestamp] = None
 
 
 def _camel_to_snake(s: str) -> str:
@@ -160,58 +177,164 @@ _EVENT_TYPES = dict(
     FinalityPeriodUpdated=FinalityPeriodUpdated,
 )
 
+# Event fields whose values are wrapped in a type of their own.
+_FIELD_TYPES: dict[str, Callable[[Any], Any]] = dict(request_id=RequestId, fill_id=FillId)
 
-def _make_topics_abi_mapping_for_contracts(contracts: Iterable[Contract]) -> dict[bytes, ABIEvent]:
-    result = {}
-    for contract in contracts:
-        result.update(_make_topics_to_abi(contract))
+# Decodes a single ABI encoded 32-byte word.
+_WordDecoder = Callable[[bytes], Any]
 
-    return result
 
+def _decode_uint(word: bytes) -> int:
+    return int.from_bytes(word, "big")
 
-def _make_topics_to_abi(contract: Contract) -> dict[bytes, ABIEvent]:
-    event_abis = {}
-    for abi in contract.abi:
-        if abi["type"] == "event":
-            event_abis[event_abi_to_log_topic(abi)] = abi  # type: ignore
-    return event_abis
 
+def _decode_int(word: bytes) -> int:
+    return int.from_bytes(word, "big", signed=True)
 
-def _convert_bytes(kwargs: dict) -> None:
-    for name, type_ in (
-        ("fill_id", FillId),
-        ("request_id", RequestId),
-    ):
-        value = kwargs.get(name)
-        if value is not None:
-            kwargs[name] = type_(value)
-
-
-def _decode_event(
-    codec: ABICodec, log_entry: LogReceipt, chain_id: ChainId, event_abis: dict[bytes, ABIEvent]
-) -> Optional[Event]:
-    topic = log_entry["topics"][0]
-    event_abi = event_abis[topic]
-    data = get_event_data(abi_codec=codec, event_abi=event_abi, log_entry=log_entry)
-    if data.event in _EVENT_TYPES:
-        kwargs = {_camel_to_snake(name): value for name, value in data.args.items()}
-        kwargs["chain_id"] = chain_id
-        kwargs["block_number"] = log_entry["blockNumber"]
-        kwargs["tx_hash"] = log_entry["transactionHash"]
-        _convert_bytes(kwargs)
-        return _EVENT_TYPES[data.event](**kwargs)
+
+def _decode_bool(word: bytes) -> bool:
+    return word[-1] != 0
+
+
+# The same few addresses show up in most logs, so computing their checksum
+# once is enough. The strings are interned, so that all events share them,
+# even those decoded after an address fell out of the cache.
+@functools.lru_cache(maxsize=4096)
+def _decode_address(word: bytes) -> ChecksumAddress:
+    return cast(ChecksumAddress, sys.intern(to_checksum_address(word[12:])))
+
+
+def _word_decoder(abi_type: str) -> Optional[_WordDecoder]:
+    """Return a decoder for values of ``abi_type``, if they are encoded as
+    a single word."""
+    if abi_type.startswith("uint"):
+        return _decode_uint
+    if abi_type.startswith("int"):
+        return _decode_int
+    if abi_type == "address":
+        return _decode_address
+    if abi_type == "bool":
+        return _decode_bool
+    if abi_type == "bytes32":
+        return bytes
     return None
 
 
-def _decode_events(
-    logs: list[LogReceipt], codec: ABICodec, chain_id: ChainId, event_abis: dict[bytes, ABIEvent]
-) -> list[Event]:
-    events = []
-    for entry in logs:
-        event = _decode_event(codec, entry, chain_id, event_abis)
-        if event is not None:
-            events.append(event)
-    return events
+def _with_field_type(name: str, decode: _WordDecoder) -> _WordDecoder:
+    field_type = _FIELD_TYPES.get(name)
+    if field_type is None:
+        return decode
+    convert = field_type
+    return lambda word: convert(decode(word))
+
+
+@dataclass(frozen=True)
+class _CompiledEvent:
+    event_type: type[Event]
+    num_topics: int
+    # Indexed arguments, as (field name, topic index, decoder).
+    topic_fields: tuple[tuple[str, int, _WordDecoder], ...]
+    # The other arguments, as (field name, offset in data, decoder).
+    data_fields: tuple[tuple[str, int, _WordDecoder], ...]
+    # The types of the other arguments, if they cannot be decoded word by
+    # word. The data is then decoded by the codec, and the offsets in
+    # data_fields are indexes into its result instead.
+    data_types: Optional[tuple[str, ...]]
+
+
+def _compile_event(abi: ABIEvent, event_type: type[Event]) -> _CompiledEvent:
+    topic_fields: list[tuple[str, int, _WordDecoder]] = []
+    data_fields: list[tuple[str, int, _WordDecoder]] = []
+    data_inputs: list[tuple[str, str]] = []
+    for input_ in abi["inputs"]:
+        name = _camel_to_snake(input_["name"])
+        if input_["indexed"]:
+            # Indexed values that do not fit in a word are hashed, so we get
+            # the hash, like web3 does.
+            decode: _WordDecoder = _word_decoder(input_["type"]) or bytes
+            topic_fields.append((name, len(topic_fields) + 1, _with_field_type(name, decode)))
+        else:
+            data_inputs.append((name, input_["type"]))
+
+    decoders = [_word_decoder(type_) for _, type_ in data_inputs]
+    if all(decoders):
+        data_types = None
+        for index, ((name, _), word_decoder) in enumerate(zip(data_inputs, decoders)):
+            assert word_decoder is not None
+            data_fields.append((name, index * 32, _with_field_type(name, word_decoder)))
+    else:
+        data_types = tuple(type_ for _, type_ in data_inputs)
+        for index, (name, _) in enumerate(data_inputs):
+            data_fields.append((name, index, _with_field_type(name, lambda value: value)))
+
+    return _CompiledEvent(
+        event_type=event_type,
+        num_topics=len(topic_fields) + 1,
+        topic_fields=tuple(topic_fields),
+        data_fields=tuple(data_fields),
+        data_types=data_types,
+    )
+
+
+class EventDecoder:
+    """Decodes the logs of some contracts into events.
+
+    A decoder is compiled for each topic of the events in ``_EVENT_TYPES``
+    when the event decoder is created, so that decoding a log does not need
+    to look at the ABI anymore. Logs with other topics are skipped.
+    """
+
+    def __init__(self, contracts: Iterable[Contract], codec: ABICodec):
+        self._codec = codec
+        self._events: dict[bytes, _CompiledEvent] = {}
+        for contract in contracts:
+            for abi in contract.abi:
+                if abi["type"] != "event" or abi["name"] not in _EVENT_TYPES:
+                    continue
+                topic = event_abi_to_log_topic(abi)  # type: ignore
+                event_type = _EVENT_TYPES[abi["name"]]
+                self._events[topic] = _compile_event(cast(ABIEvent, abi), event_type)
+
+    def decode(self, logs: Iterable[LogReceipt], chain_id: ChainId) -> list[Event]:
+        events = []
+        for log_entry in logs:
+            topics = log_entry["topics"]
+            compiled = self._events.get(topics[0])
+            if compiled is None:
+                continue
+            if len(topics) != compiled.num_topics:
+                raise MismatchedABI(
+                    f"{compiled.event_type.__name__} log with {len(topics)} topics"
+                )
+
+            kwargs: dict[str, Any] = dict(
+                chain_id=chain_id,
+                block_number=log_entry["blockNumber"],
+                tx_hash=log_entry["transactionHash"],
+            )
+            for name, index, decode in compiled.topic_fields:
+                kwargs[name] = decode(topics[index])
+
+            data = HexBytes(log_entry["data"])
+            if compiled.data_types is None:
+                if len(data) < 32 * len(compiled.data_fields):
+                    raise MismatchedABI(f"{compiled.event_type.__name__} log with short data")
+                for name, offset, decode in compiled.data_fields:
+                    end = offset + 32
+                    kwargs[name] = decode(data[offset:end])
+            else:
+                values = self._codec.decode(compiled.data_types, data)
+                for name, index, convert in compiled.data_fields:
+                    kwargs[name] = convert(values[index])
+
+            events.append(compiled.event_type(**kwargs))
+        return events
+
+
+# Events whose handlers need the timestamp of the block they were emitted in.
+_TIMESTAMPED_EVENT_TYPES = (RequestFilled, FillInvalidated)
+
+_ResolveTimestampsCallback = Callable[[Iterable[BlockNumber]], dict[BlockNumber, Timestamp]]
 
 
 class EventFetcher:
@@ -221,14 +344,33 @@ class EventFetcher:
     _ETH_GET_LOGS_THRESHOLD_FAST = 2
     _ETH_GET_LOGS_THRESHOLD_SLOW = 5
 
-    def __init__(self, web3: Web3, contracts: tuple[Contract, ...], start_block: BlockNumber):
+    def __init__(
+        self,
+        web3: Web3,
+        contracts: tuple[Contract, ...],
+        start_block: BlockNumber,
+        num_workers: int = 1,
+        resolve_timestamps: Optional[_ResolveTimestampsCallback] = None,
+    ):
         self._web3 = web3
+        self._resolve_timestamps = resolve_timestamps
         self._chain_id = ChainId(web3.eth.chain_id)
         self._contract_addresses = [c.address for c in contracts]
         self._next_block_number = start_block
+        self._caught_up = False
+        # Whether the fetcher caught up with the chain at least once.
+        self._synced = False
         self._blocks_to_fetch = EventFetcher._DEFAULT_BLOCKS
-        self._event_abis = _make_topics_abi_mapping_for_contracts(contracts)
+        self._decoder = EventDecoder(contracts, web3.codec)
         self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
+        # When there are more blocks to fetch than a single range covers,
+        # fetch up to num_workers ranges concurrently.
+        self._num_workers = num_workers
+        self._executor = None
+        if num_workers > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix=f"EventFetcher[cid={self._chain_id}]"
+            )
 
         for contract in contracts:
             assert (
@@ -239,11 +381,26 @@ class EventFetcher:
     def synced_block(self) -> BlockNumber:
         return BlockNumber(self._next_block_number - 1)
 
+    def close(self) -> None:
+        """Stop the worker threads used for fetching concurrently."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    @property
+    def caught_up(self) -> bool:
+        """Whether the last call to :meth:`fetch` got all events up to the
+        latest block."""
+        return self._caught_up
+
+    def _set_caught_up(self, caught_up: bool) -> None:
+        self._caught_up = caught_up
+        self._synced = self._synced or caught_up
+
     def _fetch_range(
         self, from_block: BlockNumber, to_block: BlockNumber
-    ) -> Optional[list[Event]]:
-        """Returns a list of events that happened in the period [from_block, to_block],
-        or None if a timeout occurs."""
+    ) -> Optional[tuple[list[Event], float]]:
+        """Returns a list of events that happened in the period [from_block, to_block]
+        and the duration of the query, or None if a timeout occurs."""
         self._log.debug(
             "Fetching events",
             contracts=self._contract_addresses,
@@ -261,13 +418,8 @@ class EventFetcher:
         # Boba limits the range to 5000 blocks
         # 'ValueError: {'code': -32000, 'message': 'exceed maximum block range: 5000'}'
         except (requests.exceptions.ReadTimeout, ValueError):
-            old = self._blocks_to_fetch
-            self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, old // 5)
-            self._log.debug(
-                "Failed to get events in time, reducing number of blocks",
-                old=old,
-                new=self._blocks_to_fetch,
-            )
+            # The caller reduces the range, once for all ranges fetched
+            # concurrently.
             return None
 
         except requests.exceptions.ConnectionError as exc:
@@ -275,23 +427,132 @@ class EventFetcher:
             url = self._web3.provider.endpoint_uri
             self._log.error("Connection error", url=url, exc=exc)
             # Propagate the exception upwards, so we don't make further attempts.
+            # With several RPC URLs, this means that all of them failed.
             raise exc
 
         else:
-            duration = after_query - before_query
-            if duration < EventFetcher._ETH_GET_LOGS_THRESHOLD_FAST:
-                self._blocks_to_fetch = min(EventFetcher._MAX_BLOCKS, self._blocks_to_fetch * 2)
-            elif duration > EventFetcher._ETH_GET_LOGS_THRESHOLD_SLOW:
-                self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, self._blocks_to_fetch // 2)
-
-            return _decode_events(
-                logs=logs,
-                codec=self._web3.codec,
-                chain_id=self._chain_id,
-                event_abis=self._event_abis,
-            )
+            # The caller adjusts the range, once for all ranges fetched
+            # concurrently.
+            return self._decode(logs), after_query - before_query
 
-    def fetch(self) -> list[Event]:
+    def _reduce_blocks_to_fetch(self) -> None:
+        old = self._blocks_to_fetch
+        self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, old // 5)
+        self._log.debug(
+            "Failed to get events in time, reducing number of blocks",
+            old=old,
+            new=self._blocks_to_fetch,
+        )
+
+    def _adjust_blocks_to_fetch(self, duration: float) -> None:
+        if duration < EventFetcher._ETH_GET_LOGS_THRESHOLD_FAST:
+            self._blocks_to_fetch = min(EventFetcher._MAX_BLOCKS, self._blocks_to_fetch * 2)
+        elif duration > EventFetcher._ETH_GET_LOGS_THRESHOLD_SLOW:
+            self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, self._blocks_to_fetch // 2)
+
+    def _decode(self, logs: list[LogReceipt]) -> list[Event]:
+        fetched_at = time.time()
+        events = self._decoder.decode(logs, self._chain_id)
+        if self._resolve_timestamps is not None:
+            events = self._add_timestamps(events, self._resolve_timestamps)
+
+        decoded_at = time.time()
+        for event in events:
+            if isinstance(event, RequestCreated):
+                beamer.agent.metrics.start_request_trace(
+                    event.request_id,
+                    direction=f"{event.chain_id}-{event.target_chain_id}",
+                    block_timestamp=event.block_timestamp,
+                    fetched_at=fetched_at,
+                    decoded_at=decoded_at,
+                )
+        return events
+
+    def _add_timestamps(
+        self, events: list[Event], resolve_timestamps: _ResolveTimestampsCallback
+    ) -> list[Event]:
+        # RequestCreated timestamps are only used to trace new requests, see
+        # beamer.agent.metrics.start_request_trace. Requests found while
+        # syncing are not traced, so skip them until we caught up once.
+        trace = self._synced
+        block_numbers = {
+            event.block_number
+            for event in events
+            if isinstance(event, _TIMESTAMPED_EVENT_TYPES)
+            or (trace and isinstance(event, RequestCreated))
+        }
+        if not block_numbers:
+            return events
+
+        timestamps = resolve_timestamps(block_numbers)
+        result = []
+        for event in events:
+            if isinstance(event, _TIMESTAMPED_EVENT_TYPES) or (
+                trace and isinstance(event, RequestCreated)
+            ):
+                event = replace(event, block_timestamp=timestamps.get(event.block_number))
+            result.append(event)
+        return result
+
+    def _split_range(
+        self, from_block: BlockNumber, to_block: BlockNumber
+    ) -> list[tuple[BlockNumber, BlockNumber]]:
+        """Split the start of [from_block, to_block] into up to num_workers
+        consecutive ranges of the current range size."""
+        ranges: list[tuple[BlockNumber, BlockNumber]] = []
+        start = from_block
+        while start <= to_block and len(ranges) < self._num_workers:
+            end = min(to_block, BlockNumber(start + self._blocks_to_fetch))
+            ranges.append((start, end))
+            start = BlockNumber(end + 1)
+        return ranges
+
+    def _fetch_ranges_concurrently(
+        self, from_block: BlockNumber, to_block: BlockNumber
+    ) -> tuple[list[Event], BlockNumber]:
+        """Fetch events from consecutive ranges in parallel, starting at from_block.
+
+        Returns the events, in block order, and the number of the first block
+        whose events were not fetched."""
+        assert self._executor is not None
+        ranges = self._split_range(from_block, to_block)
+        futures = [self._executor.submit(self._fetch_range, *range_) for range_ in ranges]
+        wait(futures)
+
+        result: list[Event] = []
+        next_block = from_block
+        durations = []
+        for (_, end), future in zip(ranges, futures):
+            # Ranges after a timed out one are dropped so that the events
+            # stay ordered. They will be fetched again with a smaller range.
+            range_result = future.result()
+            if range_result is None:
+                self._reduce_blocks_to_fetch()
+                break
+            events, duration = range_result
+            result.extend(events)
+            durations.append(duration)
+            next_block = BlockNumber(end + 1)
+        else:
+            self._adjust_blocks_to_fetch(max(durations, default=0.0))
+        return result, next_block
+
+    def add_notifications(
+        self, logs: list[LogReceipt], block_data: Optional[BlockData]
+    ) -> list[Event]:
+        """Return the events of logs received via a subscription instead of
+        fetching them, and advance to ``block_data``, the latest block
+        received that way, if any."""
+        result = self._decode(logs)
+        if block_data is not None and block_data["number"] >= self._next_block_number:
+            self._next_block_number = BlockNumber(block_data["number"] + 1)
+            result.append(LatestBlockUpdatedEvent(chain_id=self._chain_id, block_data=block_data))
+        return result
+
+    def fetch(self, max_events: Optional[int] = None) -> list[Event]:
+        """Fetch the events up to the latest block. If ``max_events`` is
+        given, stop early once at least that many events were fetched."""
+        self._set_caught_up(False)
         try:
             block_data = self._web3.eth.get_block("latest")
             block_number = BlockNumber(block_data["number"])
@@ -299,24 +560,38 @@ class EventFetcher:
             return []
 
         if block_number < self._next_block_number:
+            self._set_caught_up(True)
             return []
 
-        result = []
+        result: list[Event] = []
         from_block = self._next_block_number
-        while from_block <= block_number:
+        while from_block <= block_number and (max_events is None or len(result) < max_events):
             to_block = min(block_number, BlockNumber(from_block + self._blocks_to_fetch))
             try:
-                events = self._fetch_range(from_block, to_block)
+                if self._executor is not None and to_block < block_number:
+                    # More than one range is left, so fetch them concurrently.
+                    events, from_block = self._fetch_ranges_concurrently(from_block, block_number)
+                    result.extend(events)
+                    continue
+
+                range_result = self._fetch_range(from_block, to_block)
             except requests.exceptions.ConnectionError:
                 break
-            if events is not None:
-                result.extend(events)
+            if range_result is None:
+                self._reduce_blocks_to_fetch()
+            else:
+                range_events, duration = range_result
+                self._adjust_blocks_to_fetch(duration)
+                result.extend(range_events)
                 from_block = BlockNumber(to_block + 1)
 
         self._next_block_number = from_block
+        self._set_caught_up(from_block - 1 == block_number)
         try:
-            # Block number needs to be decremented here, because it is already incremented above
-            block_data = self._web3.eth.get_block(from_block - 1)
+            # Block number needs to be decremented here, because it is already incremented above.
+            # Usually, all blocks up to the latest one were fetched, so its data can be reused.
+            if from_block - 1 != block_number:
+                block_data = self._web3.eth.get_block(from_block - 1)
         except requests.exceptions.RequestException:
             return result
         else:
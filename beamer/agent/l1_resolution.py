@@ -1,15 +1,32 @@
+import itertools
+import json
 import subprocess
 import sys
-
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
+from typing import Any, Callable, Hashable, Optional
+
 import structlog
+from eth_account import Account
 from hexbytes import HexBytes
 
+import beamer.agent.metrics
 from beamer.agent.typing import URL
 
-
 log = structlog.get_logger(__name__)
 
+# The time we're waiting for a relayer to exit in RelayerDaemon.stop(), in seconds.
+_STOP_TIMEOUT = 2
+
+# The time we're waiting for a relayer to answer a request, in seconds.
+# Relaying includes waiting for L1 transactions to be mined, so this is
+# generous.
+_RELAY_TIMEOUT: float = 30 * 60
+
 _RELAYER_NAMES = {"linux": "relayer-node18-linux-x64", "darwin": "relayer-node18-macos-x64"}
 
 
@@ -24,6 +41,195 @@ def get_relayer_executable() -> Path:
     return path.resolve()
 
 
+def get_l1_nonce_lock_file(privkey: HexBytes) -> Path:
+    """Returns the path of the lock file that relayers sending L1 transactions
+    for the account of ``privkey`` use to avoid picking the same nonce."""
+    address = Account.from_key(privkey).address
+    return Path(tempfile.gettempdir()).joinpath(f"beamer-relayer-{address}.lock")
+
+
+class RelayerError(Exception):
+    pass
+
+
+class RelayerDaemon:
+    """A relayer process that is kept running and relays one transaction
+    after the other, instead of starting a new relayer for each of them.
+
+    Requests are written to the relayer's stdin and responses are read from
+    its stdout, as JSON objects, one per line. Requests may be made from
+    several threads at once; the relayer handles them concurrently. If the
+    relayer exits, all pending requests fail and a new relayer is started
+    for the next request. If the relayer does not answer a request within
+    ``timeout`` seconds, only that request fails. If it did not answer any
+    other request in that time either, it is considered stuck and replaced
+    by a new one.
+    """
+
+    def __init__(self, l1_rpc: URL, privkey: HexBytes, timeout: float = _RELAY_TIMEOUT):
+        self._l1_rpc = l1_rpc
+        self._privkey = privkey
+        self._timeout = timeout
+        # This lock protects the following objects:
+        #   - self._process
+        #   - self._pending
+        #   - self._last_response
+        #   - the pending requests of each relayer
+        #   - writes to the relayer's stdin
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+        # The pending requests of the current relayer, by request ID.
+        self._pending: dict[int, Future] = {}
+        # The time the current relayer last answered a request, or was started.
+        self._last_response = 0.0
+        self._request_ids = itertools.count()
+
+    def relay(
+        self, l2_relay_from_rpc_url: URL, l2_relay_to_rpc_url: URL, tx_hash: HexBytes
+    ) -> None:
+        """Relay ``tx_hash`` and wait until the relayer is done with it."""
+        future: Future = Future()
+        request_id = next(self._request_ids)
+        request = dict(
+            id=request_id,
+            l2RelayFromRpcUrl=l2_relay_from_rpc_url,
+            l2RelayToRpcUrl=l2_relay_to_rpc_url,
+            l2TransactionHash=tx_hash.hex(),
+        )
+        with self._lock:
+            process = self._ensure_started()
+            assert process.stdin is not None
+            pending = self._pending
+            pending[request_id] = future
+            try:
+                process.stdin.write(json.dumps(request) + "\n")
+                process.stdin.flush()
+            except OSError as exc:
+                del pending[request_id]
+                raise RelayerError("failed to send request") from exc
+
+        try:
+            future.result(self._timeout)
+        except FutureTimeoutError as exc:
+            self._abandon(process, pending, request_id)
+            raise RelayerError("timed out waiting for relayer") from exc
+
+    def stop(self) -> None:
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _abandon(
+        self, process: subprocess.Popen, pending: dict[int, Future], request_id: int
+    ) -> None:
+        """Forget the timed out request ``request_id``. Restart the relayer
+        if it stopped answering requests altogether."""
+        with self._lock:
+            pending.pop(request_id, None)
+            if self._process is not process:
+                # The relayer was replaced already.
+                return
+            if time.monotonic() - self._last_response < self._timeout:
+                # The relayer still answers other requests.
+                return
+            log.warning("Relayer stopped answering, restarting", pid=process.pid)
+            process.kill()
+            self._process = None
+            try:
+                self._ensure_started()
+            except RelayerError as exc:
+                log.error("Failed to restart relayer", exc=exc)
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self._process is not None and self._process.poll() is None:
+            return self._process
+
+        relayer = get_relayer_executable()
+        if not relayer.exists():
+            raise RelayerError("No relayer found")
+
+        process = subprocess.Popen(
+            [
+                str(relayer),
+                "--daemon",
+                "--l1-rpc-url",
+                self._l1_rpc,
+                "--wallet-private-key",
+                self._privkey.hex(),
+                "--l1-nonce-lock-file",
+                str(get_l1_nonce_lock_file(self._privkey)),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        log.info("Started relayer", pid=process.pid)
+        # Requests sent to a previous relayer are failed by its own reader
+        # thread once it exited.
+        self._pending = {}
+        self._last_response = time.monotonic()
+        threading.Thread(
+            name=f"RelayerDaemon[pid={process.pid}]",
+            target=self._read_responses,
+            args=(process, self._pending),
+            daemon=True,
+        ).start()
+        threading.Thread(
+            name=f"RelayerDaemon[pid={process.pid}].stderr",
+            target=self._log_output,
+            args=(process,),
+            daemon=True,
+        ).start()
+        self._process = process
+        return process
+
+    def _read_responses(self, process: subprocess.Popen, pending: dict[int, Future]) -> None:
+        assert process.stdout is not None
+        for line in process.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                log.warning("Invalid relayer response", line=line)
+                continue
+
+            with self._lock:
+                if self._process is process:
+                    self._last_response = time.monotonic()
+                future = pending.pop(response.get("id"), None)
+            if future is None:
+                log.warning("Unexpected relayer response", response=response)
+            elif response.get("success"):
+                future.set_result(None)
+            else:
+                future.set_exception(RelayerError(response.get("error")))
+
+        returncode = process.wait()
+        log.info("Relayer exited", pid=process.pid, returncode=returncode)
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            futures = list(pending.values())
+            pending.clear()
+        for future in futures:
+            future.set_exception(RelayerError(f"relayer exited with code {returncode}"))
+
+    def _log_output(self, process: subprocess.Popen) -> None:
+        assert process.stderr is not None
+        for line in process.stderr:
+            log.debug("Relayer output", pid=process.pid, line=line.rstrip())
+
+
+_DAEMONS: dict[tuple[URL, HexBytes], RelayerDaemon] = {}
+_DAEMONS_LOCK = threading.Lock()
+
+
 def run_relayer_for_tx(
     l1_rpc: URL,
     l2_relay_from_rpc_url: URL,
@@ -31,27 +237,81 @@ def run_relayer_for_tx(
     privkey: HexBytes,
     tx_hash: HexBytes,
 ) -> None:
-    relayer = get_relayer_executable()
-
-    if not relayer.exists():
-        log.error("No relayer found")
-        sys.exit(1)
-
-    subprocess.run(
-        [
-            str(relayer),
-            "--l1-rpc-url",
-            l1_rpc,
-            "--l2-relay-to-rpc-url",
-            l2_relay_to_rpc_url,
-            "--l2-relay-from-rpc-url",
-            l2_relay_from_rpc_url,
-            "--wallet-private-key",
-            privkey.hex(),
-            "--l2-transaction-hash",
-            tx_hash.hex(),
-        ],
-        capture_output=True,
-        encoding="utf-8",
-        check=True,  # check throws an error right away
-    )
+    with _DAEMONS_LOCK:
+        daemon = _DAEMONS.get((l1_rpc, privkey))
+        if daemon is None:
+            daemon = RelayerDaemon(l1_rpc, privkey)
+            _DAEMONS[(l1_rpc, privkey)] = daemon
+    daemon.relay(l2_relay_from_rpc_url, l2_relay_to_rpc_url, tx_hash)
+
+
+def stop_relayer_daemons() -> None:
+    with _DAEMONS_LOCK:
+        daemons = list(_DAEMONS.values())
+        _DAEMONS.clear()
+    for daemon in daemons:
+        daemon.stop()
+
+
+class RelayerScheduler(Executor):
+    """Runs relayer invocations, in parallel across lanes.
+
+    Invocations submitted to the same lane run one after another, while
+    different lanes run in parallel. The agent uses the L2 the message is
+    relayed from as the lane, so resolutions for different rollups do not
+    queue behind each other. Concurrent relayers of the same account send
+    their L1 transactions while holding the lock file returned by
+    :func:`get_l1_nonce_lock_file`, which keeps their nonces apart.
+    """
+
+    def __init__(self) -> None:
+        # This lock protects the following objects:
+        #   - self._lanes
+        #   - self._shutdown
+        self._lock = threading.Lock()
+        self._lanes: dict[Hashable, ThreadPoolExecutor] = {}
+        self._shutdown = False
+
+    def submit(  # type: ignore
+        self, fn: Callable, /, *args: Any, lane: Hashable = None, **kwargs: Any
+    ) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            executor = self._lanes.get(lane)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"RelayerScheduler[lane={lane}]"
+                )
+                self._lanes[lane] = executor
+
+        label = str(lane)
+        submitted_at = time.monotonic()
+        started = False
+
+        def run() -> Any:
+            nonlocal started
+            started = True
+            started_at = time.monotonic()
+            beamer.agent.metrics.record_relayer_started(label, started_at - submitted_at)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                beamer.agent.metrics.record_relayer_finished(label, time.monotonic() - started_at)
+
+        def on_done(_future: Future) -> None:
+            # Cancelled runs never start, so they are still counted as queued.
+            if not started:
+                beamer.agent.metrics.record_relayer_queued(label, -1)
+
+        beamer.agent.metrics.record_relayer_queued(label, 1)
+        future = executor.submit(run)
+        future.add_done_callback(on_done)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            lanes = list(self._lanes.values())
+        for executor in lanes:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
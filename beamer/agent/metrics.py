@@ -1,12 +1,29 @@
 import contextlib
 import threading
-from dataclasses import dataclass
-from typing import Any, Generator
+from dataclasses import dataclass, field
+from typing import Any, Generator, Optional, cast
 
+import lru
 import structlog
-from prometheus_client import Counter, Info, start_http_server
+from hexbytes import HexBytes
+from prometheus_client import Counter, Gauge, Histogram, Info, Summary, start_http_server
 
 log = structlog.get_logger(__name__)
+_span_log = structlog.get_logger("beamer.agent.trace")
+
+# The stages of a request on its way to being filled by the agent, in order.
+# The first stage starts at the timestamp of the block containing the
+# request's RequestCreated event, each other one where the previous one ended.
+#   fetch:   until the event's log was received from the RPC
+#   decode:  until the event was decoded, including its block timestamp
+#   queue:   until the event was processed by the event processor
+#   checks:  until the fill passed all checks and is about to be sent
+#   receipt: until the fill's receipt was received
+REQUEST_STAGES = ("fetch", "decode", "queue", "checks", "receipt")
+
+# The maximum number of requests traced at the same time. Traces of requests
+# that are not filled by the agent are eventually evicted.
+_MAX_REQUEST_TRACES = 10_000
 
 
 def init(config: Any, source_rpc_url: str, target_rpc_url: str) -> None:
@@ -33,12 +50,104 @@ def init(config: Any, source_rpc_url: str, target_rpc_url: str) -> None:
     requests_created = Counter(
         "requests_created", "Number of requests created on the source rollup"
     )
+    relayer_queue_depth = Gauge(
+        "relayer_queue_depth", "Number of relayer runs waiting to be started", ["lane"]
+    )
+    relayer_wait_time = Histogram(
+        "relayer_wait_time_seconds",
+        "Time relayer runs spent waiting to be started",
+        ["lane"],
+        buckets=(1, 10, 60, 300, 900, 1800, 3600, float("inf")),
+    )
+    relayer_duration = Histogram(
+        "relayer_duration_seconds",
+        "Time it took relayer runs to finish",
+        ["lane"],
+        buckets=(10, 60, 300, 900, 1800, 3600, 7200, float("inf")),
+    )
+
+    request_stage_duration = Histogram(
+        "request_stage_duration_seconds",
+        "Time requests spent in each stage on their way to being filled by the agent",
+        ["direction", "stage"],
+        buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf")),
+    )
+    request_time_to_fill = Summary(
+        "request_time_to_fill_seconds",
+        "Time from the block containing a request until the agent's fill was mined",
+        ["direction"],
+    )
+
+    rpc_requests = Counter(
+        "rpc_requests", "Number of requests sent to the RPC", ["chain_id", "method"]
+    )
+    rpc_request_duration = Histogram(
+        "rpc_request_duration_seconds",
+        "Time it took the RPC to respond to requests",
+        ["chain_id", "method"],
+    )
+    rpc_errors = Counter(
+        "rpc_errors",
+        "Number of requests that failed or were answered with an error",
+        ["chain_id", "method"],
+    )
+    rpc_rate_limited = Counter(
+        "rpc_rate_limited",
+        "Number of requests rejected by the RPC with HTTP 429",
+        ["chain_id", "method"],
+    )
+    rpc_cache_lookups = Counter(
+        "rpc_cache_lookups",
+        "Number of requests looked up in a response cache",
+        ["chain_id", "method", "cache", "result"],
+    )
+    rpc_rate_limiter_wait_time = Histogram(
+        "rpc_rate_limiter_wait_time_seconds",
+        "Time requests waited for the rate limiter",
+        ["chain_id", "method"],
+    )
+    rpc_endpoint_healthy = Gauge(
+        "rpc_endpoint_healthy",
+        "Whether an endpoint of an RPC pool is currently used (1) or avoided after failures (0)",
+        ["chain_id", "endpoint"],
+    )
+    rpc_endpoint_rate_limited = Gauge(
+        "rpc_endpoint_rate_limited",
+        "Whether an endpoint of an RPC pool is currently rate limiting us",
+        ["chain_id", "endpoint"],
+    )
+    rpc_endpoint_latency = Gauge(
+        "rpc_endpoint_latency_seconds",
+        "Moving average of the response time of an endpoint of an RPC pool",
+        ["chain_id", "endpoint"],
+    )
+    rpc_endpoint_failovers = Counter(
+        "rpc_endpoint_failovers",
+        "Number of requests that failed on an endpoint of an RPC pool and were sent elsewhere",
+        ["chain_id", "endpoint"],
+    )
 
     _DATA = _Data(
         info=info,
         requests_filled=requests_filled,
         requests_filled_by_agent=requests_filled_by_agent,
         requests_created=requests_created,
+        relayer_queue_depth=relayer_queue_depth,
+        relayer_wait_time=relayer_wait_time,
+        relayer_duration=relayer_duration,
+        request_stage_duration=request_stage_duration,
+        request_time_to_fill=request_time_to_fill,
+        trace_spans=config.trace_spans,
+        rpc_requests=rpc_requests,
+        rpc_request_duration=rpc_request_duration,
+        rpc_errors=rpc_errors,
+        rpc_rate_limited=rpc_rate_limited,
+        rpc_cache_lookups=rpc_cache_lookups,
+        rpc_rate_limiter_wait_time=rpc_rate_limiter_wait_time,
+        rpc_endpoint_healthy=rpc_endpoint_healthy,
+        rpc_endpoint_rate_limited=rpc_endpoint_rate_limited,
+        rpc_endpoint_latency=rpc_endpoint_latency,
+        rpc_endpoint_failovers=rpc_endpoint_failovers,
     )
     if config.prometheus_metrics_port is not None:
         log.info("Serving Prometheus metrics", port=config.prometheus_metrics_port)
@@ -51,6 +160,25 @@ class _Data:
     requests_filled: Counter
     requests_filled_by_agent: Counter
     requests_created: Counter
+    relayer_queue_depth: Gauge
+    relayer_wait_time: Histogram
+    relayer_duration: Histogram
+    request_stage_duration: Histogram
+    request_time_to_fill: Summary
+    trace_spans: bool
+    rpc_requests: Counter
+    rpc_request_duration: Histogram
+    rpc_errors: Counter
+    rpc_rate_limited: Counter
+    rpc_cache_lookups: Counter
+    rpc_rate_limiter_wait_time: Histogram
+    rpc_endpoint_healthy: Gauge
+    rpc_endpoint_rate_limited: Gauge
+    rpc_endpoint_latency: Gauge
+    rpc_endpoint_failovers: Counter
+    request_traces: dict[bytes, "_RequestTrace"] = field(
+        default_factory=lambda: cast(dict[bytes, _RequestTrace], lru.LRU(_MAX_REQUEST_TRACES))
+    )
 
 
 _DATA: _Data = None  # type:ignore
@@ -61,3 +189,150 @@ _DATA_LOCK = threading.Lock()
 def update() -> Generator[_Data, None, None]:
     with _DATA_LOCK:
         yield _DATA
+
+
+@dataclass
+class _RequestTrace:
+    direction: str
+    start: float
+    # The time the last stage ended.
+    end: float
+    # Stages that ended, but were not recorded yet, as (stage, start, end).
+    unrecorded: list[tuple[str, float, float]] = field(default_factory=list)
+
+
+def start_request_trace(
+    request_id: bytes,
+    direction: str,
+    block_timestamp: Optional[float],
+    fetched_at: float,
+    decoded_at: float,
+) -> None:
+    """Start tracing the request whose RequestCreated event was just decoded.
+
+    The fetch and decode stages are only recorded once the next stage ends,
+    so that they can be discarded via :func:`discard_request_trace` for
+    requests that are not of interest, e.g. old ones found while syncing.
+    If the block timestamp is not known, the fetch stage is skipped.
+    """
+    start = fetched_at if block_timestamp is None else block_timestamp
+    trace = _RequestTrace(direction=direction, start=start, end=decoded_at)
+    if block_timestamp is not None:
+        trace.unrecorded.append(("fetch", block_timestamp, fetched_at))
+    trace.unrecorded.append(("decode", fetched_at, decoded_at))
+    with update() as data:
+        if data is not None:
+            data.request_traces[request_id] = trace
+
+
+def end_request_stage(request_id: bytes, stage: str, now: float) -> None:
+    """Record that ``stage`` of a traced request ended at time ``now``."""
+    assert stage in REQUEST_STAGES
+    with update() as data:
+        if data is None:
+            return
+        trace = data.request_traces.get(request_id)
+        if trace is None:
+            return
+        trace.unrecorded.append((stage, trace.end, now))
+        trace.end = now
+        for stage_, start, end in trace.unrecorded:
+            _record_stage(data, request_id, trace.direction, stage_, start, end)
+        trace.unrecorded.clear()
+
+        if stage == REQUEST_STAGES[-1]:
+            data.request_time_to_fill.labels(trace.direction).observe(now - trace.start)
+            del data.request_traces[request_id]
+
+
+def discard_request_trace(request_id: bytes) -> None:
+    with update() as data:
+        if data is not None:
+            data.request_traces.pop(request_id, None)
+
+
+def _record_stage(
+    data: _Data, request_id: bytes, direction: str, stage: str, start: float, end: float
+) -> None:
+    # Timestamps of different clocks may be slightly off.
+    duration = max(0.0, end - start)
+    data.request_stage_duration.labels(direction, stage).observe(duration)
+    if data.trace_spans:
+        _span_log.info(
+            "Span",
+            trace_id=HexBytes(request_id).hex(),
+            span=stage,
+            direction=direction,
+            start=start,
+            duration=round(duration, 6),
+        )
+
+
+# RPC metrics are recorded from within web3 middlewares, which also run
+# before init was called, e.g. while the agent is being set up.
+
+
+def record_rpc_request(
+    chain_id: str, method: str, duration: float, failed: bool, rate_limited: bool
+) -> None:
+    with update() as data:
+        if data is None:
+            return
+        data.rpc_requests.labels(chain_id, method).inc()
+        data.rpc_request_duration.labels(chain_id, method).observe(duration)
+        if failed:
+            data.rpc_errors.labels(chain_id, method).inc()
+        if rate_limited:
+            data.rpc_rate_limited.labels(chain_id, method).inc()
+
+
+def record_rpc_cache_lookup(chain_id: str, method: str, cache: str, hit: bool) -> None:
+    with update() as data:
+        if data is not None:
+            result = "hit" if hit else "miss"
+            data.rpc_cache_lookups.labels(chain_id, method, cache, result).inc()
+
+
+def record_rate_limiter_wait(chain_id: str, method: str, wait_time: float) -> None:
+    with update() as data:
+        if data is not None:
+            data.rpc_rate_limiter_wait_time.labels(chain_id, method).observe(wait_time)
+
+
+def record_rpc_endpoint(
+    chain_id: str, endpoint: str, healthy: bool, rate_limited: bool, latency: Optional[float]
+) -> None:
+    with update() as data:
+        if data is None:
+            return
+        data.rpc_endpoint_healthy.labels(chain_id, endpoint).set(healthy)
+        data.rpc_endpoint_rate_limited.labels(chain_id, endpoint).set(rate_limited)
+        if latency is not None:
+            data.rpc_endpoint_latency.labels(chain_id, endpoint).set(latency)
+
+
+def record_rpc_failover(chain_id: str, endpoint: str) -> None:
+    with update() as data:
+        if data is not None:
+            data.rpc_endpoint_failovers.labels(chain_id, endpoint).inc()
+
+
+def record_relayer_queued(lane: str, delta: int) -> None:
+    """Record that ``delta`` relayer runs were added to ``lane``'s queue,
+    or removed from it if negative."""
+    with update() as data:
+        if data is not None:
+            data.relayer_queue_depth.labels(lane=lane).inc(delta)
+
+
+def record_relayer_started(lane: str, wait_time: float) -> None:
+    with update() as data:
+        if data is not None:
+            data.relayer_queue_depth.labels(lane=lane).dec()
+            data.relayer_wait_time.labels(lane=lane).observe(wait_time)
+
+
+def record_relayer_finished(lane: str, duration: float) -> None:
+    with update() as data:
+        if data is not None:
+            data.relayer_duration.labels(lane=lane).observe(duration)
@@ -1,19 +1,28 @@
+import email.utils
 import functools
 import threading
 import time
+import weakref
 from dataclasses import dataclass, field
-from typing import Any, Callable, cast
+from typing import Any, Callable, TypeVar, cast
 
-import atomics
-import atomics.base
-import lru
 import requests.exceptions
 import structlog
 from web3 import HTTPProvider, Web3
 from web3.types import RPCEndpoint, RPCResponse
 
+import beamer.agent.metrics
+
 log = structlog.get_logger(__name__)
 
+# The chain IDs of Web3 instances, as metric labels. They are taken from the
+# responses to eth_chainId requests, so that no extra requests are needed.
+_CHAIN_LABELS: weakref.WeakKeyDictionary[Web3, str] = weakref.WeakKeyDictionary()
+
+
+def _chain_label(w3: Web3) -> str:
+    return _CHAIN_LABELS.get(w3, "unknown")
+
 
 def _result_ok(response: RPCResponse) -> bool:
     if "error" in response:
@@ -21,33 +30,37 @@ def _result_ok(response: RPCResponse) -> bool:
     return response.get("result") is not None
 
 
-# This middleware caches responses of eth_getBlockByNumber calls. Requests with
-# block number set to 'latest' will never be returned from the cache. However,
-# successful responses of those calls will be stored into the cache so that
-# further requests specifying a concrete block number can be satisfied from
-# the cache.
-def cache_get_block_by_number(
-    make_request: Callable[[RPCEndpoint, Any], RPCResponse], _w3: Web3
+# This middleware records metrics of the requests that are actually sent to
+# the RPC, so it must be the innermost one. It also takes note of the chain ID
+# that the other middlewares use to label their metrics.
+def instrumentation(
+    make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3
 ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
-    cache = lru.LRU(1000)
-
     def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
-        if method != "eth_getBlockByNumber":
-            return make_request(method, params)
-
-        if params[0] == "latest":
-            response = make_request(method, params)
-            if _result_ok(response):
-                key = hex(response["result"].number), params[1]
-                cache[key] = response
-        elif params[0].startswith("0x"):
-            response = cache.get(params)
-            if response is None:
-                response = make_request(method, params)
-                if _result_ok(response):
-                    cache[params] = response
-        else:
+        chain_id = _chain_label(w3)
+        start = time.monotonic()
+        try:
             response = make_request(method, params)
+        except requests.exceptions.HTTPError as exc:
+            rate_limited = exc.response is not None and exc.response.status_code == 429
+            duration = time.monotonic() - start
+            beamer.agent.metrics.record_rpc_request(
+                chain_id, method, duration, failed=True, rate_limited=rate_limited
+            )
+            raise
+        except Exception:
+            duration = time.monotonic() - start
+            beamer.agent.metrics.record_rpc_request(
+                chain_id, method, duration, failed=True, rate_limited=False
+            )
+            raise
+
+        duration = time.monotonic() - start
+        beamer.agent.metrics.record_rpc_request(
+            chain_id, method, duration, failed="error" in response, rate_limited=False
+        )
+        if method == "eth_chainId" and _result_ok(response):
+            _CHAIN_LABELS[w3] = str(int(response["result"], 16))
         return response
 
     return middleware
@@ -55,97 +68,86 @@ def cache_get_block_by_number(
 
 # The rate limiter middleware.
 #
-# In cases where an RPC returns HTTP 429 (Too many requests), we need to reduce
-# the rate at which we issue requests to that RPC. In order to do that, we
-# define the following operating modes:
-#
-# 1) normal operation
-# 2) rate limiting mode
-# 3) tapering mode
-#
-# In normal operation, the RPC accepts our every request and we issue requests
-# at full rate, i.e. as they come.
-#
-# Rate limiting mode begins when the RPC returns HTTP 429, while we are in
-# normal operation. For the duration of this mode, defined by _RATE_LIMIT_PERIOD,
-# we will attempt to issue requests with a reduced rate, defined by
-# _RATE_LIMIT_REQUEST_DELAY, the number of seconds between each attempt.
+# Requests to an RPC are admitted in two steps. First, a request needs a token
+# from a token bucket. Then, it needs one of _MAX_CONCURRENT_REQUESTS slots, so
+# that requests to the same RPC run concurrently, but never more than that at
+# a time.
 #
-# This effectively caps the request rate at 1 / _RATE_LIMIT_REQUEST_DELAY with
-# the hope that the RPC will eventually notice that we slowed down and accept
-# the requests. If the RPC rejects new requests even after the rate limiting
-# period is over, we simply raise a RuntimeError, which will cause the agent to
-# shut down, as there is nothing more that could be done.
+# In normal operation, the bucket does not limit the request rate at all. Once
+# the RPC returns HTTP 429 (Too many requests), we enter rate limiting mode and
+# the bucket is refilled at a rate of _INITIAL_RATE tokens per second. The rate
+# is adjusted with AIMD (additive increase, multiplicative decrease):
 #
-# Tapering mode begins immediately after the end of rate limiting mode, with
-# the idea that we ramp up to the original normal operation request rate (i.e.
-# without any delays). Currently, the ramp up is implemented in the following
-# way:
+# - every further HTTP 429 halves the rate, at most once per
+#   _DECREASE_INTERVAL, so that a burst of rejected concurrent requests counts
+#   as one, but never below _MIN_RATE
 #
-# - upon exiting the rate limiting mode, set
-#   - _RateLimiterState.taper_counter to 0
-#   - _RateLimiterState.taper_counter_max to the number of threads currently
-#    waiting on the rate limiter lock in the _rate_limiter function
+# - every successful request increases the rate by 1 / rate, i.e. the rate
+#   grows by about one request per second, every second
 #
-# - as each thread that waited on the lock gets its turn, it will notice it is
-#   in the tapering mode (taper_counter_max > 0) so it will sleep for a delay of
+# Once the rate reaches _MAX_RATE, rate limiting mode ends. If the RPC sends a
+# Retry-After header along with HTTP 429, no requests are admitted until then.
 #
-#       _RATE_LIMIT_REQUEST_DELAY / 2**state.taper_counter
-#
-# - when taper_counter reaches taper_counter_max, the tapering mode is over and
-#   we return to normal operation
-#
-# - if at any point during tapering mode we get rate limited by the RPC, we
-#   will immediately switch back to rate limiting mode
-#
-# The tapering mode tries to quickly ramp up to normal request rate by
-# exponentially reducing the delay time between consecutive requests.
+# Rejected requests are retried until they succeed. Under heavy rate limiting,
+# requests thus get slower instead of failing.
+
+
+# The maximum number of concurrent requests per RPC.
+_MAX_CONCURRENT_REQUESTS = 8
+
+# The request rate, in requests per second, when entering rate limiting mode.
+_INITIAL_RATE = 10.0
+
+# The bounds of the request rate in rate limiting mode. Reaching _MAX_RATE
+# ends rate limiting mode.
+_MIN_RATE = 0.5
+_MAX_RATE = 100.0
+
+# The minimum time between two decreases of the request rate, in seconds.
+_DECREASE_INTERVAL = 1.0
+
+# The maximum time we honour a Retry-After for, in seconds.
+_MAX_RETRY_AFTER = 60.0
 
 
 # The rate limiter state.
 #
-# One instance per web3 rate limiter middleware, i.e. one instance per
-# chain/RPC if there is exactly one Web3 instance per chain/RPC.
+# One instance per RPC. The rate limiter middleware creates one per Web3
+# instance, i.e. one per chain/RPC if there is exactly one Web3 instance per
+# chain/RPC. An RPC pool keeps one for each of its endpoints instead.
 #
 # Note: it is important to ensure only one Web3 instance per chain/RPC,
 # otherwise, it could happen that two parallel rate limiter middleware talk to
 # the same RPC, which would rate limit both middlewares.
 #
-# The lock protects all state fields except num_waiting_on_lock, which is an
-# atomic used to keep track of threads waiting on the lock. The introduction of
-# this lock means that, effectively, even in normal operation where no rate
-# limiting occurs, concurrent requests may not happen as if the lock were not
-# there. In other words, regardless of rate limiting, if several threads
-# attempt to issue requests and arrive at the rate limiter middleware at the
-# same time, they will be forced to take the lock and make the requests
-# serially.
+# The lock protects all fields except slots. It is only held while updating
+# the state, never while making a request.
 @dataclass(slots=True)
-class _RateLimiterState:
-    lock: threading.Lock = field(default_factory=threading.Lock)
-    num_waiting_on_lock: atomics.base.AtomicUint = field(
-        default_factory=lambda: atomics.atomic(width=4, atype=atomics.UINT)
+class RateLimiterState:
+    slots: threading.BoundedSemaphore = field(
+        default_factory=lambda: threading.BoundedSemaphore(_MAX_CONCURRENT_REQUESTS)
     )
-    rate_limit_end: None | float = None
-    taper_counter: int = 0
-    taper_counter_max: int = 0
-
-
-# The time period during which the middleware will limit the maximum number of
-# requests per second to 1 / _RATE_LIMIT_REQUEST_DELAY.
-# _RATE_LIMIT_PERIOD must always be greater than _RATE_LIMIT_REQUEST_DELAY.
-# It is recommended to use a small multiple of _RATE_LIMIT_REQUEST_DELAY.
-_RATE_LIMIT_PERIOD = 3
-
-# The delay between two consecutive attempts at making a request to the RPC.
-# Only used during the rate limiting period.
-_RATE_LIMIT_REQUEST_DELAY = 1
-
-# The number of seconds above which the wait time on the rate limiter lock is
-# considered too long. We will emit a debug log event any time a thread had
-# waited on the lock longer than this. Must be greater than
-# _RATE_LIMIT_REQUEST_DELAY in order to avoid spamming the log with too many
-# events.
-_RATE_LIMIT_LOCK_WAIT_TOO_LONG = _RATE_LIMIT_REQUEST_DELAY * 2
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # The rate at which the token bucket is refilled, in tokens per second.
+    # None means that we are not rate limited.
+    rate: None | float = None
+    tokens: float = 0
+    last_refill: float = 0
+    last_decrease: float = 0
+    # No requests are admitted before this time, as requested via Retry-After.
+    blocked_until: float = 0
+
+    @property
+    def limited(self) -> bool:
+        """Whether requests are currently slowed down by this state."""
+        with self.lock:
+            return self.rate is not None or self.blocked_until > time.monotonic()
+
+
+# The number of seconds above which the wait for admission is considered too
+# long. We will emit a debug log event any time a thread had waited longer
+# than this.
+_ADMISSION_WAIT_TOO_LONG = 2.0
 
 # A thread local object used to handle reentrancy in web3py middleware.
 _RATE_LIMITER_TLD = threading.local()
@@ -153,84 +155,116 @@ _RATE_LIMITER_TLD = threading.local()
 # A type alias to improve readability.
 _MakeRequest = Callable[[RPCEndpoint, Any], RPCResponse]
 
+_T = TypeVar("_T")
 
-def _try_make_request(
-    make_request: _MakeRequest, method: RPCEndpoint, params: Any
-) -> tuple[bool, None | RPCResponse]:
+
+def _parse_retry_after(value: None | str) -> None | float:
+    """Return the delay requested by a Retry-After header, in seconds."""
+    if value is None:
+        return None
     try:
-        response = make_request(method, params)
-    except requests.exceptions.HTTPError as exc:
-        if exc.response.status_code == 429:
-            return True, None
-        raise exc
-    else:
-        return False, response
+        delay = float(value)
+    except ValueError:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        delay = date.timestamp() - time.time()
+    return min(max(0.0, delay), _MAX_RETRY_AFTER)
 
 
-def _rate_limiter_inner(
+def _acquire_token(state: RateLimiterState) -> None:
+    while True:
+        with state.lock:
+            now = time.monotonic()
+            delay = state.blocked_until - now
+            if delay <= 0:
+                if state.rate is None:
+                    return
+                # Allow a burst of up to one second worth of requests.
+                capacity = max(1.0, state.rate)
+                elapsed = now - state.last_refill
+                state.tokens = min(capacity, state.tokens + elapsed * state.rate)
+                state.last_refill = now
+                if state.tokens >= 1:
+                    state.tokens -= 1
+                    return
+                delay = (1 - state.tokens) / state.rate
+        time.sleep(delay)
+
+
+def _on_rate_limited(state: RateLimiterState, rpc: str, retry_after: None | float) -> None:
+    with state.lock:
+        now = time.monotonic()
+        if retry_after is not None:
+            state.blocked_until = max(state.blocked_until, now + retry_after)
+
+        if state.rate is None:
+            log.debug(
+                "Entering rate limiting mode", thread=threading.current_thread().name, rpc=rpc
+            )
+            state.rate = _INITIAL_RATE
+            state.tokens = 0
+            state.last_refill = now
+            state.last_decrease = now
+        elif now - state.last_decrease >= _DECREASE_INTERVAL:
+            state.rate = max(_MIN_RATE, state.rate / 2)
+            state.last_decrease = now
+            if state.rate == _MIN_RATE:
+                log.warning("Heavily rate limited by RPC", rpc=rpc, rate=state.rate)
+
+
+def _on_success(state: RateLimiterState, rpc: str) -> None:
+    with state.lock:
+        if state.rate is None:
+            return
+        state.rate += 1 / state.rate
+        if state.rate >= _MAX_RATE:
+            state.rate = None
+            log.debug(
+                "Exiting rate limiting mode", thread=threading.current_thread().name, rpc=rpc
+            )
+
+
+def limit_rate(
+    state: RateLimiterState,
+    rpc: str,
+    chain_id: str,
     method: RPCEndpoint,
-    params: Any,
-    make_request: _MakeRequest,
-    w3: Web3,
-    state: _RateLimiterState,
-) -> RPCResponse:
-    rpc = cast(HTTPProvider, w3.provider).endpoint_uri
+    send: Callable[[], _T],
+    retry: bool = True,
+) -> _T:
+    """Call ``send`` to make a request to ``rpc`` once ``state`` admits it.
+
+    Requests rejected with HTTP 429 are retried until they succeed. If
+    ``retry`` is false, the :class:`requests.exceptions.HTTPError` is raised
+    instead, after the state was updated.
+    """
     while True:
-        if state.rate_limit_end is not None:
-            # We are in rate limiting period.
-            rate_limited, response = _try_make_request(make_request, method, params)
-            while rate_limited and time.time() <= state.rate_limit_end:
-                time.sleep(_RATE_LIMIT_REQUEST_DELAY)
-                rate_limited, response = _try_make_request(make_request, method, params)
-
-            if rate_limited:
-                # Even after _RATE_LIMIT_PERIOD, we are still being rate-limited by
-                # the RPC provider so there is nothing we can really do.
-                raise RuntimeError("rate limit period exceeded: %s" % rpc)
-            else:
-                assert response is not None
-                if time.time() > state.rate_limit_end:
-                    # Rate limit period ended so we now enter the tapering period,
-                    num_waiting_on_lock = state.num_waiting_on_lock.load()
-                    log.debug(
-                        "Exiting rate limiting mode",
-                        thread=threading.current_thread().name,
-                        rpc=rpc,
-                    )
-                    state.rate_limit_end = None
-                    state.taper_counter = 0
-                    state.taper_counter_max = num_waiting_on_lock
-
-                return response
-        else:
-            if state.taper_counter_max > 0:
-                # We are in tapering period.
-                request_delay = _RATE_LIMIT_REQUEST_DELAY / 2**state.taper_counter
-                state.taper_counter += 1
-                if state.taper_counter == state.taper_counter_max:
-                    # We have reached the end of tapering period.
-                    state.taper_counter = 0
-                    state.taper_counter_max = 0
-                    log.debug(
-                        "Exiting tapering mode", thread=threading.current_thread().name, rpc=rpc
-                    )
-
-                time.sleep(request_delay)
-
-            # If we get rate limited by the RPC, start a new rate limiting
-            # period by setting state.rate_limit_end and try sending the
-            # request again after _RATE_LIMIT_REQUEST_DELAY. Otherwise,
-            # simply return the response.
-            rate_limited, response = _try_make_request(make_request, method, params)
-            if rate_limited:
+        t = time.time()
+        _acquire_token(state)
+        with state.slots:
+            wait_time = time.time() - t
+            beamer.agent.metrics.record_rate_limiter_wait(chain_id, method, wait_time)
+            if wait_time > _ADMISSION_WAIT_TOO_LONG:
                 log.debug(
-                    "Entering rate limiting mode", thread=threading.current_thread().name, rpc=rpc
+                    "Long rate limiter wait time",
+                    thread=threading.current_thread().name,
+                    wait_time=wait_time,
+                    rpc=rpc,
                 )
-                state.rate_limit_end = time.time() + _RATE_LIMIT_PERIOD
-                time.sleep(_RATE_LIMIT_REQUEST_DELAY)
-            else:
-                assert response is not None
-                return response
+            try:
+                result = send()
+            except requests.exceptions.HTTPError as exc:
+                if exc.response is None or exc.response.status_code != 429:
+                    raise
+                retry_after = _parse_retry_after(exc.response.headers.get("Retry-After"))
+                _on_rate_limited(state, rpc, retry_after)
+                if not retry:
+                    raise
+                continue
+        _on_success(state, rpc)
+        return result
 
 
 def _rate_limiter(
@@ -238,47 +272,27 @@ def _rate_limiter(
     params: Any,
     make_request: _MakeRequest,
     w3: Web3,
-    state: _RateLimiterState,
+    state: RateLimiterState,
 ) -> RPCResponse:
     if hasattr(_RATE_LIMITER_TLD, "entered"):
-        # We already entered this function once and likely took the lock,
-        # so just make a request immediately to avoid deadlocks.
-        # The cause of a second entry into this function is most probably
-        # an eth_chainId call made as part of our call to make_request.
+        # We were already admitted and hold a slot, so just make a request
+        # immediately to avoid deadlocks. The cause of a second entry into
+        # this function is most probably an eth_chainId call made as part of
+        # our call to make_request.
         return make_request(method, params)
 
+    rpc = str(cast(HTTPProvider, w3.provider).endpoint_uri)
     _RATE_LIMITER_TLD.entered = True
-
-    state.num_waiting_on_lock.inc()
-    t = time.time()
-    with state.lock:
-        lock_wait_time = time.time() - t
-        if lock_wait_time > _RATE_LIMIT_LOCK_WAIT_TOO_LONG:
-            rpc = cast(HTTPProvider, w3.provider).endpoint_uri
-            num_waiting_on_lock = state.num_waiting_on_lock.load()
-            log.debug(
-                "Long rate limiter lock wait time",
-                thread=threading.current_thread().name,
-                lock_wait_time=lock_wait_time,
-                num_waiting_on_lock=num_waiting_on_lock,
-                rpc=rpc,
-            )
-
-        state.num_waiting_on_lock.dec()
-        try:
-            # The following call may return in exactly one of these cases:
-            # 1) we got a response from the RPC, during rate limiting period
-            # 2) we got a response from the RPC, during tapering period
-            # 3) we got a response from the RPC, during normal operation
-            # 4) we got rejected by the RPC, even after rate limit period; this
-            #    will result in a RuntimeError being raised, causing agent shutdown
-            return _rate_limiter_inner(method, params, make_request, w3, state)
-        finally:
-            del _RATE_LIMITER_TLD.entered
+    try:
+        return limit_rate(
+            state, rpc, _chain_label(w3), method, lambda: make_request(method, params)
+        )
+    finally:
+        del _RATE_LIMITER_TLD.entered
 
 
 def rate_limiter(
     make_request: _MakeRequest, w3: Web3
 ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
-    state = _RateLimiterState()
+    state = RateLimiterState()
     return functools.partial(_rate_limiter, make_request=make_request, w3=w3, state=state)
@@ -99,6 +99,10 @@ class Claim(StateMachine):
     def latest_claim_made(self) -> ClaimMade:
         return self._latest_claim_made
 
+    @property
+    def challenger_stakes(self) -> dict[Address, int]:
+        return dict(self._challenger_stakes)
+
     def get_challenger_stake(self, challenger: Address) -> int:
         return self._challenger_stakes.get(challenger, 0)
 
@@ -41,6 +41,8 @@ class Request(StateMachine):
         self.l1_resolution_filler: Optional[ChecksumAddress] = None
         self.l1_resolution_fill_id: Optional[FillId] = None
         self.l1_resolution_invalid_fill_ids: set[FillId] = set()
+        # Set while a fill or claim transaction of ours is not mined yet.
+        self.transaction_pending = False
 
     pending = State("Pending", initial=True)
     filled = State("Filled")
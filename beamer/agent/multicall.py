@@ -0,0 +1,154 @@
+import threading
+from typing import Any, Optional, Sequence
+
+import requests.exceptions
+import structlog
+from eth_utils import to_checksum_address
+from web3 import Web3
+from web3.contract import ContractFunction
+from web3.exceptions import ContractLogicError
+
+from beamer.agent.batching import batch_call, decode_output
+from beamer.agent.typing import BlockNumber
+
+# Multicall3 is deployed at the same address on most EVM chains,
+# see https://github.com/mds1/multicall.
+MULTICALL3_ADDRESS = to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")
+
+_MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+
+class CallAggregator:
+    """Reads the results of several view calls on one chain at once.
+
+    If Multicall3 is deployed on the chain, the calls are aggregated into a
+    single eth_call. Otherwise, they are sent as a JSON-RPC batch via
+    :func:`~beamer.agent.batching.batch_call`.
+
+    Results are cached until the block number passed to :meth:`call` changes
+    or :meth:`invalidate` is called, so calls repeated while processing the
+    same block do not hit the RPC. :meth:`prefetch` fills the cache with the
+    results of calls that are made one by one later on.
+    """
+
+    def __init__(self, web3: Web3):
+        self._web3 = web3
+        self._multicall = web3.eth.contract(address=MULTICALL3_ADDRESS, abi=_MULTICALL3_ABI)
+        self._multicall_deployed: Optional[bool] = None
+        # This lock protects the following objects:
+        #   - self._cache
+        #   - self._cache_block
+        self._lock = threading.Lock()
+        self._cache: dict[tuple[str, str], Any] = {}
+        self._cache_block: Optional[BlockNumber] = None
+        self._log = structlog.get_logger(type(self).__name__)
+
+    def call(self, functions: Sequence[ContractFunction], block_number: BlockNumber) -> list[Any]:
+        results = self._fetch(functions, block_number)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def prefetch(self, functions: Sequence[ContractFunction], block_number: BlockNumber) -> None:
+        """Fetch the results of ``functions`` into the cache, all at once, so
+        that later calls for the same block need no requests.
+
+        Calls that fail are cached as well, and :meth:`call` raises their
+        error only to the callers of the failed functions. If the whole
+        request fails, nothing is cached and the functions are requested
+        again when called."""
+        try:
+            self._fetch(functions, block_number)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            self._log.warning("Failed to prefetch calls", exc=exc)
+
+    def invalidate(self) -> None:
+        """Drop cached results, e.g. after sending a transaction that may
+        have changed them."""
+        with self._lock:
+            self._cache.clear()
+
+    def _fetch(
+        self, functions: Sequence[ContractFunction], block_number: BlockNumber
+    ) -> list[Any]:
+        """Return the results of ``functions``, or the errors of those
+        that failed."""
+        keys = [
+            (func.address, func._encode_transaction_data())  # pylint:disable=protected-access
+            for func in functions
+        ]
+        results: dict[tuple[str, str], Any] = {}
+        missing: dict[tuple[str, str], ContractFunction] = {}
+        with self._lock:
+            if self._cache_block != block_number:
+                self._cache.clear()
+                self._cache_block = block_number
+            for key, func in zip(keys, functions):
+                if key in self._cache:
+                    results[key] = self._cache[key]
+                else:
+                    missing[key] = func
+
+        if missing:
+            fetched = self._call(list(missing.values()))
+            results.update(zip(missing, fetched))
+            with self._lock:
+                if self._cache_block == block_number:
+                    self._cache.update(zip(missing, fetched))
+
+        return [results[key] for key in keys]
+
+    def _call(self, functions: list[ContractFunction]) -> list[Any]:
+        if len(functions) == 1 or not self._is_multicall_deployed():
+            return batch_call(functions, return_exceptions=True)
+
+        calls = []
+        for func in functions:
+            call_data = func._encode_transaction_data()  # pylint:disable=protected-access
+            calls.append((func.address, True, call_data))
+        results = self._multicall.functions.aggregate3(calls).call()
+        return [
+            decode_output(func, return_data)
+            if success
+            else ContractLogicError(f"call to {func.address} reverted")
+            for func, (success, return_data) in zip(functions, results)
+        ]
+
+    def _is_multicall_deployed(self) -> bool:
+        if self._multicall_deployed is None:
+            code = self._web3.eth.get_code(MULTICALL3_ADDRESS)
+            self._multicall_deployed = len(code) > 0
+            self._log.debug(
+                "Checked for Multicall3",
+                chain_id=self._web3.eth.chain_id,
+                deployed=self._multicall_deployed,
+            )
+        return self._multicall_deployed
@@ -0,0 +1,341 @@
+import threading
+import time
+from typing import Any, Callable, Optional, cast
+
+import lru
+from eth_typing import HexStr
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.caching import generate_cache_key
+from web3.types import Middleware, RPCEndpoint, RPCResponse
+
+import beamer.agent.metrics
+from beamer.agent.typing import ChainId
+
+# The default maximum number of responses cached per chain.
+DEFAULT_MAX_ENTRIES = 10_000
+
+# The number of blocks below the latest one that reorgs are expected to reach
+# at most. Cached responses for older blocks are considered final.
+REORG_DEPTH = 128
+
+# Methods whose responses never change, given the same parameters.
+_IMMUTABLE_METHODS = frozenset(
+    RPCEndpoint(method)
+    for method in (
+        "eth_chainId",
+        "net_version",
+        "web3_sha3",
+        "eth_getBlockByHash",
+        "eth_getBlockTransactionCountByHash",
+        "eth_getTransactionByBlockHashAndIndex",
+        "eth_getUncleByBlockHashAndIndex",
+        "eth_getUncleCountByBlockHash",
+        "eth_getRawTransactionByHash",
+    )
+)
+
+# Methods about transactions, whose responses only stay the same while the
+# block that included the transaction stays on the chain.
+_MINED_METHODS = frozenset(
+    RPCEndpoint(method) for method in ("eth_getTransactionByHash", "eth_getTransactionReceipt")
+)
+
+# Methods whose responses depend on a block given by one of their
+# parameters, mapped to the index of that parameter.
+_BLOCK_PARAMETERS = {
+    RPCEndpoint("eth_getBlockByNumber"): 0,
+    RPCEndpoint("eth_getBlockTransactionCountByNumber"): 0,
+    RPCEndpoint("eth_call"): 1,
+    RPCEndpoint("eth_getBalance"): 1,
+    RPCEndpoint("eth_getCode"): 1,
+    RPCEndpoint("eth_getTransactionCount"): 1,
+    RPCEndpoint("eth_getStorageAt"): 2,
+}
+
+# Methods that are about the latest block itself, as opposed to the state at
+# the latest block, so their responses must never be taken from the cache.
+_HEAD_METHODS = frozenset(
+    RPCEndpoint(method)
+    for method in ("eth_getBlockByNumber", "eth_getBlockTransactionCountByNumber")
+)
+
+_BLOCK_METHODS = frozenset(
+    RPCEndpoint(method) for method in ("eth_getBlockByNumber", "eth_getBlockByHash")
+)
+
+
+def _to_int(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+def _result_ok(response: RPCResponse) -> bool:
+    if "error" in response:
+        return False
+    return response.get("result") is not None
+
+
+class ResponseCache:
+    """Caches the RPC responses of one chain, with respect to the blocks that
+    they depend on.
+
+    Responses that depend on a block, e.g. to ``eth_call`` at a block number
+    or receipts of mined transactions, are tied to that block. The hashes of
+    the blocks seen in responses are tracked, and once a block turns out to
+    be replaced by a reorg, all responses tied to it and later blocks are
+    dropped. A block can only be checked against its parent, so the blocks
+    between the latest one and a new one are needed as well, see
+    :meth:`missing_parent`. Responses tied to blocks more than
+    :data:`REORG_DEPTH` blocks below the latest one are final, just like
+    those to requests for immutable data, e.g. blocks by hash.
+
+    At most ``max_entries`` responses are cached, the least recently used
+    ones are dropped first.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        # This lock protects all of the following objects.
+        self._lock = threading.Lock()
+        self._entries: dict[str, RPCResponse] = cast(dict[str, RPCResponse], lru.LRU(max_entries))
+        # The keys of the entries tied to each block that is not final yet.
+        self._keys_by_block: dict[int, list[str]] = {}
+        # The hashes of the blocks that are not final yet, as far as known.
+        self._hashes: dict[int, HexBytes] = {}
+        self._head: Optional[int] = None
+        self._head_updated_at = 0.0
+
+    def get(self, key: str) -> Optional[RPCResponse]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: str, response: RPCResponse, block_number: Optional[int] = None) -> None:
+        """Cache ``response`` under ``key``. If ``block_number`` is given,
+        the response is dropped once that block is replaced by a reorg."""
+        with self._lock:
+            if block_number is not None and not self._is_final(block_number):
+                self._keys_by_block.setdefault(block_number, []).append(key)
+            self._entries[key] = response
+
+    def head(self, max_age: float) -> Optional[int]:
+        """Return the number of the latest block if it was seen within the
+        last ``max_age`` seconds."""
+        with self._lock:
+            if time.monotonic() - self._head_updated_at > max_age:
+                return None
+            return self._head
+
+    def missing_parent(self, block: Any) -> Optional[HexBytes]:
+        """Return the hash of the parent of ``block`` if the parent needs to
+        be added before ``block`` to check for a reorg. This is the case if
+        ``block`` skips blocks above the latest one, or if its parent was
+        replaced as well."""
+        number = _to_int(block["number"])
+        parent_hash = HexBytes(block["parentHash"])
+        with self._lock:
+            if self._head is None or number - self._head > REORG_DEPTH:
+                return None
+            if self._is_final(number - 1):
+                return None
+            known_parent_hash = self._hashes.get(number - 1)
+            if known_parent_hash is None:
+                needed = self._skips_blocks(number)
+            else:
+                needed = known_parent_hash != parent_hash
+            return parent_hash if needed else None
+
+    def add_block(self, block: Any, latest: bool = False) -> None:
+        """Take note of a block that was received from the RPC, possibly in
+        response to a request for the ``latest`` block.
+
+        If ``block`` skips blocks above the latest one, they need to be added
+        first, see :meth:`missing_parent`. Otherwise, a reorg cannot be ruled
+        out, so everything tied to blocks that are not final is dropped."""
+        number = _to_int(block["number"])
+        block_hash = HexBytes(block["hash"])
+        parent_hash = HexBytes(block["parentHash"])
+        with self._lock:
+            if self._is_final(number):
+                return
+
+            if self._skips_blocks(number):
+                self._drop_from(number - REORG_DEPTH)
+            known_hash = self._hashes.get(number)
+            if known_hash is not None and known_hash != block_hash:
+                self._drop_from(number)
+            known_parent_hash = self._hashes.get(number - 1)
+            if known_parent_hash is not None and known_parent_hash != parent_hash:
+                self._drop_from(number - 1)
+            self._hashes[number] = block_hash
+
+            if latest:
+                self._head_updated_at = time.monotonic()
+            if latest or self._head is None or number > self._head:
+                self._head = number
+                self._prune()
+
+    def _skips_blocks(self, block_number: int) -> bool:
+        return (
+            self._head is not None
+            and block_number > self._head + 1
+            and block_number - 1 not in self._hashes
+        )
+
+    def _is_final(self, block_number: int) -> bool:
+        return self._head is not None and block_number < self._head - REORG_DEPTH
+
+    def _drop_from(self, block_number: int) -> None:
+        """Drop everything tied to ``block_number`` and later blocks."""
+        for number in [number for number in self._keys_by_block if number >= block_number]:
+            for key in self._keys_by_block.pop(number):
+                if key in self._entries:
+                    del self._entries[key]
+        for number in [number for number in self._hashes if number >= block_number]:
+            del self._hashes[number]
+
+    def _prune(self) -> None:
+        for number in [number for number in self._hashes if self._is_final(number)]:
+            del self._hashes[number]
+        for number in [number for number in self._keys_by_block if self._is_final(number)]:
+            del self._keys_by_block[number]
+
+
+# The response caches of the chains, so that all Web3 instances of a chain
+# share the same cache.
+_CACHES: dict[ChainId, ResponseCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_response_cache(chain_id: ChainId, max_entries: int = DEFAULT_MAX_ENTRIES) -> ResponseCache:
+    """Return the response cache of ``chain_id``. The cache is created with
+    ``max_entries`` if it does not exist yet."""
+    with _CACHES_LOCK:
+        cache = _CACHES.get(chain_id)
+        if cache is None:
+            cache = _CACHES[chain_id] = ResponseCache(max_entries)
+        return cache
+
+
+def construct_response_cache_middleware(
+    max_entries: int = DEFAULT_MAX_ENTRIES, latest_max_age: Optional[float] = None
+) -> Middleware:
+    """Construct a middleware that caches responses in the response cache of
+    the Web3 instance's chain, see :class:`ResponseCache`.
+
+    The chain is taken from the response to the first ``eth_chainId``
+    request. Until then, nothing is cached.
+
+    Requests for the state at the latest block, e.g. ``eth_call`` with block
+    identifier ``latest``, are only cached if ``latest_max_age`` is given.
+    They are then treated like requests for the latest block that was seen
+    within the last ``latest_max_age`` seconds. If there is no such block,
+    the latest block is requested first.
+    """
+
+    def response_cache(
+        make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3
+    ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+        cache: Optional[ResponseCache] = None
+        chain_id = "unknown"
+
+        def request(method: RPCEndpoint, params: Any) -> RPCResponse:
+            response = make_request(method, params)
+            if cache is not None and method in _BLOCK_METHODS and _result_ok(response):
+                add_block(response["result"], latest=params[0] == "latest")
+            return response
+
+        def add_block(block: Any, latest: bool) -> None:
+            # Fetch the blocks skipped since the latest one, and the blocks
+            # replaced by a reorg, so that the reorg is noticed where it
+            # starts. They are added from the bottom, so that each one is
+            # checked against its parent.
+            assert cache is not None
+            ancestors = []
+            parent_hash = cache.missing_parent(block)
+            while parent_hash is not None:
+                response = make_request(
+                    RPCEndpoint("eth_getBlockByHash"), [HexStr(parent_hash.hex()), False]
+                )
+                if not _result_ok(response):
+                    break
+                ancestors.append(response["result"])
+                parent_hash = cache.missing_parent(response["result"])
+            for ancestor in reversed(ancestors):
+                cache.add_block(ancestor)
+            cache.add_block(block, latest=latest)
+
+        def latest_block_number() -> Optional[int]:
+            assert cache is not None and latest_max_age is not None
+            head = cache.head(latest_max_age)
+            if head is None:
+                request(RPCEndpoint("eth_getBlockByNumber"), ["latest", False])
+                head = cache.head(latest_max_age)
+            return head
+
+        def lookup(method: RPCEndpoint, params: Any) -> tuple[Optional[list[Any]], Optional[int]]:
+            """Return the parameters to cache the request under and the
+            block that the response is tied to, if any."""
+            if method in _IMMUTABLE_METHODS or method in _MINED_METHODS:
+                return list(params), None
+
+            index = _BLOCK_PARAMETERS.get(method)
+            if index is None:
+                return None, None
+            params = list(params)
+            block_identifier = params[index] if index < len(params) else "latest"
+            if isinstance(block_identifier, int):
+                return params, block_identifier
+            if isinstance(block_identifier, str) and block_identifier.startswith("0x"):
+                return params, int(block_identifier, 16)
+            if (
+                block_identifier == "latest"
+                and latest_max_age is not None
+                and method not in _HEAD_METHODS
+            ):
+                head = latest_block_number()
+                if head is not None:
+                    params[index:] = [hex(head)]
+                    return params, head
+            return None, None
+
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            nonlocal cache, chain_id
+            if cache is None:
+                response = make_request(method, params)
+                if method == "eth_chainId" and _result_ok(response):
+                    chain_id = str(_to_int(response["result"]))
+                    cache = get_response_cache(ChainId(int(chain_id)), max_entries)
+                    cache.put(generate_cache_key((method, list(params))), response)
+                return response
+
+            cache_params, block_number = lookup(method, params)
+            if cache_params is None:
+                return request(method, params)
+            try:
+                key = generate_cache_key((method, cache_params))
+            except TypeError:
+                return request(method, params)
+
+            cached = cache.get(key)
+            beamer.agent.metrics.record_rpc_cache_lookup(
+                chain_id, method, "response", hit=cached is not None
+            )
+            if cached is not None:
+                return cached
+
+            response = request(method, params)
+            if not _result_ok(response):
+                return response
+            if method in _MINED_METHODS:
+                block_number = response["result"].get("blockNumber")
+                if block_number is None:
+                    # The transaction is still pending.
+                    return response
+                block_number = _to_int(block_number)
+            cache.put(key, response, block_number)
+            return response
+
+        return middleware
+
+    return cast(Middleware, response_cache)
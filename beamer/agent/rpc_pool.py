@@ -0,0 +1,309 @@
+import functools
+import json
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+import requests.exceptions
+import structlog
+from web3._utils.request import make_post_request
+from web3.types import RPCEndpoint, RPCResponse
+
+import beamer.agent.metrics
+from beamer.agent.batching import BATCH_METHOD, BatchingHTTPProvider
+from beamer.agent.middleware import RateLimiterState, limit_rate
+from beamer.agent.typing import URL
+
+# The weight of the latest response time in an endpoint's latency average.
+LATENCY_SMOOTHING = 0.2
+
+# The time an endpoint is avoided for after it failed to respond, in seconds.
+FAILURE_COOLDOWN: float = 30
+
+# Requests for these methods are not sent to the fastest endpoint. Instead,
+# they are spread over the endpoints, so that e.g. the concurrent eth_getLogs
+# requests made while syncing are served by all endpoints at once.
+_SPREAD_METHODS = frozenset({RPCEndpoint("eth_getLogs")})
+
+# The responses to these methods tell us which blocks an endpoint has seen.
+_HEAD_METHODS = frozenset(
+    {
+        RPCEndpoint("eth_blockNumber"),
+        RPCEndpoint("eth_getBlockByNumber"),
+        RPCEndpoint("eth_getBlockByHash"),
+    }
+)
+
+
+@dataclass
+class _Endpoint:
+    uri: URL
+    # The endpoint as used in logs and metric labels. Since RPC URLs often
+    # contain API keys, only the host is included.
+    label: str
+    rate_limiter: RateLimiterState = field(default_factory=RateLimiterState)
+    # The moving average of the endpoint's response time, in seconds.
+    latency: Optional[float] = None
+    in_flight: int = 0
+    unhealthy_until: float = 0
+    # The highest block number the endpoint is known to have seen.
+    head: Optional[int] = None
+
+
+def _make_label(index: int, uri: URL) -> str:
+    return f"{index}:{urllib.parse.urlsplit(uri).hostname}"
+
+
+def _is_rate_limited(exc: requests.exceptions.RequestException) -> bool:
+    return (
+        isinstance(exc, requests.exceptions.HTTPError)
+        and exc.response is not None
+        and exc.response.status_code == 429
+    )
+
+
+def _get_to_block(params: Any) -> Optional[int]:
+    """Return the last block of an eth_getLogs request, if it is given by
+    number."""
+    try:
+        to_block = params[0].get("toBlock")
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return None
+    if isinstance(to_block, int):
+        return to_block
+    if isinstance(to_block, str) and to_block.startswith("0x"):
+        return int(to_block, 16)
+    return None
+
+
+def _get_head(method: RPCEndpoint, raw_response: bytes) -> Optional[int]:
+    """Return the block number contained in a response to one of the
+    :data:`_HEAD_METHODS`, if any."""
+    try:
+        result = json.loads(raw_response).get("result")
+        if method == "eth_blockNumber":
+            return int(result, 16)
+        return int(result["number"], 16)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _is_failure(exc: requests.exceptions.RequestException) -> bool:
+    """Whether ``exc`` means that the endpoint is not working properly, as
+    opposed to e.g. a request that takes too long to answer."""
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        return True
+    return (
+        isinstance(exc, requests.exceptions.HTTPError)
+        and exc.response is not None
+        and exc.response.status_code >= 500
+    )
+
+
+class RPCPool(BatchingHTTPProvider):
+    """An HTTP provider that spreads requests over several RPC endpoints of
+    the same chain.
+
+    Requests are sent to the fastest endpoint, as measured by a moving average
+    of its response times. ``eth_getLogs`` requests are sent to the endpoint
+    with the fewest requests in flight instead. Since an endpoint that lags
+    behind silently omits the logs of blocks it has not seen yet, they are
+    only sent to endpoints known to have seen the request's last block, as
+    told by their responses to block requests. If there is no such endpoint,
+    the request is sent to the first endpoint. If an endpoint fails to
+    respond, the request is sent to the next one and the failed endpoint is
+    avoided for :data:`FAILURE_COOLDOWN` seconds.
+
+    Each endpoint has its own rate limiter, see
+    :func:`beamer.agent.middleware.limit_rate`. Endpoints that currently rate
+    limit us are only used if no other endpoint is available.
+
+    The first endpoint is the provider's ``endpoint_uri``.
+    """
+
+    def __init__(self, endpoint_uris: Sequence[URL], request_kwargs: Optional[Any] = None):
+        assert endpoint_uris, "RPC pool without endpoints"
+        super().__init__(endpoint_uris[0], request_kwargs=request_kwargs)
+        self._endpoints = [
+            _Endpoint(uri=uri, label=_make_label(index, uri))
+            for index, uri in enumerate(endpoint_uris)
+        ]
+        # This lock protects the latency, in_flight, unhealthy_until and head
+        # fields of the endpoints.
+        self._lock = threading.Lock()
+        # The chain ID as a metric label. It is taken from the responses to
+        # eth_chainId requests, like the middlewares do.
+        self._chain_id = "unknown"
+        self._log = structlog.get_logger(type(self).__name__)
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method in _SPREAD_METHODS:
+            data = self.encode_rpc_request(method, params)
+            raw_response = self._post([method], data, min_head=_get_to_block(params))
+            response = self.decode_rpc_response(raw_response)
+        else:
+            response = super().make_request(method, params)
+        if method == "eth_chainId" and response.get("result") is not None:
+            self._chain_id = str(int(response["result"], 16))
+        return response
+
+    def _post(
+        self, methods: Sequence[RPCEndpoint], data: bytes, min_head: Optional[int] = None
+    ) -> bytes:
+        """Send ``data`` to the best endpoint. If ``min_head`` is given,
+        only endpoints that have seen that block are used."""
+        method = methods[0] if len(methods) == 1 else BATCH_METHOD
+        endpoints = self._rank(spread=all(name in _SPREAD_METHODS for name in methods))
+        if min_head is not None:
+            # Endpoints that did not answer block requests yet would never
+            # get requests that need a minimum head.
+            now = time.monotonic()
+            with self._lock:
+                unknown = [
+                    endpoint
+                    for endpoint in endpoints
+                    if endpoint.head is None and endpoint.unhealthy_until <= now
+                ]
+            for endpoint in unknown:
+                self._probe_head(endpoint)
+            with self._lock:
+                endpoints = [
+                    endpoint
+                    for endpoint in endpoints
+                    if endpoint.head is not None and endpoint.head >= min_head
+                ]
+            if self._endpoints[0] not in endpoints:
+                endpoints.append(self._endpoints[0])
+
+        for endpoint in endpoints[:-1]:
+            try:
+                raw_response = limit_rate(
+                    endpoint.rate_limiter,
+                    endpoint.label,
+                    self._chain_id,
+                    method,
+                    functools.partial(self._post_to, endpoint, data),
+                    retry=False,
+                )
+            except requests.exceptions.RequestException as exc:
+                if _is_rate_limited(exc):
+                    self._log.debug("RPC endpoint rate limited us", endpoint=endpoint.label)
+                elif _is_failure(exc):
+                    self._log.warning("RPC endpoint failed", endpoint=endpoint.label, exc=exc)
+                else:
+                    raise
+                beamer.agent.metrics.record_rpc_failover(self._chain_id, endpoint.label)
+            else:
+                self._update_head(endpoint, method, raw_response)
+                return raw_response
+            finally:
+                self._record(endpoint)
+
+        # This is our last resort, so wait for the rate limiter if needed.
+        endpoint = endpoints[-1]
+        try:
+            raw_response = limit_rate(
+                endpoint.rate_limiter,
+                endpoint.label,
+                self._chain_id,
+                method,
+                functools.partial(self._post_to, endpoint, data),
+            )
+        finally:
+            self._record(endpoint)
+        self._update_head(endpoint, method, raw_response)
+        return raw_response
+
+    def _probe_head(self, endpoint: _Endpoint) -> None:
+        method = RPCEndpoint("eth_blockNumber")
+        data = self.encode_rpc_request(method, [])
+        try:
+            raw_response = limit_rate(
+                endpoint.rate_limiter,
+                endpoint.label,
+                self._chain_id,
+                method,
+                functools.partial(self._post_to, endpoint, data),
+                retry=False,
+            )
+        except requests.exceptions.RequestException as exc:
+            self._log.debug("Failed to get the latest block", endpoint=endpoint.label, exc=exc)
+            return
+        finally:
+            self._record(endpoint)
+        self._update_head(endpoint, method, raw_response)
+
+    def _update_head(self, endpoint: _Endpoint, method: RPCEndpoint, raw_response: bytes) -> None:
+        if method not in _HEAD_METHODS:
+            return
+        head = _get_head(method, raw_response)
+        if head is None:
+            return
+        with self._lock:
+            if endpoint.head is None or head > endpoint.head:
+                endpoint.head = head
+
+    def _rank(self, spread: bool) -> list[_Endpoint]:
+        """Return the endpoints, ordered by preference."""
+        now = time.monotonic()
+
+        def key(endpoint: _Endpoint) -> tuple:
+            # Endpoints without a latency yet are tried first, so that all
+            # endpoints get measured.
+            latency = endpoint.latency or 0.0
+            load = (endpoint.in_flight, latency) if spread else (latency, endpoint.in_flight)
+            return endpoint.unhealthy_until > now, endpoint.rate_limiter.limited, load
+
+        with self._lock:
+            return sorted(self._endpoints, key=key)
+
+    def _post_to(self, endpoint: _Endpoint, data: bytes) -> bytes:
+        with self._lock:
+            endpoint.in_flight += 1
+        start = time.monotonic()
+        try:
+            raw_response = make_post_request(
+                endpoint.uri, data, **self.get_request_kwargs()  # type: ignore
+            )
+        except requests.exceptions.Timeout as exc:
+            # A timeout tells us about the endpoint's latency, too.
+            self._update(endpoint, time.monotonic() - start, failed=_is_failure(exc))
+            raise
+        except requests.exceptions.RequestException as exc:
+            self._update(endpoint, None, failed=_is_failure(exc))
+            raise
+        self._update(endpoint, time.monotonic() - start, failed=False, responded=True)
+        return raw_response
+
+    def _update(
+        self,
+        endpoint: _Endpoint,
+        duration: Optional[float],
+        failed: bool,
+        responded: bool = False,
+    ) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            if duration is not None:
+                if endpoint.latency is None:
+                    endpoint.latency = duration
+                else:
+                    endpoint.latency += LATENCY_SMOOTHING * (duration - endpoint.latency)
+            if failed:
+                endpoint.unhealthy_until = time.monotonic() + FAILURE_COOLDOWN
+            elif responded:
+                endpoint.unhealthy_until = 0
+
+    def _record(self, endpoint: _Endpoint) -> None:
+        with self._lock:
+            healthy = endpoint.unhealthy_until <= time.monotonic()
+            latency = endpoint.latency
+        beamer.agent.metrics.record_rpc_endpoint(
+            self._chain_id,
+            endpoint.label,
+            healthy=healthy,
+            rate_limited=endpoint.rate_limiter.limited,
+            latency=latency,
+        )
@@ -0,0 +1,97 @@
+import heapq
+from typing import Hashable, Optional
+
+from beamer.agent.typing import ChainId
+
+# The maximum time between two evaluations of all requests and claims, in
+# seconds. This is a safety net for inputs that are not tracked otherwise.
+FULL_SWEEP_PERIOD: float = 60
+
+
+class _Timers:
+    """A heap of keys that are due once some timestamp is reached."""
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, Hashable]] = []
+        self._entries: set[tuple[float, Hashable]] = set()
+
+    def add(self, timestamp: float, key: Hashable) -> None:
+        entry = (timestamp, key)
+        if entry not in self._entries:
+            self._entries.add(entry)
+            heapq.heappush(self._heap, entry)
+
+    def pop_due(self, timestamp: float) -> set[Hashable]:
+        due = set()
+        while self._heap and self._heap[0][0] <= timestamp:
+            entry = heapq.heappop(self._heap)
+            self._entries.discard(entry)
+            due.add(entry[1])
+        return due
+
+    @property
+    def next_timestamp(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+
+class ProcessingSchedule:
+    """Keeps track of the requests that need to be evaluated again.
+
+    Requests, together with their claims, are identified by their request ID.
+    A request is due when it was marked, e.g. because one of its events
+    changed its state, when a block whose timestamp reaches one of the
+    request's block deadlines arrives, or when one of its timers expires.
+    Timers and block deadlines are unix timestamps.
+
+    The schedule is only used by the thread of the event processor owning it.
+    """
+
+    def __init__(self, full_sweep_period: float = FULL_SWEEP_PERIOD):
+        self._full_sweep_period = full_sweep_period
+        self._last_full_sweep = 0.0
+        self._dirty: set[Hashable] = set()
+        self._timers = _Timers()
+        self._block_timers: dict[ChainId, _Timers] = {}
+
+    def mark(self, key: Hashable) -> None:
+        """Evaluate ``key`` again as soon as possible."""
+        self._dirty.add(key)
+
+    def wake_at(self, timestamp: float, key: Hashable) -> None:
+        """Evaluate ``key`` again once the wall clock reaches ``timestamp``."""
+        self._timers.add(timestamp, key)
+
+    def wake_on_block(self, chain_id: ChainId, key: Hashable, timestamp: float = 0) -> None:
+        """Evaluate ``key`` again once a block of ``chain_id`` with a
+        timestamp of at least ``timestamp`` arrives. By default, that is
+        the next block."""
+        self._block_timers.setdefault(chain_id, _Timers()).add(timestamp, key)
+
+    def block_updated(self, chain_id: ChainId, timestamp: float) -> None:
+        block_timers = self._block_timers.get(chain_id)
+        if block_timers is not None:
+            self._dirty.update(block_timers.pop_due(timestamp))
+
+    def take_due(self, now: float) -> Optional[set[Hashable]]:
+        """Return the keys that are due at time ``now`` and forget about
+        them. ``None`` means that everything is due."""
+        self._dirty.update(self._timers.pop_due(now))
+        if now - self._last_full_sweep >= self._full_sweep_period:
+            self._last_full_sweep = now
+            self._dirty.clear()
+            return None
+
+        due = self._dirty
+        self._dirty = set()
+        return due
+
+    def seconds_until_due(self, now: float) -> float:
+        """Return the time until something is due, assuming that nothing
+        gets marked in the meantime."""
+        if self._dirty:
+            return 0
+        next_timestamp = self._last_full_sweep + self._full_sweep_period
+        timer = self._timers.next_timestamp
+        if timer is not None:
+            next_timestamp = min(next_timestamp, timer)
+        return max(0, next_timestamp - now)
@@ -0,0 +1,195 @@
+from typing import Any, Optional
+
+from eth_typing import ChecksumAddress
+from hexbytes import HexBytes
+from web3.types import Timestamp
+
+from beamer.agent.events import (
+    ClaimMade,
+    Event,
+    InitiateL1InvalidationEvent,
+    InitiateL1ResolutionEvent,
+    LatestBlockUpdatedEvent,
+)
+from beamer.agent.models.claim import Claim
+from beamer.agent.models.request import Request
+from beamer.agent.state_machine import Context
+from beamer.agent.storage import decode_event, encode_event
+from beamer.agent.typing import BlockNumber, ChainId, FillId, RequestId
+
+# Bump this whenever the snapshot format changes in an incompatible way.
+# Snapshots with a different version are ignored and the agent syncs
+# from the events instead.
+SNAPSHOT_VERSION = 1
+
+
+def _hex(value: Optional[bytes]) -> Optional[str]:
+    return None if value is None else HexBytes(value).hex()
+
+
+def snapshot_request(request: Request) -> dict[str, Any]:
+    return dict(
+        state=request.current_state_value,
+        id=_hex(request.id),
+        source_chain_id=request.source_chain_id,
+        target_chain_id=request.target_chain_id,
+        source_token_address=request.source_token_address,
+        target_token_address=request.target_token_address,
+        target_address=request.target_address,
+        amount=request.amount,
+        nonce=request.nonce,
+        valid_until=request.valid_until,
+        filler=request.filler,
+        fill_tx=_hex(request.fill_tx),
+        fill_timestamp=request.fill_timestamp,
+        fill_id=_hex(request.fill_id),
+        invalid_fill_ids=[
+            (_hex(fill_id), _hex(tx_hash), timestamp)
+            for fill_id, (tx_hash, timestamp) in request.invalid_fill_ids.items()
+        ],
+        l1_resolution_filler=request.l1_resolution_filler,
+        l1_resolution_fill_id=_hex(request.l1_resolution_fill_id),
+        l1_resolution_invalid_fill_ids=[
+            _hex(fill_id) for fill_id in request.l1_resolution_invalid_fill_ids
+        ],
+    )
+
+
+def restore_request(data: dict[str, Any]) -> Request:
+    request = Request(
+        request_id=RequestId(HexBytes(data["id"])),
+        source_chain_id=ChainId(data["source_chain_id"]),
+        target_chain_id=ChainId(data["target_chain_id"]),
+        source_token_address=data["source_token_address"],
+        target_token_address=data["target_token_address"],
+        target_address=data["target_address"],
+        amount=data["amount"],
+        nonce=data["nonce"],
+        valid_until=data["valid_until"],
+    )
+    request.filler = data["filler"]
+    if data["fill_tx"] is not None:
+        request.fill_tx = HexBytes(data["fill_tx"])
+    if data["fill_timestamp"] is not None:
+        request.fill_timestamp = Timestamp(data["fill_timestamp"])
+    if data["fill_id"] is not None:
+        request.fill_id = FillId(HexBytes(data["fill_id"]))
+    request.invalid_fill_ids = {
+        FillId(HexBytes(fill_id)): (HexBytes(tx_hash), timestamp)
+        for fill_id, tx_hash, timestamp in data["invalid_fill_ids"]
+    }
+    request.l1_resolution_filler = data["l1_resolution_filler"]
+    if data["l1_resolution_fill_id"] is not None:
+        request.l1_resolution_fill_id = FillId(HexBytes(data["l1_resolution_fill_id"]))
+    request.l1_resolution_invalid_fill_ids = {
+        FillId(HexBytes(fill_id)) for fill_id in data["l1_resolution_invalid_fill_ids"]
+    }
+    # Set the state directly, without going through transitions, as the
+    # state machine callbacks were already run before the snapshot was taken.
+    request.current_state_value = data["state"]
+    return request
+
+
+def snapshot_claim(claim: Claim) -> dict[str, Any]:
+    return dict(
+        state=claim.current_state_value,
+        latest_claim_made=encode_event(claim.latest_claim_made),
+        challenge_back_off_timestamp=claim.challenge_back_off_timestamp,
+        challenger_stakes=claim.challenger_stakes,
+        invalidation_tx=_hex(claim.invalidation_tx),
+        invalidation_timestamp=claim.invalidation_timestamp,
+        unprocessed_claim_made_events=[
+            encode_event(event) for event in claim.unprocessed_claim_made_events
+        ],
+    )
+
+
+def _decode_claim_made(data: dict[str, Any]) -> ClaimMade:
+    event = decode_event(data)
+    assert isinstance(event, ClaimMade)
+    return event
+
+
+def restore_claim(data: dict[str, Any]) -> Claim:
+    claim = Claim(
+        _decode_claim_made(data["latest_claim_made"]), data["challenge_back_off_timestamp"]
+    )
+    for challenger, stake in data["challenger_stakes"].items():
+        claim.add_challenger_stake(ChecksumAddress(challenger), stake)
+    if data["invalidation_tx"] is not None:
+        claim.invalidation_tx = HexBytes(data["invalidation_tx"])
+    if data["invalidation_timestamp"] is not None:
+        claim.invalidation_timestamp = Timestamp(data["invalidation_timestamp"])
+    claim.unprocessed_claim_made_events = {
+        _decode_claim_made(event) for event in data["unprocessed_claim_made_events"]
+    }
+    claim.current_state_value = data["state"]
+    return claim
+
+
+def snapshot_context(
+    context: Context, events: list[Event], synced_blocks: dict[ChainId, BlockNumber]
+) -> dict[str, Any]:
+    """Return a JSON-serializable snapshot of the context's requests and claims.
+
+    ``events`` are the events that were delivered, but not yet processed and
+    ``synced_blocks`` holds, for each chain, the block up to which events were
+    delivered to the context's event processor."""
+    # L1 resolutions that are still running will not survive a restart.
+    # Record events that will start them again once the snapshot is restored.
+    events = list(events)
+    for claim in context.claims:
+        if claim.request_id in context.l1_resolutions:
+            events.append(
+                InitiateL1ResolutionEvent(
+                    chain_id=context.target_chain_id,
+                    request_id=claim.request_id,
+                    claim_id=claim.id,
+                )
+            )
+        if claim.id in context.l1_invalidations:
+            events.append(
+                InitiateL1InvalidationEvent(chain_id=context.target_chain_id, claim_id=claim.id)
+            )
+
+    return dict(
+        version=SNAPSHOT_VERSION,
+        synced_blocks=list(synced_blocks.items()),
+        finality_periods=list(context.finality_periods.items()),
+        requests=[snapshot_request(request) for request in context.requests],
+        claims=[snapshot_claim(claim) for claim in context.claims],
+        # Latest block events are not stored since the block data will be
+        # refreshed by the event monitors anyway.
+        events=[
+            encode_event(event)
+            for event in events
+            if not isinstance(event, LatestBlockUpdatedEvent)
+        ],
+    )
+
+
+def restore_context(
+    context: Context, data: dict[str, Any]
+) -> Optional[tuple[list[Event], dict[ChainId, BlockNumber]]]:
+    """Restore requests and claims from the snapshot ``data`` into ``context``.
+
+    Returns the unprocessed events and synced blocks, as given to
+    :func:`snapshot_context`, or None if the snapshot cannot be used."""
+    if data.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    for chain_id, finality_period in data["finality_periods"]:
+        context.finality_periods[ChainId(chain_id)] = finality_period
+    for request_data in data["requests"]:
+        request = restore_request(request_data)
+        context.requests.add(request.id, request)
+    for claim_data in data["claims"]:
+        claim = restore_claim(claim_data)
+        context.claims.add(claim.id, claim)
+
+    events = [decode_event(event) for event in data["events"]]
+    synced_blocks = {
+        ChainId(chain_id): BlockNumber(block_number)
+        for chain_id, block_number in data["synced_blocks"]
+    }
+    return events, synced_blocks
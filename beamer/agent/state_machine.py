@@ -1,6 +1,6 @@
 import os
 import time
-from concurrent.futures import Executor, Future
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from typing import Optional, cast
 
@@ -32,22 +32,23 @@ from beamer.agent.events import (
     SourceChainEvent,
     TargetChainEvent,
 )
-
-from beamer.agent.l1_resolution import run_relayer_for_tx
+from beamer.agent.l1_resolution import RelayerScheduler, run_relayer_for_tx
 from beamer.agent.models.claim import Claim
 from beamer.agent.models.request import Request
-from beamer.agent.tracker import Tracker
+from beamer.agent.multicall import CallAggregator
+from beamer.agent.schedule import ProcessingSchedule
+from beamer.agent.tracker import ClaimTracker, Tracker
+from beamer.agent.transactions import CompletionQueue, TransactionManager
 from beamer.agent.typing import URL, ChainId, ClaimId, FillId, RequestId
 from beamer.agent.util import TokenChecker
 
-
 log = structlog.get_logger(__name__)
 
 
 @dataclass
 class Context:
     requests: Tracker[RequestId, Request]
-    claims: Tracker[ClaimId, Claim]
+    claims: ClaimTracker
     source_chain_id: ChainId
     target_chain_id: ChainId
     request_manager: Contract
@@ -57,12 +58,16 @@ class Context:
     latest_blocks: dict[ChainId, BlockData]
     config: Config
     web3_l1: Web3
-    task_pool: Executor
+    task_pool: RelayerScheduler
     claim_request_extension: int
     l1_resolutions: dict[RequestId, Future]
     l1_invalidations: dict[ClaimId, Future]
     logger: structlog.BoundLogger
     finality_periods: dict[ChainId, int] = field(default_factory=dict)
+    call_aggregators: dict[ChainId, CallAggregator] = field(default_factory=dict)
+    transaction_managers: dict[ChainId, TransactionManager] = field(default_factory=dict)
+    completions: CompletionQueue = field(default_factory=CompletionQueue)
+    schedule: ProcessingSchedule = field(default_factory=ProcessingSchedule)
 
     @property
     def source_rpc_url(self) -> URL:
@@ -130,12 +135,14 @@ def _find_claims(context: Context, request_id: RequestId, fill_id: FillId) -> li
     """
     This returns a list with matching request ID and fill ID, as there can be multiple claims
     """
-    matching_claims = []
-    for claim in context.claims:
-        if claim.request_id == request_id and claim.fill_id == fill_id:
-            matching_claims.append(claim)
+    return context.claims.find(request_id, fill_id)
+
 
-    return matching_claims
+def _get_block_timestamp(event: RequestFilled | FillInvalidated, context: Context) -> Timestamp:
+    if event.block_timestamp is not None:
+        return event.block_timestamp
+    block = context.fill_manager.web3.eth.get_block(event.block_number)
+    return block.timestamp  # type: ignore
 
 
 def _invalidation_ready_for_l1_relay(claim: Claim) -> bool:
@@ -174,6 +181,7 @@ def _handle_latest_block_updated(
     event: LatestBlockUpdatedEvent, context: Context
 ) -> HandlerResult:
     context.latest_blocks[event.chain_id] = event.block_data
+    context.schedule.block_updated(event.chain_id, event.block_data["timestamp"])
     return True, None
 
 
@@ -248,12 +256,11 @@ def _handle_request_filled(event: RequestFilled, context: Context) -> HandlerRes
         return True, None
 
     try:
-        fill_block = context.fill_manager.web3.eth.get_block(event.block_number)
         request.fill(
             filler=event.filler,
             fill_tx=event.tx_hash,
             fill_id=event.fill_id,
-            fill_timestamp=fill_block.timestamp,  # type: ignore
+            fill_timestamp=_get_block_timestamp(event, context),
         )
     except TransitionNotAllowed:
         return False, None
@@ -389,8 +396,7 @@ def _handle_request_resolved(event: RequestResolved, context: Context) -> Handle
 
 
 def _handle_fill_invalidated(event: FillInvalidated, context: Context) -> HandlerResult:
-    fill_block = context.fill_manager.web3.eth.get_block(event.block_number)
-    timestamp = fill_block.timestamp  # type: ignore
+    timestamp = _get_block_timestamp(event, context)
     request = context.requests.get(event.request_id)
 
     if request is not None:
@@ -474,6 +480,7 @@ def _handle_initiate_l1_resolution(
             context.source_rpc_url,
             context.config.account.key,
             request.fill_tx,
+            lane=request.target_chain_id,
         )
 
         def on_future_done(f: Future) -> None:
@@ -528,6 +535,7 @@ def _handle_initiate_l1_invalidation(
             context.source_rpc_url,
             context.config.account.key,
             claim.invalidation_tx,
+            lane=request.target_chain_id,
         )
 
         def on_future_done(f: Future) -> None:
@@ -0,0 +1,198 @@
+import dataclasses
+import json
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import structlog
+from hexbytes import HexBytes
+from web3.types import Timestamp
+
+from beamer.agent.events import (
+    _EVENT_TYPES,
+    Event,
+    InitiateL1InvalidationEvent,
+    InitiateL1ResolutionEvent,
+    TxEvent,
+)
+from beamer.agent.typing import BlockNumber, ChainId, ChecksumAddress
+
+log = structlog.get_logger(__name__)
+
+# The number of blocks below the latest synced block that we consider safe
+# from reorgs. Events newer than that are stored, but not trusted on restart:
+# they are dropped and fetched again from the RPC.
+REORG_SAFETY_DEPTH = 64
+
+# Besides the contract events, the agent's own events can be stored as well
+# since they may be part of a snapshot.
+_STORED_EVENT_TYPES = dict(
+    _EVENT_TYPES,
+    InitiateL1ResolutionEvent=InitiateL1ResolutionEvent,
+    InitiateL1InvalidationEvent=InitiateL1InvalidationEvent,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    key TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_key_block ON events (key, block_number);
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS block_timestamps (
+    chain_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (chain_id, block_number)
+) WITHOUT ROWID;
+"""
+
+
+def encode_event(event: Event) -> dict[str, Any]:
+    data: dict[str, Any] = {"type": type(event).__name__}
+    for field in dataclasses.fields(event):
+        value = getattr(event, field.name)
+        if isinstance(value, bytes):
+            value = HexBytes(value).hex()
+        data[field.name] = value
+    return data
+
+
+def decode_event(data: dict[str, Any]) -> Event:
+    data = dict(data)
+    event_type = _STORED_EVENT_TYPES[data.pop("type")]
+    kwargs = {}
+    for field in dataclasses.fields(event_type):
+        # Fields added later with a default may be missing in older data.
+        if field.name not in data and field.default is not dataclasses.MISSING:
+            continue
+        value = data[field.name]
+        if isinstance(field.type, type) and issubclass(field.type, bytes):
+            value = field.type(HexBytes(value))
+        elif isinstance(value, str):
+            # Mostly addresses, which many events share.
+            value = sys.intern(value)
+        kwargs[field.name] = value
+    return event_type(**kwargs)
+
+
+def make_event_key(chain_id: ChainId, addresses: Iterable[ChecksumAddress]) -> str:
+    """Returns the key under which events of the given contracts are stored."""
+    return "%d:%s" % (chain_id, ",".join(sorted(addresses)))
+
+
+class EventStore:
+    """An on-disk store of decoded contract events and agent state snapshots.
+
+    For each chain and set of contracts, the store keeps the events fetched so
+    far together with a checkpoint, the highest block whose events are known to
+    be complete and not subject to reorgs. Upon loading, events beyond the
+    checkpoint are discarded so that the caller refetches them.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def load(self, key: str) -> tuple[Optional[BlockNumber], list[Event]]:
+        """Return the checkpoint and all events up to and including it."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            row = self._db.execute(
+                "SELECT block_number FROM checkpoints WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._db.execute("DELETE FROM events WHERE key = ?", (key,))
+                return None, []
+
+            checkpoint = BlockNumber(row[0])
+            self._db.execute(
+                "DELETE FROM events WHERE key = ? AND block_number > ?", (key, checkpoint)
+            )
+            rows = self._db.execute(
+                "SELECT data FROM events WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+
+        events = [decode_event(json.loads(data)) for data, in rows]
+        log.debug("Loaded events", key=key, checkpoint=checkpoint, num_events=len(events))
+        return checkpoint, events
+
+    def update(self, key: str, events: list[Event], synced_block: BlockNumber) -> None:
+        """Append ``events`` and move the checkpoint, which trails ``synced_block``
+        by ``REORG_SAFETY_DEPTH`` blocks."""
+        rows = [
+            (key, event.block_number, json.dumps(encode_event(event)))
+            for event in events
+            if isinstance(event, TxEvent)
+        ]
+        checkpoint = synced_block - REORG_SAFETY_DEPTH
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO events (key, block_number, data) VALUES (?, ?, ?)", rows
+            )
+            if checkpoint >= 0:
+                self._db.execute(
+                    "INSERT INTO checkpoints (key, block_number) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET block_number = "
+                    "max(block_number, excluded.block_number)",
+                    (key, checkpoint),
+                )
+
+    def load_snapshot(self, key: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM snapshots WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def store_snapshot(self, key: str, data: dict[str, Any]) -> None:
+        encoded = json.dumps(data)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshots (key, data) VALUES (?, ?)", (key, encoded)
+            )
+
+    def load_block_timestamps(
+        self, chain_id: ChainId, block_numbers: Iterable[BlockNumber]
+    ) -> dict[BlockNumber, Timestamp]:
+        block_numbers = list(block_numbers)
+        result: dict[BlockNumber, Timestamp] = {}
+        with self._lock:
+            # Stay well below SQLite's limit on the number of query parameters.
+            for start in range(0, len(block_numbers), 500):
+                end = start + 500
+                chunk = block_numbers[start:end]
+                rows = self._db.execute(
+                    "SELECT block_number, timestamp FROM block_timestamps "
+                    "WHERE chain_id = ? AND block_number IN (%s)" % ",".join("?" * len(chunk)),
+                    (chain_id, *chunk),
+                ).fetchall()
+                result.update((BlockNumber(number), Timestamp(ts)) for number, ts in rows)
+        return result
+
+    def store_block_timestamps(
+        self, chain_id: ChainId, timestamps: dict[BlockNumber, Timestamp]
+    ) -> None:
+        rows = [(chain_id, number, ts) for number, ts in timestamps.items()]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO block_timestamps (chain_id, block_number, timestamp) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
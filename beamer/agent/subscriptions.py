@@ -0,0 +1,199 @@
+import asyncio
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence, cast
+
+import aiohttp
+import structlog
+from web3._utils.method_formatters import block_formatter, log_entry_formatter
+from web3.datastructures import AttributeDict
+from web3.types import BlockData, ChecksumAddress, LogReceipt
+
+from beamer.agent.typing import URL
+from beamer.agent.util import wrap_thread_func
+
+# The time to wait before reconnecting after the connection was lost, in seconds.
+RECONNECT_PERIOD: float = 5
+
+# The interval of WebSocket pings, in seconds. A connection is considered
+# lost if a ping is not answered within half of that.
+HEARTBEAT_PERIOD: float = 30
+
+# The time we're waiting for our thread in stop(), in seconds.
+_STOP_TIMEOUT = 2
+
+_NEW_HEADS = 1
+_LOGS = 2
+
+_CLOSE_MESSAGE_TYPES = (
+    aiohttp.WSMsgType.CLOSE,
+    aiohttp.WSMsgType.CLOSING,
+    aiohttp.WSMsgType.CLOSED,
+    aiohttp.WSMsgType.ERROR,
+)
+
+
+@dataclass
+class Notifications:
+    # Set if the subscriptions were (re)established since the previous
+    # notifications were taken. Notifications may have been missed before.
+    reconnected: bool
+    heads: list[BlockData]
+    logs: list[LogReceipt]
+
+
+class SubscriptionListener:
+    """Receives new blocks and the logs of some contracts via ``eth_subscribe``.
+
+    The listener keeps a WebSocket connection to the chain's node and
+    subscribes to ``newHeads`` and to ``logs`` of the given addresses. The
+    received notifications are collected until they are taken via
+    :meth:`take`. If the connection drops, the listener keeps reconnecting
+    every ``reconnect_period`` seconds. Notifications sent in the meantime
+    are lost, which is indicated by :attr:`Notifications.reconnected` once
+    the subscriptions are back.
+    """
+
+    def __init__(
+        self,
+        url: URL,
+        addresses: Sequence[ChecksumAddress],
+        reconnect_period: float = RECONNECT_PERIOD,
+    ):
+        self._url = url
+        self._addresses = list(addresses)
+        self._reconnect_period = reconnect_period
+        # This lock protects the following objects:
+        #   - self._connected
+        #   - self._reconnected
+        #   - self._heads
+        #   - self._logs
+        self._lock = threading.Lock()
+        self._connected = False
+        self._reconnected = False
+        self._heads: list[BlockData] = []
+        self._logs: list[LogReceipt] = []
+        self._have_notifications = threading.Event()
+        self._stop = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._log = structlog.get_logger(type(self).__name__).bind(url=url)
+
+    @property
+    def connected(self) -> bool:
+        with self._lock:
+            return self._connected
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            name=f"SubscriptionListener[{self._url}]", target=wrap_thread_func(self._thread_func)
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop = True
+        self._have_notifications.set()
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(_STOP_TIMEOUT)
+
+    def take(self, timeout: float) -> Optional[Notifications]:
+        """Wait up to ``timeout`` seconds for notifications and return them.
+
+        Returns None if there were no notifications in the meantime.
+        """
+        self._have_notifications.wait(timeout)
+        with self._lock:
+            self._have_notifications.clear()
+            if not (self._reconnected or self._heads or self._logs):
+                return None
+            notifications = Notifications(
+                reconnected=self._reconnected, heads=self._heads, logs=self._logs
+            )
+            self._reconnected = False
+            self._heads = []
+            self._logs = []
+        return notifications
+
+    def _thread_func(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._run())
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _run(self) -> None:
+        async with aiohttp.ClientSession() as session:
+            while not self._stop:
+                try:
+                    async with session.ws_connect(self._url, heartbeat=HEARTBEAT_PERIOD) as ws:
+                        await self._listen(ws)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as exc:
+                    self._log.warning("Subscription connection failed", exc=exc)
+                except Exception as exc:  # pylint:disable=broad-except
+                    # E.g. an error response or a malformed notification.
+                    # Reconnecting makes the event monitor catch up on what
+                    # we missed.
+                    self._log.error("Subscription failed", exc=exc)
+
+                with self._lock:
+                    self._connected = False
+                if not self._stop:
+                    self._log.warning("Subscription connection lost")
+                    await asyncio.sleep(self._reconnect_period)
+
+    async def _listen(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        await ws.send_str(_make_request(_NEW_HEADS, "eth_subscribe", ["newHeads"]))
+        await ws.send_str(
+            _make_request(_LOGS, "eth_subscribe", ["logs", {"address": self._addresses}])
+        )
+
+        # Maps subscription IDs to the IDs of the requests that created them.
+        subscriptions: dict[str, int] = {}
+        while True:
+            message = await ws.receive()
+            if message.type in _CLOSE_MESSAGE_TYPES:
+                return
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data)
+            if "id" in data:
+                if data.get("result") is None:
+                    raise ValueError(data.get("error", "no subscription ID"))
+                subscriptions[data["result"]] = data["id"]
+                if len(subscriptions) == 2:
+                    self._log.info("Subscribed", addresses=self._addresses)
+                    with self._lock:
+                        self._connected = True
+                        self._reconnected = True
+                    self._have_notifications.set()
+            elif data.get("method") == "eth_subscription":
+                params: dict[str, Any] = data.get("params") or {}
+                kind = subscriptions.get(params.get("subscription", ""))
+                self._add_notification(kind, params.get("result"))
+
+    def _add_notification(self, kind: Optional[int], result: Any) -> None:
+        if result is None:
+            raise ValueError("notification without result")
+        with self._lock:
+            if kind == _NEW_HEADS:
+                self._heads.append(
+                    cast(BlockData, AttributeDict.recursive(block_formatter(result)))
+                )
+            elif kind == _LOGS:
+                self._logs.append(
+                    cast(LogReceipt, AttributeDict.recursive(log_entry_formatter(result)))
+                )
+            else:
+                return
+        self._have_notifications.set()
+
+
+def _make_request(request_id: int, method: str, params: list[Any]) -> str:
+    return json.dumps(dict(jsonrpc="2.0", id=request_id, method=method, params=params))
@@ -1,5 +1,8 @@
 import threading
-from typing import Any, Generator, Generic, Optional, TypeVar
+from typing import Any, Callable, Generator, Generic, Optional, TypeVar
+
+from beamer.agent.models.claim import Claim
+from beamer.agent.typing import ClaimId, FillId, RequestId
 
 K = TypeVar("K")
 V = TypeVar("V")
@@ -9,6 +12,18 @@ class Tracker(Generic[K, V]):
     def __init__(self) -> None:
         self._lock = threading.Lock()
         self._map: dict[K, V] = {}
+        self._remove_listeners: list[Callable[[K], None]] = []
+
+    def add_remove_listener(self, listener: Callable[[K], None]) -> None:
+        """Call ``listener`` with the key of every value removed from now on."""
+        with self._lock:
+            self._remove_listeners.append(listener)
+
+    def _notify_removed(self, key: K) -> None:
+        with self._lock:
+            listeners = self._remove_listeners[:]
+        for listener in listeners:
+            listener(key)
 
     def add(self, key: K, value: V) -> None:
         with self._lock:
@@ -17,6 +32,7 @@ class Tracker(Generic[K, V]):
     def remove(self, key: K) -> None:
         with self._lock:
             del self._map[key]
+        self._notify_removed(key)
 
     def __contains__(self, key: K) -> bool:
         with self._lock:
@@ -40,3 +56,47 @@ class Tracker(Generic[K, V]):
     def __len__(self) -> int:
         with self._lock:
             return len(self._map)
+
+
+class ClaimTracker(Tracker[ClaimId, Claim]):
+    """A tracker for claims that also indexes them by request ID and fill ID."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._index: dict[RequestId, dict[FillId, dict[ClaimId, Claim]]] = {}
+
+    def add(self, key: ClaimId, value: Claim) -> None:
+        with self._lock:
+            old_value = self._map.get(key)
+            if old_value is not None:
+                self._unindex(key, old_value)
+            self._map[key] = value
+            fills = self._index.setdefault(value.request_id, {})
+            fills.setdefault(value.fill_id, {})[key] = value
+
+    def remove(self, key: ClaimId) -> None:
+        with self._lock:
+            self._unindex(key, self._map.pop(key))
+        self._notify_removed(key)
+
+    def _unindex(self, key: ClaimId, value: Claim) -> None:
+        fills = self._index[value.request_id]
+        claims = fills[value.fill_id]
+        del claims[key]
+        if not claims:
+            del fills[value.fill_id]
+        if not fills:
+            del self._index[value.request_id]
+
+    def has_claims(self, request_id: RequestId) -> bool:
+        with self._lock:
+            return request_id in self._index
+
+    def for_request(self, request_id: RequestId) -> list[Claim]:
+        with self._lock:
+            fills = self._index.get(request_id, {})
+            return [claim for claims in fills.values() for claim in claims.values()]
+
+    def find(self, request_id: RequestId, fill_id: FillId) -> list[Claim]:
+        with self._lock:
+            return list(self._index.get(request_id, {}).get(fill_id, {}).values())
@@ -0,0 +1,225 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, cast
+
+import requests.exceptions
+import structlog
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.contract import ContractFunction
+from web3.exceptions import ContractLogicError, TransactionNotFound
+from web3.types import Nonce, TxParams, TxReceipt
+
+from beamer.agent.typing import ChainId
+from beamer.agent.util import TransactionFailed, wrap_thread_func
+
+# Called with the receipt if the transaction succeeded,
+# otherwise with the reason of the failure.
+_DoneCallback = Callable[[Optional[TxReceipt], Optional[TransactionFailed]], None]
+
+# The time we're waiting for our thread in stop(), in seconds.
+_STOP_TIMEOUT = 2
+
+
+# Parts of the error messages of nodes that reject a transaction because its
+# nonce is out of sync with the chain.
+_NONCE_ERRORS = ("nonce too low", "replacement transaction underpriced", "already known")
+
+
+def _is_nonce_error(exc: ValueError) -> bool:
+    message = exc.args[0] if exc.args else ""
+    if isinstance(message, dict):
+        message = message.get("message", "")
+    return any(error in str(message).lower() for error in _NONCE_ERRORS)
+
+
+@dataclass
+class _PendingTransaction:
+    txn_hash: HexBytes
+    nonce: Nonce
+    deadline: float
+    on_done: _DoneCallback
+
+
+class TransactionManager:
+    """Sends the transactions of the web3 default account on one chain.
+
+    Nonces are assigned locally, so transactions can be sent back to back
+    without waiting for the previous ones to be mined. Receipts are polled for
+    by a background thread, which reports the outcome of each transaction via
+    the callback passed to :meth:`submit`.
+    """
+
+    def __init__(self, web3: Web3, timeout: float = 120, poll_period: float = 0.5):
+        self._web3 = web3
+        self._timeout = timeout
+        self._poll_period = poll_period
+        self._chain_id = ChainId(web3.eth.chain_id)
+        # This lock protects the following objects:
+        #   - self._nonce
+        #   - self._pending
+        self._lock = threading.Lock()
+        self._nonce: Optional[Nonce] = None
+        self._pending: list[_PendingTransaction] = []
+        self._have_pending = threading.Event()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            name=f"TransactionManager[cid={self._chain_id}]",
+            target=wrap_thread_func(self._thread_func),
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop = True
+        self._have_pending.set()
+        if self._thread is not None:
+            self._thread.join(_STOP_TIMEOUT)
+
+    def submit(self, func: ContractFunction, on_done: _DoneCallback, **kwargs: Any) -> HexBytes:
+        """Send a transaction calling ``func`` and return its hash.
+
+        ``on_done`` is called from the manager's thread once the transaction
+        was mined or timed out. If the transaction cannot be sent at all,
+        :class:`~beamer.agent.util.TransactionFailed` is raised instead.
+        """
+        with self._lock:
+            try:
+                txn_hash = self._transact(func, kwargs)
+            except (ValueError, ContractLogicError, requests.exceptions.RequestException) as exc:
+                # The nonce was not used, but it may also be out of sync with
+                # the chain. Fetch it again for the next transaction.
+                self._nonce = None
+                raise TransactionFailed() from exc
+
+            assert self._nonce is not None
+            pending = _PendingTransaction(
+                txn_hash=HexBytes(txn_hash),
+                nonce=self._nonce,
+                deadline=time.monotonic() + self._timeout,
+                on_done=on_done,
+            )
+            self._pending.append(pending)
+            self._nonce = Nonce(self._nonce + 1)
+
+        self._log.debug("Sent transaction", txn_hash=pending.txn_hash.hex(), nonce=pending.nonce)
+        self._have_pending.set()
+        return pending.txn_hash
+
+    def _transact(self, func: ContractFunction, kwargs: dict[str, Any]) -> HexBytes:
+        """Send the transaction with our next nonce. The lock must be held."""
+        address = self._web3.eth.default_account
+        if self._nonce is None:
+            self._nonce = self._web3.eth.get_transaction_count(address, "pending")
+        try:
+            return func.transact(cast(TxParams, dict(kwargs, nonce=self._nonce)))
+        except ContractLogicError:
+            raise
+        except ValueError as exc:
+            if not _is_nonce_error(exc):
+                raise
+            # Our nonce is out of sync with the chain, e.g. because of a
+            # transaction sent by someone else. Fetch the nonce again and
+            # retry once.
+            nonce = self._web3.eth.get_transaction_count(address, "pending")
+            self._log.warning("Resyncing nonce", old_nonce=self._nonce, nonce=nonce, exc=exc)
+            self._nonce = nonce
+            return func.transact(cast(TxParams, dict(kwargs, nonce=self._nonce)))
+
+    def transact(self, func: ContractFunction, **kwargs: Any) -> TxReceipt:
+        """Send a transaction calling ``func`` and wait for its receipt.
+
+        This is for transactions whose effects are needed right away. The
+        nonce is still assigned by the manager, so transactions submitted
+        concurrently do not conflict with it.
+        """
+        done = threading.Event()
+        result: list[Any] = []
+
+        def on_done(receipt: Optional[TxReceipt], exc: Optional[TransactionFailed]) -> None:
+            result.extend((receipt, exc))
+            done.set()
+
+        self.submit(func, on_done, **kwargs)
+        if not done.wait(self._timeout + _STOP_TIMEOUT):
+            raise TransactionFailed("timed out waiting for receipt")
+        receipt, exc = result
+        if exc is not None:
+            raise exc
+        return receipt
+
+    def _thread_func(self) -> None:
+        while not self._stop:
+            self._have_pending.wait(self._poll_period)
+            self._have_pending.clear()
+            self._check_receipts()
+
+    def _check_receipts(self) -> None:
+        with self._lock:
+            pending = self._pending[:]
+
+        for txn in pending:
+            try:
+                receipt: Optional[TxReceipt] = self._web3.eth.get_transaction_receipt(txn.txn_hash)
+            except TransactionNotFound:
+                receipt = None
+            except requests.exceptions.RequestException as exc:
+                self._log.warning("Failed to fetch receipt", txn_hash=txn.txn_hash.hex(), exc=exc)
+                continue
+
+            error = None
+            if receipt is None:
+                if time.monotonic() < txn.deadline:
+                    continue
+                error = TransactionFailed("timed out waiting for receipt")
+            elif receipt["status"] == 0:
+                error = TransactionFailed("unknown error")
+
+            with self._lock:
+                self._pending.remove(txn)
+                if receipt is None:
+                    # The transaction might have been dropped, leaving a gap
+                    # in the nonces that would block all later transactions.
+                    self._nonce = None
+
+            txn.on_done(receipt, error)
+
+
+class CompletionQueue:
+    """Collects functions to be run by the thread that owns some state.
+
+    Transaction outcomes are reported from a :class:`TransactionManager`'s
+    thread, but the requests and claims they affect must only be modified by
+    their event processor. The event processor runs the queued functions via
+    :meth:`run_pending` and is notified of new ones by the listeners.
+    """
+
+    def __init__(self) -> None:
+        # This lock protects the following objects:
+        #   - self._queue
+        #   - self._listeners
+        self._lock = threading.Lock()
+        self._queue: list[Callable[[], None]] = []
+        self._listeners: list[Callable[[], None]] = []
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def put(self, func: Callable[[], None]) -> None:
+        with self._lock:
+            self._queue.append(func)
+            listeners = self._listeners[:]
+        for listener in listeners:
+            listener()
+
+    def run_pending(self) -> None:
+        with self._lock:
+            queue = self._queue
+            self._queue = []
+        for func in queue:
+            func()
@@ -1,32 +1,34 @@
-import functools
+import asyncio
 import json
 import logging
+import os
 import pathlib
 import random
 import sys
 import time
+import traceback
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, List, Optional, Type, Union, cast
+from typing import Any, Callable, List, Optional, Sequence, Union, cast
 
-import lru
 import requests
 import structlog
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
 from eth_utils import is_checksum_address, to_checksum_address
-from web3 import HTTPProvider, Web3
+from web3 import Web3
 from web3.contract import ContractConstructor, ContractFunction
+from web3.eth import AsyncEth
 from web3.exceptions import ContractLogicError
 from web3.gas_strategies.rpc import rpc_gas_price_strategy
-from web3.middleware import (
-    construct_sign_and_send_raw_middleware,
-    construct_simple_cache_middleware,
-    geth_poa_middleware,
-)
-from web3.types import GasPriceStrategy, TxParams
+from web3.middleware import construct_sign_and_send_raw_middleware, geth_poa_middleware
+from web3.providers.async_base import AsyncBaseProvider
+from web3.types import GasPriceStrategy, RPCEndpoint, RPCResponse, TxParams
 
 import beamer.agent.middleware
+from beamer.agent.batching import BatchingHTTPProvider
+from beamer.agent.rpc_cache import DEFAULT_MAX_ENTRIES, construct_response_cache_middleware
+from beamer.agent.rpc_pool import RPCPool
 from beamer.agent.typing import URL, ChainId, ChecksumAddress
 
 log = structlog.get_logger(__name__)
@@ -73,6 +75,19 @@ def transact(
     return receipt
 
 
+def wrap_thread_func(func: Callable) -> Callable:
+    def wrapper(*args, **kwargs):  # type: ignore
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            traceback.print_exception(*sys.exc_info())
+            os._exit(1)
+            # should never be reached
+            return None
+
+    return wrapper
+
+
 def setup_logging(log_level: str, log_json: bool) -> None:
     """Basic structlog setup"""
 
@@ -112,29 +127,77 @@ def account_from_keyfile(keyfile: Path, password: str) -> LocalAccount:
 
 
 def make_web3(
-    url: URL, account: LocalAccount, gas_price_strategy: GasPriceStrategy = rpc_gas_price_strategy
+    url: URL,
+    account: LocalAccount,
+    gas_price_strategy: GasPriceStrategy = rpc_gas_price_strategy,
+    backup_urls: Sequence[URL] = (),
+    cache_size: int = DEFAULT_MAX_ENTRIES,
+    latest_max_age: Optional[float] = None,
 ) -> Web3:
-    w3 = Web3(HTTPProvider(url, request_kwargs=dict(timeout=5)))
+    """Return a Web3 instance for the RPC at ``url``. If ``backup_urls`` are
+    given, requests are spread over all of them, see :class:`RPCPool`.
+
+    ``cache_size`` and ``latest_max_age`` configure the response cache, see
+    :func:`construct_response_cache_middleware`."""
+    request_kwargs = dict(timeout=5)
+    if backup_urls:
+        w3 = Web3(RPCPool([url, *backup_urls], request_kwargs=request_kwargs))
+    else:
+        w3 = Web3(BatchingHTTPProvider(url, request_kwargs=request_kwargs))
     w3.eth.set_gas_price_strategy(gas_price_strategy)
     # Add POA middleware for geth POA chains, no/op for other chains
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
     w3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
 
-    # Cache data of 1000 least recently used blocks.
-    cache_class = cast(Type[dict[Any, Any]], functools.partial(lru.LRU, 1000))
-    middleware = construct_simple_cache_middleware(cache_class=cache_class)
-    w3.middleware_onion.add(middleware)
+    # Handle RPCs that rate limit us. An RPC pool does that for each endpoint.
+    if not backup_urls:
+        w3.middleware_onion.add(beamer.agent.middleware.rate_limiter)
 
-    # Cache data of 1000 least recently used blocks, fetched via eth_getBlockByNumber.
-    w3.middleware_onion.add(beamer.agent.middleware.cache_get_block_by_number)
+    # Cache responses, shared with the other Web3 instances of the same chain.
+    # Cache hits do not need to pass the rate limiter.
+    w3.middleware_onion.add(
+        construct_response_cache_middleware(max_entries=cache_size, latest_max_age=latest_max_age)
+    )
 
-    # Handle RPCs that rate limit us.
-    w3.middleware_onion.add(beamer.agent.middleware.rate_limiter)
+    # Record metrics of the requests actually sent to the RPC.
+    w3.middleware_onion.inject(beamer.agent.middleware.instrumentation, layer=0)
 
     w3.eth.default_account = account.address
     return w3
 
 
+class _DelegatingAsyncProvider(AsyncBaseProvider):
+    """An async provider that sends requests through a synchronous Web3
+    instance, in a worker thread.
+
+    Requests thus pass the same middlewares, e.g. the rate limiter and the
+    response cache, and go to the same RPC endpoints as those of ``w3``."""
+
+    def __init__(self, w3: Web3):
+        super().__init__()
+        self._w3 = w3
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_func = self._w3.provider.request_func(self._w3, self._w3.middleware_onion)
+        return await asyncio.to_thread(request_func, method, params)
+
+    async def is_connected(self) -> bool:
+        return await asyncio.to_thread(self._w3.isConnected)
+
+    async def isConnected(self) -> bool:
+        return await self.is_connected()
+
+
+def make_async_web3(w3: Web3) -> Web3:
+    """Return a Web3 instance for read-only async access to the RPC of
+    ``w3``, as returned by :func:`make_web3`."""
+    return Web3(
+        _DelegatingAsyncProvider(w3),  # type: ignore
+        modules={"eth": (AsyncEth,)},
+        middlewares=[],
+    )
+
+
 _Token = tuple[ChainId, ChecksumAddress]
 
 
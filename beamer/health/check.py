@@ -17,6 +17,7 @@ import beamer.agent.contracts
 import beamer.agent.events
 from beamer.agent.config import _merge_dicts
 from beamer.agent.events import ClaimMade, DepositWithdrawn, RequestCreated, RequestFilled
+from beamer.agent.storage import EventStore, make_event_key
 from beamer.agent.typing import ChainId
 from beamer.agent.util import load_ERC20_abi
 from beamer.health.notify import Message, NotificationConfig, NotificationState, Notify
@@ -99,6 +100,9 @@ class Context:
 
 
 claim_request_extension = 86400
+# The file under the cache file path in which the events fetched so far are
+# stored, so that each run only needs to fetch the events of new blocks.
+EVENT_STORE_FILE = "events.db"
 GLOBAL_CONFIG: None | HealthConfig = None
 
 
@@ -172,22 +176,33 @@ def cleanup_transfers(transfers: TransferMap) -> None:
 
 def fetch_events() -> ChainEventMap:
     deployment_info = beamer.agent.contracts.load_deployment_info(get_config()["deployment_dir"])
+    event_store = EventStore(get_config()["cache_file_path"] / EVENT_STORE_FILE)
     events = {}
 
-    for chain_id, (rpc) in get_config()["rpcs"].items():
-        web3 = make_web3(rpc)
-        assert chain_id == ChainId(web3.eth.chain_id)
-
-        info = deployment_info[ChainId(chain_id)]
-        contracts = beamer.agent.contracts.make_contracts(web3, info)
-
-        ef = beamer.agent.events.EventFetcher(
-            web3,
-            (contracts["RequestManager"], contracts["FillManager"]),
-            BlockNumber(info["RequestManager"].deployment_block),
-        )
-
-        events[chain_id] = ef.fetch()
+    try:
+        for chain_id, (rpc) in get_config()["rpcs"].items():
+            web3 = make_web3(rpc)
+            assert chain_id == ChainId(web3.eth.chain_id)
+
+            info = deployment_info[ChainId(chain_id)]
+            contracts = beamer.agent.contracts.make_contracts(web3, info)
+            chain_contracts = (contracts["RequestManager"], contracts["FillManager"])
+
+            # Only the events after the last checkpoint need to be fetched.
+            key = make_event_key(ChainId(chain_id), (c.address for c in chain_contracts))
+            checkpoint, stored_events = event_store.load(key)
+            start_block = BlockNumber(info["RequestManager"].deployment_block)
+            if checkpoint is not None:
+                start_block = max(start_block, BlockNumber(checkpoint + 1))
+
+            ef = beamer.agent.events.EventFetcher(web3, chain_contracts, start_block)
+            new_events = ef.fetch()
+            ef.close()
+            event_store.update(key, new_events, ef.synced_block)
+
+            events[chain_id] = stored_events + new_events
+    finally:
+        event_store.close()
 
     return cast(ChainEventMap, events)
 
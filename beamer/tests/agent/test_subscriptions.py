@@ -0,0 +1,26 @@
+import brownie
+
+from beamer.agent.agent import Agent
+from beamer.agent.typing import URL
+from beamer.tests.util import Sleeper, alloc_accounts, make_request
+
+
+def test_fill_and_claim_with_subscriptions(request_manager, token, config, direction):
+    # Ganache and anvil serve WebSocket connections on the same port as HTTP.
+    ws_url = URL(brownie.web3.provider.endpoint_uri.replace("http", "ws", 1))
+    config.ws_urls = {"l2a": ws_url, "l2b": ws_url}
+    agent = Agent(config)
+    agent.start()
+    try:
+        requester, target = alloc_accounts(2)
+        request_id = make_request(request_manager, token, requester, target, 1)
+
+        with Sleeper(5) as sleeper:
+            while (request := agent.get_context(direction).requests.get(request_id)) is None:
+                sleeper.sleep(0.1)
+
+        with Sleeper(5) as sleeper:
+            while not request.is_claimed:
+                sleeper.sleep(0.1)
+    finally:
+        agent.stop()
@@ -0,0 +1,93 @@
+import asyncio
+import random
+from unittest.mock import AsyncMock, MagicMock
+
+import requests.exceptions
+from eth_typing import BlockNumber
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from beamer.agent.async_engine import AsyncEngine, AsyncEventFetcher, AsyncEventMonitor
+from beamer.agent.events import LatestBlockUpdatedEvent
+from beamer.agent.util import make_async_web3
+from beamer.tests.agent.unit.utils import SOURCE_CHAIN_ID
+
+
+def test_async_fetch_ranges_in_order():
+    latest_block = BlockNumber(10_000)
+    web3 = MagicMock()
+    web3.eth.chain_id = SOURCE_CHAIN_ID
+    async_web3 = MagicMock()
+    async_web3.eth.get_block = AsyncMock(
+        side_effect=lambda block: {"number": latest_block if block == "latest" else block}
+    )
+    fetcher = AsyncEventFetcher(web3, async_web3, (), BlockNumber(1), num_workers=4)
+
+    async def fetch_range(from_block, to_block):
+        await asyncio.sleep(random.random() / 100)
+        return [(from_block, to_block)], 0.0
+
+    fetcher._fetch_range_async = fetch_range  # type: ignore
+    events = asyncio.run(fetcher.fetch_async())
+
+    assert isinstance(events[-1], LatestBlockUpdatedEvent)
+    ranges: list = events[:-1]
+    assert ranges[0][0] == 1
+    assert ranges[-1][1] == latest_block
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+    assert fetcher.synced_block == latest_block
+
+
+def test_stop_skips_snapshots_while_running():
+    engine = AsyncEngine()
+    event_processor = MagicMock()
+    engine._wakeups[event_processor] = asyncio.Event()  # pylint:disable=protected-access
+    engine._loop = MagicMock()  # pylint:disable=protected-access
+    engine._stopped = MagicMock()  # pylint:disable=protected-access
+    # The event loop thread does not stop in time.
+    engine._thread = MagicMock()  # pylint:disable=protected-access
+    engine._thread.is_alive.return_value = True  # pylint:disable=protected-access
+
+    engine.stop()
+    event_processor.stop.assert_not_called()
+
+    engine._thread.is_alive.return_value = False  # pylint:disable=protected-access
+    engine.stop()
+    event_processor.stop.assert_called_once()
+
+
+class _Provider(BaseProvider):
+    def make_request(self, method, params):
+        return {"jsonrpc": "2.0", "id": 1, "result": hex(10)}
+
+
+def test_async_web3_uses_middlewares():
+    methods = []
+
+    def record(make_request, _w3):
+        def middleware(method, params):
+            methods.append(method)
+            return make_request(method, params)
+
+        return middleware
+
+    web3 = Web3(_Provider())
+    web3.middleware_onion.add(record)
+    async_web3 = make_async_web3(web3)
+
+    assert asyncio.run(async_web3.eth.block_number) == 10  # type: ignore
+    assert methods == ["eth_blockNumber"]
+
+
+def test_async_monitor_retries_block_number():
+    web3 = MagicMock()
+    web3.eth.chain_id = SOURCE_CHAIN_ID
+    async_web3 = MagicMock()
+    block_number = AsyncMock(side_effect=[requests.exceptions.ReadTimeout(), BlockNumber(10)])
+    type(async_web3.eth).block_number = property(lambda _eth: block_number())
+    monitor = AsyncEventMonitor(web3, async_web3, (), BlockNumber(1), [], [], poll_period=0.01)
+
+    result = asyncio.run(monitor._get_block_number())  # pylint:disable=protected-access
+    assert result == 10
+    assert block_number.call_count == 2
@@ -0,0 +1,116 @@
+import json
+import threading
+from unittest.mock import patch
+
+import requests
+from eth_abi import encode
+from web3 import Web3
+from web3.types import RPCEndpoint
+
+from beamer.agent.batching import BATCH_METHOD, BatchingHTTPProvider, batch_call
+from beamer.agent.typing import URL
+from beamer.agent.util import load_ERC20_abi
+from beamer.tests.agent.utils import make_address
+
+
+def _reply(requests, result):
+    return json.dumps(
+        [dict(jsonrpc="2.0", id=request["id"], result=result(request)) for request in requests]
+    ).encode()
+
+
+def test_batch_call():
+    w3 = Web3(BatchingHTTPProvider(URL("http://localhost")))
+    token = w3.eth.contract(abi=load_ERC20_abi(), address=make_address())
+    owner, spender = make_address(), make_address()
+    posts = []
+
+    def make_post_request(_url, data, **_kwargs):
+        requests = json.loads(data)
+        posts.append(requests)
+        # The encoded amount is the position of the call within the batch.
+        return _reply(
+            requests,
+            lambda request: "0x" + encode(["uint256"], [requests.index(request)]).hex(),
+        )
+
+    with patch("beamer.agent.batching.make_post_request", make_post_request):
+        results = batch_call(
+            [token.functions.balanceOf(owner), token.functions.allowance(owner, spender)]
+        )
+
+    assert results == [0, 1]
+    assert len(posts) == 1
+    assert [request["method"] for request in posts[0]] == ["eth_call", "eth_call"]
+
+
+def _batch(provider, num_requests):
+    requests_ = [(RPCEndpoint("eth_test"), [index]) for index in range(num_requests)]
+    return provider.make_request(BATCH_METHOD, requests_)["result"]
+
+
+def test_rejected_batches_are_sent_one_by_one():
+    provider = BatchingHTTPProvider(URL("http://localhost"))
+    posts = []
+
+    def make_post_request(_url, data, **_kwargs):
+        request = json.loads(data)
+        posts.append(request)
+        if isinstance(request, list):
+            response = requests.Response()
+            response.status_code = 413
+            raise requests.exceptions.HTTPError(response=response)
+        return json.dumps(dict(jsonrpc="2.0", id=request["id"], result=request["params"])).encode()
+
+    with patch("beamer.agent.batching.make_post_request", make_post_request):
+        responses = _batch(provider, 2)
+        assert [response["result"] for response in responses] == [[0], [1]]
+        assert len(posts) == 3
+
+        # Later batches are not even tried.
+        posts.clear()
+        _batch(provider, 2)
+        assert all(isinstance(request, dict) for request in posts)
+
+
+def test_missing_responses_are_requested_again():
+    provider = BatchingHTTPProvider(URL("http://localhost"))
+    posts = []
+
+    def make_post_request(_url, data, **_kwargs):
+        request = json.loads(data)
+        posts.append(request)
+        if isinstance(request, list):
+            # Leave out the response to the last request.
+            return _reply(request[:-1], lambda request: request["params"])
+        return json.dumps(dict(jsonrpc="2.0", id=request["id"], result=request["params"])).encode()
+
+    with patch("beamer.agent.batching.make_post_request", make_post_request):
+        responses = _batch(provider, 3)
+
+    assert [response["result"] for response in responses] == [[0], [1], [2]]
+    assert [len(request) for request in posts if isinstance(request, list)] == [3]
+    assert posts[-1]["params"] == [2]
+
+
+def test_plain_requests_are_not_batched():
+    provider = BatchingHTTPProvider(URL("http://localhost"))
+    posts = []
+
+    def make_post_request(_url, data, **_kwargs):
+        request = json.loads(data)
+        posts.append(request)
+        return json.dumps(dict(jsonrpc="2.0", id=request["id"], result="0x1")).encode()
+
+    with patch("beamer.agent.batching.make_post_request", make_post_request):
+        threads = [
+            threading.Thread(target=provider.make_request, args=(RPCEndpoint("eth_test"), []))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(posts) == 4
+    assert all(isinstance(request, dict) for request in posts)
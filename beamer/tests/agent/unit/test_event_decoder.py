@@ -0,0 +1,102 @@
+import json
+import pathlib
+import random
+
+from eth_abi import encode
+from eth_utils.abi import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3 import Web3
+
+from beamer.agent.events import (
+    _EVENT_TYPES,
+    EventDecoder,
+    RequestCreated,
+    TxEvent,
+    _camel_to_snake,
+)
+from beamer.agent.typing import ChainId, FillId, RequestId
+from beamer.tests.agent.utils import make_address, make_bytes, make_tx_hash
+
+_DEPLOYMENT_DIR = pathlib.Path(__file__).parents[4] / "deployments" / "mainnet"
+
+
+def _load_contracts():
+    w3 = Web3()
+    contracts = []
+    for name in ("RequestManager", "FillManager"):
+        abi = json.loads((_DEPLOYMENT_DIR / f"{name}.json").read_text())["abi"]
+        contracts.append(w3.eth.contract(abi=abi))
+    return contracts
+
+
+def _make_value(abi_type):
+    if abi_type == "address":
+        return make_address()
+    if abi_type == "bytes32":
+        return make_bytes(32)
+    bits = int(abi_type.removeprefix("uint"))
+    return random.randrange(2**bits)
+
+
+def _make_log(event_abi, values):
+    topics = [HexBytes(event_abi_to_log_topic(event_abi))]
+    data_types, data_values = [], []
+    for input_, value in zip(event_abi["inputs"], values):
+        if input_["indexed"]:
+            topics.append(HexBytes(encode([input_["type"]], [value])))
+        else:
+            data_types.append(input_["type"])
+            data_values.append(value)
+    return dict(
+        topics=topics,
+        data=HexBytes(encode(data_types, data_values)).hex(),
+        blockNumber=7,
+        transactionHash=make_tx_hash(),
+    )
+
+
+def test_decode_all_event_types():
+    contracts = _load_contracts()
+    decoder = EventDecoder(contracts, Web3().codec)
+
+    expected = []
+    logs = []
+    for contract in contracts:
+        for abi in contract.abi:
+            if abi["type"] != "event" or abi["name"] not in _EVENT_TYPES:
+                continue
+            values = [_make_value(input_["type"]) for input_ in abi["inputs"]]
+            logs.append(_make_log(abi, values))
+            expected.append((abi["name"], logs[-1], values, abi["inputs"]))
+
+    events = decoder.decode(logs, ChainId(5))
+    assert len(events) == len(expected) == len(_EVENT_TYPES)
+
+    for event, (name, log_entry, values, inputs) in zip(events, expected):
+        assert type(event).__name__ == name
+        assert isinstance(event, TxEvent)
+        assert not hasattr(event, "__dict__")
+        assert event.chain_id == 5
+        assert event.block_number == 7
+        assert event.tx_hash == log_entry["transactionHash"]
+        for input_, value in zip(inputs, values):
+            field = _camel_to_snake(input_["name"])
+            assert getattr(event, field) == value
+            if field == "request_id":
+                assert isinstance(getattr(event, field), RequestId)
+            elif field == "fill_id":
+                assert isinstance(getattr(event, field), FillId)
+
+
+def test_decode_skips_unknown_events():
+    contracts = _load_contracts()
+    decoder = EventDecoder(contracts, Web3().codec)
+    abis = {abi["name"]: abi for abi in contracts[0].abi if abi["type"] == "event"}
+
+    paused = _make_log(abis["Paused"], [make_address()])
+    values = [_make_value(input_["type"]) for input_ in abis["RequestCreated"]["inputs"]]
+    created = _make_log(abis["RequestCreated"], values)
+
+    events = decoder.decode([paused, created, paused], ChainId(5))
+    assert len(events) == 1
+    assert isinstance(events[0], RequestCreated)
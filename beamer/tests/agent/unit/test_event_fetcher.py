@@ -0,0 +1,149 @@
+import random
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from eth_typing import BlockNumber
+
+from beamer.agent.events import (
+    EventFetcher,
+    LatestBlockUpdatedEvent,
+    RequestCreated,
+    RequestFilled,
+)
+from beamer.agent.typing import Nonce, Termination, TokenAmount
+from beamer.tests.agent.unit.utils import ADDRESS1, REQUEST_ID, SOURCE_CHAIN_ID, TARGET_CHAIN_ID
+from beamer.tests.agent.utils import make_address, make_tx_hash
+from beamer.tests.constants import FILL_ID
+
+
+def _make_web3(latest_block):
+    web3 = MagicMock()
+    web3.eth.chain_id = SOURCE_CHAIN_ID
+    web3.eth.get_block.side_effect = lambda block: {
+        "number": latest_block if block == "latest" else block
+    }
+    return web3
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_fetch_ranges_in_order(num_workers):
+    latest_block = BlockNumber(10_000)
+    fetcher = EventFetcher(_make_web3(latest_block), (), BlockNumber(1), num_workers=num_workers)
+    fetched_ranges = []
+    timed_out: set[int] = set()
+
+    def fetch_range(from_block, to_block):
+        time.sleep(random.random() / 100)
+        # Time out once for one of the ranges to exercise the retry path.
+        if from_block > 3000 and not timed_out:
+            timed_out.add(from_block)
+            fetcher._blocks_to_fetch //= 5  # pylint:disable=protected-access
+            return None
+        fetched_ranges.append((from_block, to_block))
+        return [(from_block, to_block)], 0.0
+
+    fetcher._fetch_range = fetch_range  # type: ignore
+    events = fetcher.fetch()
+
+    assert isinstance(events[-1], LatestBlockUpdatedEvent)
+    ranges: list = events[:-1]
+    assert set(ranges) <= set(fetched_ranges)
+    assert ranges[0][0] == 1
+    assert ranges[-1][1] == latest_block
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+    assert fetcher.synced_block == latest_block
+
+
+def test_fetch_stops_at_max_events():
+    latest_block = BlockNumber(10_000)
+    fetcher = EventFetcher(_make_web3(latest_block), (), BlockNumber(1))
+
+    def fetch_range(from_block, to_block):
+        return [(from_block, to_block)], 0.0
+
+    fetcher._fetch_range = fetch_range  # type: ignore
+
+    events: list = fetcher.fetch(max_events=2)
+    assert len(events) == 3
+    assert isinstance(events[-1], LatestBlockUpdatedEvent)
+    assert events[-1].block_data["number"] == fetcher.synced_block == events[1][1]
+    assert not fetcher.caught_up
+
+    # The next fetch continues where the previous one stopped.
+    synced_block = fetcher.synced_block
+    remaining: list = fetcher.fetch()
+    assert remaining[0][0] == synced_block + 1
+    assert fetcher.synced_block == latest_block
+
+
+def test_concurrent_timeouts_reduce_range_once():
+    web3 = _make_web3(BlockNumber(100_000))
+    web3.eth.get_logs.side_effect = requests.exceptions.ReadTimeout
+    fetcher = EventFetcher(web3, (), BlockNumber(1), num_workers=4)
+    blocks_to_fetch = fetcher._blocks_to_fetch  # pylint:disable=protected-access
+
+    # pylint:disable=protected-access
+    events, next_block = fetcher._fetch_ranges_concurrently(BlockNumber(1), BlockNumber(100_000))
+    assert events == []
+    assert next_block == 1
+    assert fetcher._blocks_to_fetch == blocks_to_fetch // 5  # pylint:disable=protected-access
+    fetcher.close()
+
+
+def test_concurrent_ranges_adjust_range_once():
+    web3 = _make_web3(BlockNumber(100_000))
+    fetcher = EventFetcher(web3, (), BlockNumber(1), num_workers=4)
+    blocks_to_fetch = fetcher._blocks_to_fetch  # pylint:disable=protected-access
+    fetcher._fetch_range = lambda from_block, to_block: ([], 0.0)  # type: ignore
+
+    # pylint:disable=protected-access
+    fetcher._fetch_ranges_concurrently(BlockNumber(1), BlockNumber(100_000))
+    assert fetcher._blocks_to_fetch == blocks_to_fetch * 2
+    fetcher.close()
+
+
+def test_request_created_timestamps_only_after_sync():
+    latest_block = BlockNumber(10)
+    resolve_timestamps = MagicMock(return_value={})
+    fetcher = EventFetcher(
+        _make_web3(latest_block), (), BlockNumber(1), resolve_timestamps=resolve_timestamps
+    )
+    created = RequestCreated(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(1),
+        tx_hash=make_tx_hash(),
+        request_id=REQUEST_ID,
+        target_chain_id=TARGET_CHAIN_ID,
+        source_token_address=make_address(),
+        target_token_address=make_address(),
+        source_address=make_address(),
+        target_address=make_address(),
+        amount=TokenAmount(1),
+        nonce=Nonce(1),
+        valid_until=Termination(1),
+    )
+    filled = RequestFilled(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(2),
+        tx_hash=make_tx_hash(),
+        request_id=REQUEST_ID,
+        fill_id=FILL_ID,
+        source_chain_id=TARGET_CHAIN_ID,
+        target_token_address=make_address(),
+        filler=ADDRESS1,
+        amount=TokenAmount(1),
+    )
+    fetcher._decoder.decode = lambda logs, chain_id: [created, filled]  # type: ignore
+
+    # Requests found while syncing are not traced.
+    fetcher._fetch_range = lambda from_block, to_block: (fetcher._decode([]), 0.0)  # type: ignore
+    fetcher.fetch()
+    assert fetcher.caught_up
+    resolve_timestamps.assert_called_once_with({2})
+
+    resolve_timestamps.reset_mock()
+    fetcher.add_notifications([], None)
+    resolve_timestamps.assert_called_once_with({1, 2})
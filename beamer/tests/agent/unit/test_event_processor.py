@@ -0,0 +1,80 @@
+from eth_typing import BlockNumber
+
+from beamer.agent.chain import EventProcessor
+from beamer.agent.events import DepositWithdrawn
+from beamer.agent.typing import RequestId
+from beamer.tests.agent.unit.utils import ADDRESS1, SOURCE_CHAIN_ID, make_context
+from beamer.tests.agent.utils import make_tx_hash
+
+
+def _make_event(request_id, block_number):
+    return DepositWithdrawn(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(block_number),
+        tx_hash=make_tx_hash(),
+        request_id=RequestId(request_id * 32),
+        receiver=ADDRESS1,
+    )
+
+
+def test_deferred_events_wake_up_by_request(monkeypatch):
+    # Events of a request can only be processed in the order of their block numbers.
+    processed: dict[RequestId, int] = {}
+    calls = []
+
+    def process_event(event, _context):
+        calls.append(event)
+        expected = processed.get(event.request_id, 0) + 1
+        if event.block_number != expected:
+            return False, None
+        processed[event.request_id] = event.block_number
+        return True, None
+
+    monkeypatch.setattr("beamer.agent.chain.process_event", process_event)
+    context, _ = make_context()
+    processor = EventProcessor(context)
+
+    # The first event of request "a" arrives last.
+    events = [_make_event(b"a", n) for n in range(2, 11)] + [_make_event(b"a", 1)]
+    blocked = _make_event(b"b", 2)
+    processor.add_events([blocked] + events)
+    processor._process_events()  # pylint:disable=protected-access
+
+    assert processed == {RequestId(b"a" * 32): 10}
+    assert processor._events == [blocked]  # pylint:disable=protected-access
+    # The deferred events are only retried once the first one was processed,
+    # and the event of request "b" is not retried at all.
+    assert len(calls) == 1 + 10 + 9
+
+
+def test_acts_only_once_synced(monkeypatch):
+    processed = []
+    acted = []
+
+    def process_event(event, _context):
+        processed.append(event)
+        return True, None
+
+    monkeypatch.setattr("beamer.agent.chain.process_event", process_event)
+    monkeypatch.setattr(
+        "beamer.agent.chain.process_requests", lambda _context, due: acted.append(due)
+    )
+    context, _ = make_context()
+    processor = EventProcessor(context)
+
+    # Past events are processed as they are delivered, even while syncing.
+    processor.add_events([_make_event(b"a", 1)])
+    assert not processor.wait_for_backlog(0, timeout=0)
+    processor.process()
+    assert len(processed) == 1
+    assert processor.wait_for_backlog(0, timeout=0)
+    assert not acted
+
+    # Requests are only acted upon once both chains are synced.
+    processor.mark_sync_done()
+    processor.process()
+    assert not acted
+
+    processor.mark_sync_done()
+    processor.process()
+    assert acted
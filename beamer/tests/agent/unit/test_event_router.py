@@ -0,0 +1,217 @@
+from eth_typing import BlockNumber
+from web3.types import BlockData, Wei
+
+from beamer.agent.chain import EventProcessor, EventRouter
+from beamer.agent.events import (
+    ClaimMade,
+    ClaimStakeWithdrawn,
+    DepositWithdrawn,
+    LatestBlockUpdatedEvent,
+    RequestCreated,
+    RequestFilled,
+)
+from beamer.agent.typing import ChainId, ClaimId, Nonce, RequestId, Termination, TokenAmount
+from beamer.tests.agent.unit.utils import (
+    ADDRESS1,
+    REQUEST_ID,
+    SOURCE_CHAIN_ID,
+    TARGET_CHAIN_ID,
+    make_context,
+    make_request,
+)
+from beamer.tests.agent.utils import make_address, make_tx_hash
+from beamer.tests.constants import FILL_ID
+
+OTHER_REQUEST_ID = RequestId(31 * b"\0" + b"2")
+
+
+def _make_processors(router):
+    processors = []
+    for source, target in ((SOURCE_CHAIN_ID, TARGET_CHAIN_ID), (TARGET_CHAIN_ID, SOURCE_CHAIN_ID)):
+        context, _ = make_context()
+        context.source_chain_id = source
+        context.target_chain_id = target
+        processor = EventProcessor(context)
+        router.add_event_processor(processor)
+        processors.append(processor)
+    return processors
+
+
+def _events(processor):
+    return processor._events  # pylint:disable=protected-access
+
+
+def _make_request_created(request_id):
+    return RequestCreated(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(1),
+        tx_hash=make_tx_hash(),
+        request_id=request_id,
+        target_chain_id=TARGET_CHAIN_ID,
+        source_token_address=make_address(),
+        target_token_address=make_address(),
+        source_address=make_address(),
+        target_address=make_address(),
+        amount=TokenAmount(1),
+        nonce=Nonce(1),
+        valid_until=Termination(1),
+    )
+
+
+def _make_deposit_withdrawn(request_id):
+    return DepositWithdrawn(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(2),
+        tx_hash=make_tx_hash(),
+        request_id=request_id,
+        receiver=ADDRESS1,
+    )
+
+
+def _make_request_filled(request_id):
+    return RequestFilled(
+        chain_id=TARGET_CHAIN_ID,
+        block_number=BlockNumber(2),
+        tx_hash=make_tx_hash(),
+        request_id=request_id,
+        fill_id=FILL_ID,
+        source_chain_id=SOURCE_CHAIN_ID,
+        target_token_address=make_address(),
+        filler=ADDRESS1,
+        amount=TokenAmount(1),
+    )
+
+
+def _make_claim_made(request_id, claim_id):
+    return ClaimMade(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(3),
+        tx_hash=make_tx_hash(),
+        claim_id=claim_id,
+        request_id=request_id,
+        fill_id=FILL_ID,
+        claimer=ADDRESS1,
+        claimer_stake=Wei(1),
+        last_challenger=ADDRESS1,
+        challenger_stake_total=Wei(0),
+        termination=Termination(1),
+    )
+
+
+def _make_claim_stake_withdrawn(request_id, claim_id):
+    return ClaimStakeWithdrawn(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(4),
+        tx_hash=make_tx_hash(),
+        claim_id=claim_id,
+        request_id=request_id,
+        stake_recipient=ADDRESS1,
+    )
+
+
+def test_route_by_direction():
+    router = EventRouter()
+    forward, backward = _make_processors(router)
+
+    created = _make_request_created(REQUEST_ID)
+    filled = _make_request_filled(REQUEST_ID)
+    claim_made = _make_claim_made(REQUEST_ID, ClaimId(1))
+    latest_block = LatestBlockUpdatedEvent(
+        chain_id=SOURCE_CHAIN_ID, block_data=BlockData({"number": BlockNumber(3)})
+    )
+    router.route([created, claim_made, latest_block])
+    router.route([filled])
+
+    assert _events(forward) == [created, claim_made, latest_block, filled]
+    assert _events(backward) == [latest_block]
+
+
+def test_route_unknown_request():
+    router = EventRouter()
+    forward, _ = _make_processors(router)
+    # Another direction from the same source chain.
+    context, _ = make_context()
+    context.target_chain_id = ChainId(4)
+    # The direction of a request restored from a snapshot is known.
+    request = make_request()
+    context.requests.add(request.id, request)
+    other = EventProcessor(context)
+    router.add_event_processor(other)
+
+    withdrawn = _make_deposit_withdrawn(REQUEST_ID)
+    unknown = _make_deposit_withdrawn(OTHER_REQUEST_ID)
+    router.route([withdrawn, unknown])
+    assert _events(forward) == [unknown]
+    assert _events(other) == [withdrawn, unknown]
+
+
+def test_drop_finished_requests():
+    router = EventRouter()
+    forward, _ = _make_processors(router)
+    # The fill arrives before the request is known to be finished.
+    router.route([_make_request_filled(REQUEST_ID)])
+
+    open_claim = _make_claim_made(OTHER_REQUEST_ID, ClaimId(2))
+    events = [
+        _make_request_created(REQUEST_ID),
+        _make_request_created(OTHER_REQUEST_ID),
+        _make_claim_made(REQUEST_ID, ClaimId(1)),
+        open_claim,
+        _make_claim_stake_withdrawn(REQUEST_ID, ClaimId(1)),
+        _make_deposit_withdrawn(REQUEST_ID),
+        _make_deposit_withdrawn(OTHER_REQUEST_ID),
+    ]
+    remaining: list = router.drop_finished_requests(events)
+    assert all(event.request_id == OTHER_REQUEST_ID for event in remaining)
+    assert open_claim in remaining
+
+    # Events of the dropped request are dropped by the event processor, too.
+    router.route(remaining + [_make_request_filled(REQUEST_ID)])
+    assert len(_events(forward)) == len(remaining) + 1
+    forward._process_events()  # pylint:disable=protected-access
+    assert all(event.request_id == OTHER_REQUEST_ID for event in _events(forward))
+
+
+def test_forget_dropped_requests_after_sync():
+    router = EventRouter()
+    processors = _make_processors(router)
+    events = [_make_request_created(REQUEST_ID), _make_deposit_withdrawn(REQUEST_ID)]
+    assert router.drop_finished_requests(events) == []
+    forward = processors[0]
+    forward.add_events([_make_request_filled(REQUEST_ID)])
+
+    for processor in processors:
+        processor.mark_sync_done()
+        processor.mark_sync_done()
+    router.route([])
+    assert not router._dropped_requests  # pylint:disable=protected-access
+
+    # The events added before the sync was done are still dropped.
+    forward._process_events()  # pylint:disable=protected-access
+    assert _events(forward) == []
+    assert not forward._dropped_requests  # pylint:disable=protected-access
+
+
+def test_keep_known_requests():
+    router = EventRouter()
+    context, _ = make_context()
+    # The request was restored from a snapshot.
+    request = make_request()
+    context.requests.add(request.id, request)
+    router.add_event_processor(EventProcessor(context))
+
+    events = [_make_request_created(request.id), _make_deposit_withdrawn(request.id)]
+    assert router.drop_finished_requests(events) == events
+
+
+def test_forget_removed_requests():
+    router = EventRouter()
+    forward, _ = _make_processors(router)
+    router.route([_make_request_created(REQUEST_ID)])
+    directions = router._directions  # pylint:disable=protected-access
+    assert REQUEST_ID in directions
+
+    request = make_request()
+    forward.context.requests.add(request.id, request)
+    forward.context.requests.remove(request.id)
+    assert REQUEST_ID not in directions
@@ -1,6 +1,6 @@
 from copy import deepcopy
 from typing import cast
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 from eth_typing import BlockNumber, HexStr
@@ -8,7 +8,13 @@ from hexbytes import HexBytes
 from web3.datastructures import AttributeDict
 from web3.types import ChecksumAddress, TxReceipt, Wei
 
-from beamer.agent.chain import claim_request, fill_request, process_claims, process_requests
+from beamer.agent.chain import (
+    claim_request,
+    fill_request,
+    prefetch_calls,
+    process_claims,
+    process_requests,
+)
 from beamer.agent.events import InitiateL1ResolutionEvent, RequestResolved
 from beamer.agent.state_machine import process_event
 from beamer.agent.typing import FillId, Termination
@@ -391,3 +397,26 @@ def test_maybe_claim_l1_as_challenger(
         assert mocked_withdraw.called
     else:
         assert not mocked_withdraw.called
+
+
+def test_prefetch_calls():
+    context, _ = make_context()
+    request = make_request()
+    context.requests.add(request.id, request)
+    claim = make_claim_unchallenged(request)
+    context.claims.add(claim.id, claim)
+
+    prefetch_calls(context, {request.id})
+
+    # The fill's balance and allowance calls go out together on the target
+    # chain, and the challenge's stake call on the source chain.
+    target_prefetch = cast(MagicMock, context.call_aggregators[TARGET_CHAIN_ID].prefetch)
+    target_prefetch.assert_called_once()
+    functions, block_number = target_prefetch.call_args.args
+    assert len(functions) == 2
+    assert block_number == context.latest_blocks[TARGET_CHAIN_ID]["number"]
+
+    source_prefetch = cast(MagicMock, context.call_aggregators[SOURCE_CHAIN_ID].prefetch)
+    source_prefetch.assert_called_once()
+    functions, _ = source_prefetch.call_args.args
+    assert len(functions) == 1
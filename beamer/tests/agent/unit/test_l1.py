@@ -1,11 +1,20 @@
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from hexbytes import HexBytes
 from web3.types import Wei
 
+import beamer.agent.l1_resolution
+import beamer.agent.metrics
 from beamer.agent.events import InitiateL1InvalidationEvent, InitiateL1ResolutionEvent
+from beamer.agent.l1_resolution import RelayerDaemon, RelayerError, RelayerScheduler
 from beamer.agent.state_machine import process_event
+from beamer.agent.typing import URL
 from beamer.tests.agent.unit.utils import (
+    ACCOUNT,
     CLAIM_ID,
     REQUEST_ID,
     TARGET_CHAIN_ID,
@@ -49,6 +58,8 @@ def test_handle_initiate_l1_resolution(timestamp):
     if timestamp == TIMESTAMP:
         assert process_event(event, context) == (True, None)
         assert context.task_pool.submit.called  # type: ignore  # pylint:disable=no-member
+        _, kwargs = context.task_pool.submit.call_args  # type: ignore  # pylint:disable=no-member
+        assert kwargs == dict(lane=TARGET_CHAIN_ID)
     else:
         assert process_event(event, context) == (False, None)
         assert not context.task_pool.submit.called  # type: ignore  # pylint:disable=no-member
@@ -84,6 +95,137 @@ def test_handle_initiate_l1_invalidation(timestamp):
     if timestamp == TIMESTAMP:
         assert process_event(event, context) == (True, None)
         assert context.task_pool.submit.called  # type: ignore  # pylint:disable=no-member
+        _, kwargs = context.task_pool.submit.call_args  # type: ignore  # pylint:disable=no-member
+        assert kwargs == dict(lane=TARGET_CHAIN_ID)
     else:
         assert process_event(event, context) == (False, None)
         assert not context.task_pool.submit.called  # type: ignore  # pylint:disable=no-member
+
+
+def test_relayer_scheduler_lanes():
+    _, config = make_context()
+    beamer.agent.metrics.init(config=config, source_rpc_url="", target_rpc_url="")
+    scheduler = RelayerScheduler()
+    release = threading.Event()
+    running = []
+
+    def relay(name):
+        running.append(name)
+        release.wait()
+        return name
+
+    # Runs in the same lane wait for each other, different lanes run in parallel.
+    futures = [
+        scheduler.submit(relay, "a1", lane=1),
+        scheduler.submit(relay, "a2", lane=1),
+        scheduler.submit(relay, "b1", lane=2),
+    ]
+    deadline = time.monotonic() + 5
+    while len(running) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(running) == ["a1", "b1"]
+
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == ["a1", "a2", "b1"]
+    scheduler.shutdown()
+
+    with pytest.raises(RuntimeError):
+        scheduler.submit(relay, "a3", lane=1)
+
+
+_FAKE_RELAYER = """#!{python}
+import json
+import sys
+
+assert "--daemon" in sys.argv
+for line in sys.stdin:
+    request = json.loads(line)
+    tx_hash = request["l2TransactionHash"]
+    if tx_hash.endswith("ff"):
+        sys.exit(3)
+    if tx_hash.endswith("ee"):
+        # Never answer.
+        continue
+    print("relaying", tx_hash, file=sys.stderr)
+    response = dict(id=request["id"], success=tx_hash.endswith("00"), error="relay failed")
+    print(json.dumps(response), flush=True)
+"""
+
+
+def test_relayer_daemon(tmp_path, monkeypatch):
+    relayer = tmp_path / "relayer"
+    relayer.write_text(_FAKE_RELAYER.format(python=sys.executable))
+    relayer.chmod(0o755)
+    monkeypatch.setattr(beamer.agent.l1_resolution, "get_relayer_executable", lambda: relayer)
+
+    daemon = RelayerDaemon(URL("http://l1"), HexBytes(ACCOUNT.key))
+    try:
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x01\x00"))
+        pid = daemon._process.pid  # type: ignore
+        # The relayer is kept running for the next request.
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x02\x00"))
+        assert daemon._process.pid == pid  # type: ignore
+
+        with pytest.raises(RelayerError, match="relay failed"):
+            daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x03\x01"))
+
+        with pytest.raises(RelayerError, match="exited with code 3"):
+            daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x04\xff"))
+
+        # A new relayer is started after the previous one exited.
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x05\x00"))
+        assert daemon._process.pid != pid  # type: ignore
+    finally:
+        daemon.stop()
+
+
+def test_relayer_daemon_timeout(tmp_path, monkeypatch):
+    relayer = tmp_path / "relayer"
+    relayer.write_text(_FAKE_RELAYER.format(python=sys.executable))
+    relayer.chmod(0o755)
+    monkeypatch.setattr(beamer.agent.l1_resolution, "get_relayer_executable", lambda: relayer)
+
+    daemon = RelayerDaemon(URL("http://l1"), HexBytes(ACCOUNT.key), timeout=1)
+    try:
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x01\x00"))
+        process = daemon._process  # pylint:disable=protected-access
+        assert process is not None
+
+        with pytest.raises(RelayerError, match="timed out"):
+            daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x02\xee"))
+
+        # The stuck relayer was killed and replaced.
+        assert process.wait(5) != 0
+        assert daemon._process is not process  # pylint:disable=protected-access
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x03\x00"))
+    finally:
+        daemon.stop()
+
+
+def test_relayer_daemon_timeout_keeps_answering_relayer(tmp_path, monkeypatch):
+    relayer = tmp_path / "relayer"
+    relayer.write_text(_FAKE_RELAYER.format(python=sys.executable))
+    relayer.chmod(0o755)
+    monkeypatch.setattr(beamer.agent.l1_resolution, "get_relayer_executable", lambda: relayer)
+
+    daemon = RelayerDaemon(URL("http://l1"), HexBytes(ACCOUNT.key), timeout=1)
+    try:
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x00\x00"))
+        process = daemon._process  # pylint:disable=protected-access
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stuck = executor.submit(
+                daemon.relay, URL("http://from"), URL("http://to"), HexBytes(b"\x01\xee")
+            )
+            # Other requests are still answered while one is stuck.
+            while not stuck.done():
+                daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x02\x00"))
+                time.sleep(0.1)
+
+            with pytest.raises(RelayerError, match="timed out"):
+                stuck.result()
+
+        # Only the stuck request failed, the relayer was kept.
+        assert daemon._process is process  # pylint:disable=protected-access
+        daemon.relay(URL("http://from"), URL("http://to"), HexBytes(b"\x03\x00"))
+    finally:
+        daemon.stop()
@@ -0,0 +1,52 @@
+from prometheus_client import REGISTRY
+
+import beamer.agent.metrics
+from beamer.agent.metrics import (
+    REQUEST_STAGES,
+    discard_request_trace,
+    end_request_stage,
+    start_request_trace,
+)
+from beamer.tests.agent.unit.utils import make_context
+
+
+def _stage_count(direction, stage):
+    labels = dict(direction=direction, stage=stage)
+    value = REGISTRY.get_sample_value("request_stage_duration_seconds_count", labels)
+    return value or 0
+
+
+def _stage_sum(direction, stage):
+    labels = dict(direction=direction, stage=stage)
+    return REGISTRY.get_sample_value("request_stage_duration_seconds_sum", labels)
+
+
+def test_request_trace():
+    _, config = make_context()
+    beamer.agent.metrics.init(config=config, source_rpc_url="", target_rpc_url="")
+    direction = "test-trace"
+
+    # Stages are only recorded once the queue stage ended.
+    start_request_trace(b"1", direction, block_timestamp=100, fetched_at=102, decoded_at=103)
+    assert _stage_count(direction, "fetch") == 0
+    discard_request_trace(b"1")
+    end_request_stage(b"1", "queue", 104)
+    assert _stage_count(direction, "fetch") == 0
+
+    start_request_trace(b"2", direction, block_timestamp=100, fetched_at=102, decoded_at=103)
+    end_request_stage(b"2", "queue", 104)
+    end_request_stage(b"2", "checks", 104.5)
+    end_request_stage(b"2", "receipt", 107)
+    for stage in REQUEST_STAGES:
+        assert _stage_count(direction, stage) == 1
+    assert _stage_sum(direction, "fetch") == 2
+    assert _stage_sum(direction, "decode") == 1
+    assert _stage_sum(direction, "queue") == 1
+    assert _stage_sum(direction, "checks") == 0.5
+    assert _stage_sum(direction, "receipt") == 2.5
+    labels = dict(direction=direction)
+    assert REGISTRY.get_sample_value("request_time_to_fill_seconds_sum", labels) == 7
+
+    # The trace is gone once the request was filled.
+    end_request_stage(b"2", "receipt", 108)
+    assert _stage_count(direction, "receipt") == 1
@@ -0,0 +1,148 @@
+import threading
+import time
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from prometheus_client import REGISTRY
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+import beamer.agent.metrics
+from beamer.agent.middleware import _MAX_CONCURRENT_REQUESTS, instrumentation, rate_limiter
+from beamer.agent.rpc_cache import construct_response_cache_middleware
+from beamer.tests.agent.unit.utils import make_context
+
+
+def _rate_limited(retry_after=None):
+    response = requests.Response()
+    response.status_code = 429
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.exceptions.HTTPError(response=response)
+
+
+class _Provider(BaseProvider):
+    def __init__(self, status_code=None):
+        self.status_code = status_code
+
+    def make_request(self, method, params):
+        if self.status_code is not None:
+            response = requests.Response()
+            response.status_code = self.status_code
+            raise requests.exceptions.HTTPError(response=response)
+        if method == "eth_chainId":
+            return dict(jsonrpc="2.0", id=1, result="0x1e61")
+        if method == "eth_getBlockByNumber":
+            number = "0x10" if params[0] == "latest" else params[0]
+            block_hash = "0x" + number[2:].rjust(64, "0")
+            return dict(
+                jsonrpc="2.0",
+                id=1,
+                result=dict(number=number, hash=block_hash, parentHash="0x" + "0" * 64),
+            )
+        return dict(jsonrpc="2.0", id=1, error=dict(code=-1, message="unsupported"))
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_instrumentation():
+    _, config = make_context()
+    beamer.agent.metrics.init(config=config, source_rpc_url="", target_rpc_url="")
+    provider = _Provider()
+    w3 = Web3(provider)
+    w3.middleware_onion.add(construct_response_cache_middleware())
+    w3.middleware_onion.inject(instrumentation, layer=0)
+
+    labels = dict(chain_id="7777", method="eth_chainId")
+    requests_before = _sample("rpc_requests_total", **labels)
+    hits_before = _sample("rpc_cache_lookups_total", cache="response", result="hit", **labels)
+
+    # The chain ID is only known once it was requested.
+    assert w3.eth.chain_id == 7777
+    assert w3.eth.chain_id == 7777
+    assert _sample("rpc_requests_total", **labels) == requests_before
+    labels["chain_id"] = "unknown"
+    assert _sample("rpc_requests_total", **labels) >= 1
+    labels["chain_id"] = "7777"
+    hits = _sample("rpc_cache_lookups_total", cache="response", result="hit", **labels)
+    assert hits == hits_before + 1
+
+    labels["method"] = "eth_getBlockByNumber"
+    w3.eth.get_block(16)
+    w3.eth.get_block(16)
+    assert _sample("rpc_requests_total", **labels) == 1
+    assert _sample("rpc_cache_lookups_total", cache="response", result="hit", **labels) == 1
+    assert _sample("rpc_cache_lookups_total", cache="response", result="miss", **labels) == 1
+    assert _sample("rpc_request_duration_seconds_count", **labels) == 1
+
+    labels["method"] = "eth_gasPrice"
+    with pytest.raises(ValueError):
+        w3.eth.gas_price
+    assert _sample("rpc_errors_total", **labels) == 1
+
+    provider.status_code = 429
+    with pytest.raises(requests.exceptions.HTTPError):
+        w3.eth.gas_price
+    assert _sample("rpc_errors_total", **labels) == 2
+    assert _sample("rpc_rate_limited_total", **labels) == 1
+
+
+def test_rate_limiter_runs_requests_concurrently():
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def make_request(method, params):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return dict(jsonrpc="2.0", id=1, result=params)
+
+    middleware = rate_limiter(make_request, MagicMock())
+    threads = [
+        threading.Thread(target=middleware, args=("eth_call", i))
+        for i in range(2 * _MAX_CONCURRENT_REQUESTS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_in_flight == _MAX_CONCURRENT_REQUESTS
+
+
+def test_rate_limiter_backs_off():
+    rejections = [_rate_limited("0.2"), _rate_limited(), _rate_limited()]
+
+    def make_request(method, params):
+        if rejections:
+            raise rejections.pop(0)
+        return dict(jsonrpc="2.0", id=1, result=params)
+
+    middleware: Any = rate_limiter(make_request, MagicMock())
+    state = middleware.keywords["state"]
+    start = time.monotonic()
+    # Rejected requests are retried instead of failing.
+    assert middleware("eth_call", 1) == dict(jsonrpc="2.0", id=1, result=1)
+    assert time.monotonic() - start >= 0.2
+    assert not rejections
+    # Rejections in quick succession only count once.
+    assert state.rate == pytest.approx(10 + 1 / 10)
+
+    state.last_decrease -= 1
+    rejections.append(_rate_limited())
+    middleware("eth_call", 1)
+    assert state.rate == pytest.approx(10.1 / 2 + 1 / (10.1 / 2))
+
+    # The rate recovers with successful requests.
+    state.rate = 99.99
+    state.tokens = 1
+    middleware("eth_call", 2)
+    assert state.rate is None
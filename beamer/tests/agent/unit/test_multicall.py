@@ -0,0 +1,109 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from eth_abi import encode
+from eth_typing import BlockNumber
+from web3 import Web3
+
+from beamer.agent.batching import BatchingHTTPProvider
+from beamer.agent.multicall import MULTICALL3_ADDRESS, CallAggregator
+from beamer.agent.typing import URL
+from beamer.agent.util import load_ERC20_abi
+from beamer.tests.agent.utils import make_address
+
+
+class _FakeRPC:
+    def __init__(self, multicall_deployed, symbol_fails=False):
+        self.multicall_deployed = multicall_deployed
+        self.symbol_fails = symbol_fails
+        self.calls = []
+        # The number of HTTP requests that contained eth_call requests.
+        self.num_call_posts = 0
+
+    def _result(self, request):
+        method = request["method"]
+        self.calls.append(method)
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "eth_getCode":
+            return "0x01" if self.multicall_deployed else "0x"
+        assert method == "eth_call"
+        transaction = request["params"][0]
+        if transaction["to"] == MULTICALL3_ADDRESS:
+            results = [
+                (True, encode(["uint256"], [42])),
+                (not self.symbol_fails, encode(["string"], ["TST"])),
+            ]
+            return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+        if transaction["data"].startswith("0x70a08231"):  # balanceOf
+            return "0x" + encode(["uint256"], [42]).hex()
+        if self.symbol_fails:
+            return None
+        return "0x" + encode(["string"], ["TST"]).hex()
+
+    def _response(self, request):
+        result = self._result(request)
+        if result is None:
+            error = dict(code=3, message="execution reverted")
+            return dict(jsonrpc="2.0", id=request["id"], error=error)
+        return dict(jsonrpc="2.0", id=request["id"], result=result)
+
+    def __call__(self, _url, data, **_kwargs):
+        requests = json.loads(data)
+        if "eth_call" in str(data):
+            self.num_call_posts += 1
+        if isinstance(requests, list):
+            return json.dumps([self._response(r) for r in requests]).encode()
+        return json.dumps(self._response(requests)).encode()
+
+
+OWNER = make_address()
+
+
+def _call(aggregator, token, block_number):
+    functions = [token.functions.balanceOf(OWNER), token.functions.symbol()]
+    return aggregator.call(functions, BlockNumber(block_number))
+
+
+def test_call_aggregator():
+    for multicall_deployed in (False, True):
+        rpc = _FakeRPC(multicall_deployed)
+        with patch("beamer.agent.batching.make_post_request", rpc), patch(
+            "web3.providers.rpc.make_post_request", rpc
+        ):
+            w3 = Web3(BatchingHTTPProvider(URL("http://localhost")))
+            token = w3.eth.contract(abi=load_ERC20_abi(), address=make_address())
+            aggregator = CallAggregator(w3)
+
+            assert _call(aggregator, token, 1) == [42, "TST"]
+            num_eth_calls = rpc.calls.count("eth_call")
+            assert num_eth_calls == (1 if multicall_deployed else 2)
+
+            # Results are cached per block.
+            assert _call(aggregator, token, 1) == [42, "TST"]
+            assert rpc.calls.count("eth_call") == num_eth_calls
+            assert _call(aggregator, token, 2) == [42, "TST"]
+            assert rpc.calls.count("eth_call") == 2 * num_eth_calls
+
+
+def test_prefetch_fans_out_errors():
+    for multicall_deployed in (False, True):
+        rpc = _FakeRPC(multicall_deployed, symbol_fails=True)
+        with patch("beamer.agent.batching.make_post_request", rpc), patch(
+            "web3.providers.rpc.make_post_request", rpc
+        ):
+            w3 = Web3(BatchingHTTPProvider(URL("http://localhost")))
+            token = w3.eth.contract(abi=load_ERC20_abi(), address=make_address())
+            aggregator = CallAggregator(w3)
+
+            functions = [token.functions.balanceOf(OWNER), token.functions.symbol()]
+            aggregator.prefetch(functions, BlockNumber(1))
+            assert rpc.num_call_posts == 1
+
+            # Each caller gets the outcome of its own call, without another request.
+            assert aggregator.call([token.functions.balanceOf(OWNER)], BlockNumber(1)) == [42]
+            with pytest.raises(ValueError):
+                aggregator.call([token.functions.symbol()], BlockNumber(1))
+            assert rpc.num_call_posts == 1
@@ -0,0 +1,168 @@
+from collections import Counter
+from typing import Any
+
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from web3.providers.base import BaseProvider
+
+from beamer.agent.rpc_cache import REORG_DEPTH, ResponseCache, construct_response_cache_middleware
+from beamer.tests.agent.utils import make_address
+
+_CONTRACT = make_address()
+
+
+class _Chain(BaseProvider):
+    def __init__(self, chain_id):
+        self.chain_id = chain_id
+        self.head = 10
+        # Changing the fork changes the hashes of all blocks, as if a reorg
+        # replaced them.
+        self.fork = 0
+        self.receipts: dict[str, Any] = {}
+        self.requests: Counter[str] = Counter()
+
+    def _block(self, number):
+        return dict(
+            number=hex(number),
+            hash="0x%02x%062x" % (self.fork, number),
+            parentHash="0x%02x%062x" % (self.fork, number - 1),
+        )
+
+    def make_request(self, method, params):
+        self.requests[method] += 1
+        result: Any
+        if method == "eth_chainId":
+            result = hex(self.chain_id)
+        elif method == "eth_getBlockByNumber":
+            number = self.head if params[0] == "latest" else int(params[0], 16)
+            result = self._block(number)
+        elif method == "eth_getBlockByHash":
+            result = self._block(int(params[0][4:], 16))
+        elif method == "eth_call":
+            result = "0x%064x" % (self.fork * 1000 + self.head)
+        elif method == "eth_getTransactionReceipt":
+            result = self.receipts.get(params[0])
+        else:
+            raise AssertionError(method)
+        return dict(jsonrpc="2.0", id=1, result=result)
+
+
+def _make_web3(chain, latest_max_age=None):
+    w3 = Web3(chain)
+    w3.middleware_onion.add(construct_response_cache_middleware(latest_max_age=latest_max_age))
+    assert w3.eth.chain_id == chain.chain_id
+    return w3
+
+
+def _call(w3, block_identifier):
+    transaction = {"to": _CONTRACT, "data": "0x"}
+    return w3.eth.call(transaction, block_identifier)
+
+
+def test_response_cache_drops_reorged_responses():
+    chain = _Chain(chain_id=10001)
+    w3 = _make_web3(chain)
+
+    assert w3.eth.chain_id == chain.chain_id
+    assert chain.requests["eth_chainId"] == 1
+
+    w3.eth.get_block("latest")
+    result = _call(w3, 10)
+    assert _call(w3, 10) == result
+    assert chain.requests["eth_call"] == 1
+
+    # Requests for the latest state are not cached by default.
+    _call(w3, "latest")
+    assert chain.requests["eth_call"] == 2
+
+    # Responses are dropped once a reorg is noticed.
+    chain.fork = 1
+    chain.head = 11
+    w3.eth.get_block("latest")
+    assert _call(w3, 10) != result
+    assert chain.requests["eth_call"] == 3
+
+
+def test_response_cache_drops_responses_reorged_across_skipped_blocks():
+    chain = _Chain(chain_id=10004)
+    w3 = _make_web3(chain)
+
+    w3.eth.get_block("latest")
+    block = w3.eth.get_block(9)
+    result = _call(w3, 10)
+
+    # Without a reorg, the skipped blocks 11 and 12 are fetched to check the
+    # new head, and the cached responses are kept.
+    chain.head = 13
+    w3.eth.get_block("latest")
+    assert chain.requests["eth_getBlockByHash"] == 2
+    assert w3.eth.get_block(9) == block
+    assert _call(w3, 10) == result
+    assert chain.requests["eth_call"] == 1
+
+    # A reorg that replaced the blocks from 9 on is noticed even though the
+    # new head's parent was never seen.
+    chain.fork = 1
+    chain.head = 16
+    w3.eth.get_block("latest")
+    assert w3.eth.get_block(9) != block
+    assert _call(w3, 10) != result
+    assert chain.requests["eth_call"] == 2
+
+
+def test_response_cache_drops_unverified_responses():
+    cache = ResponseCache(max_entries=10)
+    chain = _Chain(chain_id=0)
+    cache.add_block(chain._block(10))
+    cache.put("response", dict(jsonrpc="2.0", id=1, result="0x1"), block_number=10)
+
+    # Block 11 is unknown, so block 12 cannot be checked against its parent.
+    assert cache.missing_parent(chain._block(12)) == HexBytes(chain._block(11)["hash"])
+    cache.add_block(chain._block(12))
+    assert cache.get("response") is None
+
+
+def test_response_cache_caches_latest_state():
+    chain = _Chain(chain_id=10002)
+    w3 = _make_web3(chain, latest_max_age=60)
+
+    result = _call(w3, "latest")
+    assert _call(w3, "latest") == result
+    assert _call(w3, chain.head) == result
+    assert chain.requests["eth_call"] == 1
+
+    chain.head += 1
+    w3.eth.get_block("latest")
+    assert _call(w3, "latest") != result
+    assert chain.requests["eth_call"] == 2
+
+
+def test_response_cache_is_shared():
+    # Two providers for the same chain, as if they were talking to different RPCs.
+    chain, other_chain = _Chain(chain_id=10003), _Chain(chain_id=10003)
+    tx_hash = "0x" + "11" * 32
+    first, second = _make_web3(chain), _make_web3(other_chain)
+
+    # Receipts of pending transactions are not cached.
+    with pytest.raises(TransactionNotFound):
+        first.eth.get_transaction_receipt(tx_hash)
+    chain.receipts[tx_hash] = dict(blockNumber=hex(chain.head), status="0x1")
+    first.eth.get_transaction_receipt(tx_hash)
+    assert chain.requests["eth_getTransactionReceipt"] == 2
+
+    second.eth.get_transaction_receipt(tx_hash)
+    assert other_chain.requests["eth_getTransactionReceipt"] == 0
+
+
+def test_response_cache_keeps_final_responses():
+    cache = ResponseCache(max_entries=10)
+    chain = _Chain(chain_id=0)
+    cache.add_block(chain._block(10))
+    cache.put("final", dict(jsonrpc="2.0", id=1, result="0x1"), block_number=10)
+    cache.add_block(chain._block(11 + REORG_DEPTH))
+
+    chain.fork = 1
+    cache.add_block(chain._block(10))
+    assert cache.get("final") is not None
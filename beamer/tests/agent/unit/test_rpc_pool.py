@@ -0,0 +1,137 @@
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+import requests
+from web3.types import RPCEndpoint
+
+from beamer.agent.rpc_pool import RPCPool
+from beamer.agent.typing import URL
+
+_URLS = [URL("http://a.example/key"), URL("http://b.example/key")]
+
+
+class _Endpoints:
+    """Serves the requests posted to the pool's endpoints."""
+
+    def __init__(self):
+        self.posts = []
+        self.errors = {}
+        self.heads = {}
+
+    def make_post_request(self, url, data, **_kwargs):
+        self.posts.append(url)
+        error = self.errors.get(url)
+        if error is not None:
+            raise error
+        request = json.loads(data)
+        result = url
+        if request["method"] == "eth_blockNumber":
+            result = hex(self.heads[url])
+        return json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+
+
+def _rate_limited():
+    response = requests.Response()
+    response.status_code = 429
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _request(pool, method="eth_gasPrice", params=()):
+    return pool.make_request(RPCEndpoint(method), list(params))["result"]
+
+
+def test_pool_fails_over():
+    pool = RPCPool(_URLS)
+    endpoints = _Endpoints()
+    endpoints.errors[_URLS[0]] = requests.exceptions.ConnectionError()
+
+    with patch("beamer.agent.rpc_pool.make_post_request", endpoints.make_post_request):
+        assert _request(pool) == _URLS[1]
+        assert endpoints.posts == _URLS
+
+        # The failed endpoint is avoided from now on.
+        endpoints.posts.clear()
+        assert _request(pool) == _URLS[1]
+        assert endpoints.posts == [_URLS[1]]
+
+        # Errors are only raised once all endpoints failed.
+        endpoints.errors[_URLS[1]] = requests.exceptions.ConnectionError()
+        endpoints.posts.clear()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            _request(pool)
+        assert endpoints.posts == [_URLS[1], _URLS[0]]
+
+
+def test_pool_prefers_fastest_endpoint():
+    pool = RPCPool(_URLS)
+    endpoints = _Endpoints()
+
+    with patch("beamer.agent.rpc_pool.make_post_request", endpoints.make_post_request):
+        # Both endpoints are measured first.
+        assert _request(pool) == _URLS[0]
+        assert _request(pool) == _URLS[1]
+
+    first, second = pool._endpoints
+    first.latency = 0.5
+    second.latency = 0.1
+    with patch("beamer.agent.rpc_pool.make_post_request", endpoints.make_post_request):
+        assert _request(pool) == _URLS[1]
+
+
+def test_pool_skips_rate_limiting_endpoint():
+    pool = RPCPool(_URLS)
+    endpoints = _Endpoints()
+    endpoints.errors[_URLS[0]] = _rate_limited()
+
+    with patch("beamer.agent.rpc_pool.make_post_request", endpoints.make_post_request):
+        assert _request(pool) == _URLS[1]
+        assert pool._endpoints[0].rate_limiter.limited
+
+        endpoints.posts.clear()
+        assert _request(pool) == _URLS[1]
+        assert endpoints.posts == [_URLS[1]]
+
+
+def test_pool_spreads_get_logs():
+    pool = RPCPool(_URLS)
+    endpoints = _Endpoints()
+    in_flight = threading.Barrier(2, timeout=5)
+
+    def make_post_request(url, data, **kwargs):
+        # Hold both requests in flight at the same time.
+        in_flight.wait()
+        return endpoints.make_post_request(url, data, **kwargs)
+
+    results = []
+    with patch("beamer.agent.rpc_pool.make_post_request", make_post_request):
+        threads = [
+            threading.Thread(target=lambda: results.append(_request(pool, "eth_getLogs")))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sorted(results) == _URLS
+
+
+def test_pool_sends_get_logs_to_synced_endpoints():
+    pool = RPCPool(_URLS)
+    endpoints = _Endpoints()
+    endpoints.heads = {_URLS[0]: 5, _URLS[1]: 10}
+
+    with patch("beamer.agent.rpc_pool.make_post_request", endpoints.make_post_request):
+        # The first endpoint told us about its latest block, the second one
+        # is asked before sending it a request for logs.
+        assert _request(pool, "eth_blockNumber") == hex(5)
+
+        # Only the second endpoint has seen block 8.
+        for _ in range(3):
+            assert _request(pool, "eth_getLogs", [dict(toBlock=hex(8))]) == _URLS[1]
+        assert endpoints.posts.count(_URLS[1]) == 4
+
+        # Blocks no endpoint is known to have seen are left to the first one.
+        assert _request(pool, "eth_getLogs", [dict(toBlock=hex(12))]) == _URLS[0]
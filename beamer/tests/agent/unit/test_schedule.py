@@ -0,0 +1,69 @@
+from beamer.agent.chain import _AdaptivePollPeriod
+from beamer.agent.events import LatestBlockUpdatedEvent
+from beamer.agent.schedule import ProcessingSchedule
+from beamer.agent.typing import ChainId
+
+CHAIN_ID = ChainId(1)
+OTHER_CHAIN_ID = ChainId(2)
+
+
+def test_schedule():
+    schedule = ProcessingSchedule(full_sweep_period=60)
+
+    # Everything is due at first.
+    assert schedule.take_due(1000) is None
+    assert schedule.take_due(1000) == set()
+    assert schedule.seconds_until_due(1000) == 60
+
+    schedule.mark("a")
+    assert schedule.seconds_until_due(1000) == 0
+    assert schedule.take_due(1000) == {"a"}
+    assert schedule.take_due(1000) == set()
+
+    schedule.wake_at(1010, "b")
+    schedule.wake_at(1010, "b")
+    schedule.wake_at(1020, "c")
+    assert schedule.seconds_until_due(1000) == 10
+    assert schedule.take_due(1009) == set()
+    assert schedule.take_due(1015) == {"b"}
+    assert schedule.seconds_until_due(1015) == 5
+
+    schedule.wake_on_block(CHAIN_ID, "d")
+    schedule.wake_on_block(CHAIN_ID, "e", timestamp=1100)
+    schedule.block_updated(OTHER_CHAIN_ID, 2000)
+    assert schedule.take_due(1016) == set()
+    schedule.block_updated(CHAIN_ID, 1050)
+    assert schedule.take_due(1016) == {"d"}
+    schedule.block_updated(CHAIN_ID, 1100)
+    assert schedule.take_due(1016) == {"e"}
+
+    # Everything is due again after the full sweep period.
+    assert schedule.take_due(1060) is None
+    assert schedule.take_due(1061) == set()
+
+
+def _block_event(number, timestamp):
+    return LatestBlockUpdatedEvent(
+        chain_id=CHAIN_ID, block_data=dict(number=number, timestamp=timestamp)
+    )
+
+
+def test_adaptive_poll_period(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("beamer.agent.chain.time.time", lambda: now)
+    poll_period = _AdaptivePollPeriod(max_period=5, min_period=1)
+
+    # Without a block time estimate, the maximum period is used.
+    assert poll_period.next([_block_event(10, 996)]) == 5
+
+    # With blocks every 2 seconds, poll when the next block is expected.
+    now = 1001.0
+    assert poll_period.next([_block_event(12, 1000)]) == 1
+    now = 1002.0
+    assert poll_period.next([_block_event(13, 1002)]) == 2
+
+    # Back off while there are no new blocks.
+    assert poll_period.next([]) == 2
+    assert poll_period.next([]) == 4
+    assert poll_period.next([]) == 5
+    assert poll_period.next([_block_event(16, 1008)]) == 5
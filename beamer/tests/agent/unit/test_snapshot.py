@@ -0,0 +1,111 @@
+import json
+
+from eth_typing import BlockNumber
+from web3.types import BlockData, Wei
+
+from beamer.agent.chain import EventProcessor
+from beamer.agent.events import LatestBlockUpdatedEvent
+from beamer.agent.snapshot import (
+    restore_claim,
+    restore_request,
+    snapshot_claim,
+    snapshot_context,
+    snapshot_request,
+)
+from beamer.agent.storage import EventStore
+from beamer.tests.agent.unit.utils import (
+    ADDRESS1,
+    REQUEST_ID,
+    TARGET_CHAIN_ID,
+    make_claim_challenged,
+    make_context,
+    make_fill,
+    make_request,
+)
+from beamer.tests.agent.utils import make_tx_hash
+from beamer.tests.constants import FILL_ID
+
+
+def _roundtrip(data):
+    return json.loads(json.dumps(data))
+
+
+def test_request_snapshot():
+    request = make_request()
+    request.fill(filler=ADDRESS1, fill_tx=make_tx_hash(), fill_id=FILL_ID, fill_timestamp=1)
+    request.invalid_fill_ids[FILL_ID] = make_tx_hash(), 2
+    request.l1_resolution_invalid_fill_ids.add(FILL_ID)
+
+    restored = restore_request(_roundtrip(snapshot_request(request)))
+    assert restored.is_filled  # pylint:disable=no-member
+    assert vars(restored).keys() == vars(request).keys()
+    for name, value in vars(request).items():
+        if name not in ("_log", "model"):
+            assert getattr(restored, name) == value, name
+
+
+def test_claim_snapshot():
+    request = make_request()
+    claim = make_claim_challenged(request, challenger_stake=Wei(10**10))
+    claim.unprocessed_claim_made_events.add(claim.latest_claim_made)
+    claim.transaction_pending = True
+
+    restored = restore_claim(_roundtrip(snapshot_claim(claim)))
+    assert restored.is_challenger_winning  # pylint:disable=no-member
+    assert restored.latest_claim_made == claim.latest_claim_made
+    assert restored.challenger_stakes == claim.challenger_stakes
+    assert restored.unprocessed_claim_made_events == claim.unprocessed_claim_made_events
+    # The transaction's outcome will not be reported after a restart.
+    assert not restored.transaction_pending
+
+
+def test_event_processor_restores_snapshot(tmp_path):
+    store = EventStore(tmp_path / "events.db")
+    context, _ = make_context()
+    request = make_request()
+    context.requests.add(request.id, request)
+    claim = make_claim_challenged(request)
+    context.claims.add(claim.id, claim)
+
+    processor = EventProcessor(context, store)
+    pending_fill = make_fill(5)
+    processor.add_events(
+        [
+            pending_fill,
+            LatestBlockUpdatedEvent(
+                chain_id=TARGET_CHAIN_ID, block_data=BlockData({"number": BlockNumber(10)})
+            ),
+        ]
+    )
+    processor._store_snapshot()  # pylint:disable=protected-access
+
+    new_context, _ = make_context()
+    new_context.request_manager = context.request_manager
+    new_context.fill_manager = context.fill_manager
+    processor = EventProcessor(new_context, store)
+    assert new_context.requests.get(request.id) is not None
+    assert new_context.claims.get(claim.id) is not None
+
+    # Events that were already delivered before the snapshot are skipped.
+    new_fill = make_fill(11)
+    processor.add_events([make_fill(10), new_fill])
+    assert processor._events == [pending_fill, new_fill]  # pylint:disable=protected-access
+
+
+def test_snapshot_restarts_l1_resolution():
+    context, _ = make_context()
+    request = make_request()
+    context.requests.add(request.id, request)
+    claim = make_claim_challenged(request)
+    context.claims.add(claim.id, claim)
+    context.l1_resolutions[request.id] = None  # type: ignore
+
+    data = snapshot_context(context, [], {})
+    assert data["events"] == [
+        dict(
+            type="InitiateL1ResolutionEvent",
+            chain_id=TARGET_CHAIN_ID,
+            request_id=REQUEST_ID.hex(),
+            claim_id=claim.id,
+        )
+    ]
@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock
+
+from eth_typing import BlockNumber
+from hexbytes import HexBytes
+from web3.types import Wei
+
+from beamer.agent.block_timestamps import BlockTimestamps
+from beamer.agent.events import ClaimMade, LatestBlockUpdatedEvent
+from beamer.agent.storage import REORG_SAFETY_DEPTH, EventStore, decode_event, encode_event
+from beamer.agent.typing import ClaimId, FillId, RequestId, Termination
+from beamer.tests.agent.unit.utils import REQUEST_ID, SOURCE_CHAIN_ID, TARGET_CHAIN_ID, make_fill
+from beamer.tests.agent.utils import make_address, make_tx_hash
+from beamer.tests.constants import FILL_ID
+
+
+def test_event_encoding_roundtrip():
+    event = ClaimMade(
+        chain_id=SOURCE_CHAIN_ID,
+        block_number=BlockNumber(1),
+        tx_hash=make_tx_hash(),
+        claim_id=ClaimId(1),
+        request_id=REQUEST_ID,
+        fill_id=FILL_ID,
+        claimer=make_address(),
+        claimer_stake=Wei(10),
+        last_challenger=make_address(),
+        challenger_stake_total=Wei(0),
+        termination=Termination(100),
+    )
+    decoded = decode_event(encode_event(event))
+    assert isinstance(decoded, ClaimMade)
+    assert decoded == event
+    assert type(decoded.request_id) is RequestId
+    assert type(decoded.fill_id) is FillId
+    assert type(decoded.tx_hash) is HexBytes
+
+
+def test_event_store_checkpoint(tmp_path):
+    store = EventStore(tmp_path / "events.db")
+    key = "key"
+    assert store.load(key) == (None, [])
+
+    safe_event = make_fill(10)
+    unsafe_event = make_fill(REORG_SAFETY_DEPTH + 20)
+    block_event = LatestBlockUpdatedEvent(chain_id=TARGET_CHAIN_ID, block_data={})
+    synced_block = BlockNumber(REORG_SAFETY_DEPTH + 50)
+    store.update(key, [safe_event, unsafe_event, block_event], synced_block)
+    store.close()
+
+    # Events that are too close to the synced block are dropped on load.
+    store = EventStore(tmp_path / "events.db")
+    assert store.load(key) == (BlockNumber(50), [safe_event])
+    assert store.load("other-key") == (None, [])
+
+    # The checkpoint never moves backwards.
+    store.update(key, [], BlockNumber(synced_block - 10))
+    assert store.load(key) == (BlockNumber(50), [safe_event])
+
+
+def test_decode_event_without_block_timestamp():
+    event = make_fill(1)
+    data = encode_event(event)
+    del data["block_timestamp"]
+    assert decode_event(data) == event
+
+
+def test_block_timestamps(tmp_path):
+    store = EventStore(tmp_path / "events.db")
+    web3 = MagicMock()
+    web3.eth.chain_id = TARGET_CHAIN_ID
+    web3.eth.get_block.side_effect = lambda block_number: {"timestamp": block_number * 10}
+
+    block_timestamps = BlockTimestamps(web3, store)
+    assert block_timestamps.resolve([BlockNumber(1), BlockNumber(2)]) == {1: 10, 2: 20}
+    assert web3.eth.get_block.call_count == 2
+
+    # Resolved timestamps are persisted.
+    block_timestamps = BlockTimestamps(web3, store)
+    assert block_timestamps.resolve([BlockNumber(2), BlockNumber(3)]) == {2: 20, 3: 30}
+    assert web3.eth.get_block.call_count == 3
+    assert store.load_block_timestamps(SOURCE_CHAIN_ID, [BlockNumber(2)]) == {}
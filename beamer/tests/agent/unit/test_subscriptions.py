@@ -0,0 +1,198 @@
+import asyncio
+import json
+import threading
+from typing import Any
+from unittest.mock import MagicMock
+
+from aiohttp import WSMsgType, web
+from eth_typing import BlockNumber
+from eth_utils import to_checksum_address
+
+from beamer.agent.chain import SUBSCRIPTION_TIMEOUT, EventMonitor
+from beamer.agent.events import EventFetcher, LatestBlockUpdatedEvent
+from beamer.agent.subscriptions import Notifications, SubscriptionListener
+from beamer.agent.typing import URL
+from beamer.tests.agent.unit.utils import SOURCE_CHAIN_ID
+
+ADDRESS = to_checksum_address("0x" + "12" * 20)
+
+_HEAD = {
+    "number": "0xa",
+    "hash": "0x" + "01" * 32,
+    "parentHash": "0x" + "00" * 32,
+    "timestamp": "0x64",
+}
+
+_LOG = {
+    "address": ADDRESS,
+    "blockHash": "0x" + "01" * 32,
+    "blockNumber": "0xa",
+    "data": "0x",
+    "logIndex": "0x0",
+    "removed": False,
+    "topics": [],
+    "transactionHash": "0x" + "02" * 32,
+    "transactionIndex": "0x0",
+}
+
+
+class _FakeNode:
+    """A WebSocket server that sends one head and one log to each subscriber
+    and then closes the connection. If given, ``bad_notification`` is sent to
+    the first subscriber instead."""
+
+    def __init__(self, bad_notification: Any = None) -> None:
+        self.requests: list[dict] = []
+        self._bad_notification = bad_notification
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+
+    def start(self) -> URL:
+        self._thread.start()
+        self._ready.wait()
+        return URL(f"ws://127.0.0.1:{self._port}")
+
+    async def _serve(self) -> None:
+        app = web.Application()
+        app.router.add_get("/", self._handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        self._port = runner.addresses[0][1]
+        self._ready.set()
+        await asyncio.Future()
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for subscription_id in ("0x1", "0x2"):
+            message = await ws.receive()
+            assert message.type == WSMsgType.TEXT
+            data = json.loads(message.data)
+            self.requests.append(data)
+            await ws.send_json(dict(jsonrpc="2.0", id=data["id"], result=subscription_id))
+        if self._bad_notification is not None:
+            await ws.send_json(self._bad_notification)
+            self._bad_notification = None
+            # The subscriber is expected to close the connection.
+            await ws.receive()
+            return ws
+        for subscription_id, result in (("0x1", _HEAD), ("0x2", _LOG)):
+            params = dict(subscription=subscription_id, result=result)
+            await ws.send_json(dict(jsonrpc="2.0", method="eth_subscription", params=params))
+        await ws.close()
+        return ws
+
+
+def _take_session(listener: SubscriptionListener) -> tuple[list, list]:
+    """Take the notifications sent over one connection."""
+    taken = listener.take(timeout=5)
+    assert taken is not None and taken.reconnected
+    heads, logs = taken.heads, taken.logs
+    while not (heads and logs):
+        taken = listener.take(timeout=5)
+        assert taken is not None and not taken.reconnected
+        heads.extend(taken.heads)
+        logs.extend(taken.logs)
+    return heads, logs
+
+
+def test_subscription_listener():
+    node = _FakeNode()
+    listener = SubscriptionListener(node.start(), [ADDRESS], reconnect_period=0.1)
+    listener.start()
+    try:
+        heads, logs = _take_session(listener)
+        # The listener reconnects after the node closed the connection.
+        _take_session(listener)
+    finally:
+        listener.stop()
+
+    params = [request["params"] for request in node.requests]
+    assert params[:2] == [["newHeads"], ["logs", {"address": [ADDRESS]}]]
+
+    assert heads[0]["number"] == 10
+    assert heads[0]["timestamp"] == 100
+    assert logs[0]["blockNumber"] == 10
+    assert logs[0]["transactionHash"] == bytes.fromhex("02" * 32)
+
+
+def test_subscription_listener_survives_bad_notifications():
+    for bad_notification in (
+        dict(jsonrpc="2.0", method="eth_subscription"),
+        dict(jsonrpc="2.0", method="eth_subscription", params=dict(subscription="0x1")),
+        dict(
+            jsonrpc="2.0",
+            method="eth_subscription",
+            params=dict(subscription="0x1", result=dict(_HEAD, number="not a number")),
+        ),
+    ):
+        node = _FakeNode(bad_notification)
+        listener = SubscriptionListener(node.start(), [ADDRESS], reconnect_period=0.1)
+        listener.start()
+        try:
+            heads: list = []
+            while not heads:
+                taken = listener.take(timeout=5)
+                assert taken is not None
+                heads.extend(taken.heads)
+        finally:
+            listener.stop()
+
+        # The listener subscribed again after the bad notification.
+        assert len(node.requests) >= 4
+        assert heads[0]["number"] == 10
+
+
+def test_event_monitor_backfills_after_reconnect():
+    web3 = MagicMock()
+    web3.eth.chain_id = SOURCE_CHAIN_ID
+    web3.eth.get_block.side_effect = lambda block: {
+        "number": 10 if block == "latest" else block,
+        "timestamp": 100,
+    }
+    monitor = EventMonitor(
+        web3=web3,
+        contracts=(),
+        deployment_block=BlockNumber(1),
+        on_new_events=[],
+        on_sync_done=[],
+        poll_period=5,
+        ws_url=URL("ws://localhost"),
+    )
+    fetcher = EventFetcher(web3, (), BlockNumber(1))
+    fetcher._fetch_range = lambda from_block, to_block: ([], 0.0)  # type: ignore
+    # Pass logs through undecoded, so that they can be told apart.
+    fetcher._decode = lambda logs: list(logs)  # type: ignore
+
+    # Anything received before the missed events were fetched is dropped.
+    log: Any = {"blockNumber": 10, "removed": False}
+    notifications = Notifications(reconnected=True, heads=[], logs=[log])
+    assert monitor._needs_fetch(notifications)
+    monitor._fetch(fetcher)
+    monitor._fetched(fetcher)
+    assert fetcher.synced_block == 10
+
+    logs: Any = [
+        {"blockNumber": 10, "removed": False},
+        {"blockNumber": 11, "removed": False},
+        {"blockNumber": 11, "removed": True},
+    ]
+    head: Any = {"number": 11, "timestamp": 110}
+    notifications = Notifications(reconnected=False, heads=[head], logs=logs)
+    assert not monitor._needs_fetch(notifications)
+    events = monitor._apply_notifications(fetcher, notifications)
+    assert events == [logs[1], LatestBlockUpdatedEvent(SOURCE_CHAIN_ID, head)]
+    assert fetcher.synced_block == 11
+
+    # Logs of the latest block may arrive after its head.
+    logs = [{"blockNumber": 11, "removed": False}]
+    notifications = Notifications(reconnected=False, heads=[], logs=logs)
+    assert not monitor._needs_fetch(notifications)
+    assert monitor._apply_notifications(fetcher, notifications) == logs
+    assert fetcher.synced_block == 11
+
+    # Without any notifications for a while, the chain is polled.
+    assert not monitor._needs_fetch(None)
+    monitor._last_notification_time -= SUBSCRIPTION_TIMEOUT + 1
+    assert monitor._needs_fetch(None)
@@ -0,0 +1,44 @@
+from beamer.agent.tracker import ClaimTracker
+from beamer.agent.typing import ClaimId, FillId
+from beamer.tests.agent.unit.utils import REQUEST_ID, make_claim_unchallenged, make_request
+from beamer.tests.constants import FILL_ID
+
+OTHER_FILL_ID = FillId(b"2" * 32)
+
+
+def test_claim_tracker_index():
+    request = make_request()
+    claim1 = make_claim_unchallenged(request, claim_id=ClaimId(1))
+    claim2 = make_claim_unchallenged(request, claim_id=ClaimId(2))
+    claim3 = make_claim_unchallenged(request, claim_id=ClaimId(3), fill_id=OTHER_FILL_ID)
+
+    claims = ClaimTracker()
+    assert not claims.has_claims(REQUEST_ID)
+    for claim in (claim1, claim2, claim3):
+        claims.add(claim.id, claim)
+
+    assert claims.has_claims(REQUEST_ID)
+    assert claims.find(REQUEST_ID, FILL_ID) == [claim1, claim2]
+    assert claims.find(REQUEST_ID, OTHER_FILL_ID) == [claim3]
+
+    claims.remove(claim1.id)
+    claims.remove(claim2.id)
+    assert claims.find(REQUEST_ID, FILL_ID) == []
+    assert claims.has_claims(REQUEST_ID)
+
+    claims.remove(claim3.id)
+    assert not claims.has_claims(REQUEST_ID)
+    assert len(claims) == 0
+
+
+def test_remove_listener():
+    request = make_request()
+    claim = make_claim_unchallenged(request)
+    claims = ClaimTracker()
+    removed: list[ClaimId] = []
+    claims.add_remove_listener(removed.append)
+
+    claims.add(claim.id, claim)
+    assert removed == []
+    claims.remove(claim.id)
+    assert removed == [claim.id]
@@ -0,0 +1,133 @@
+from unittest.mock import MagicMock
+
+import pytest
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+from beamer.agent.transactions import CompletionQueue, TransactionManager
+from beamer.agent.util import TransactionFailed
+
+
+def _make_web3(receipts):
+    web3 = MagicMock()
+    web3.eth.chain_id = 1
+    web3.eth.get_transaction_count.return_value = 7
+
+    def get_transaction_receipt(txn_hash):
+        receipt = receipts.get(txn_hash)
+        if receipt is None:
+            raise TransactionNotFound(txn_hash)
+        return receipt
+
+    web3.eth.get_transaction_receipt.side_effect = get_transaction_receipt
+    return web3
+
+
+def _make_func(txn_hash):
+    func = MagicMock()
+    func.transact.return_value = txn_hash
+    return func
+
+
+def test_transactions_are_pipelined():
+    receipts: dict[HexBytes, dict] = {}
+    manager = TransactionManager(_make_web3(receipts), timeout=60)
+    results = []
+
+    funcs = [_make_func(HexBytes(bytes([i]) * 32)) for i in range(3)]
+    for func in funcs:
+        manager.submit(func, lambda *result: results.append(result), value=1)
+
+    # All transactions were sent without waiting for receipts,
+    # with consecutive nonces.
+    nonces = [func.transact.call_args.args[0]["nonce"] for func in funcs]
+    assert nonces == [7, 8, 9]
+    assert all(func.transact.call_args.args[0]["value"] == 1 for func in funcs)
+    manager._check_receipts()
+    assert results == []
+
+    receipts[HexBytes(b"\x01" * 32)] = dict(status=1)
+    receipts[HexBytes(b"\x02" * 32)] = dict(status=0)
+    manager._check_receipts()
+    assert results[0] == (dict(status=1), None)
+    receipt, exc = results[1]
+    assert receipt == dict(status=0)
+    assert isinstance(exc, TransactionFailed)
+
+    manager._check_receipts()
+    assert len(results) == 2
+
+
+def test_nonce_resynced_after_failure():
+    web3 = _make_web3({})
+    manager = TransactionManager(web3, timeout=0)
+    results = []
+
+    manager.submit(_make_func(HexBytes(b"\x01" * 32)), lambda *result: results.append(result))
+    func = _make_func(None)
+    func.transact.side_effect = ValueError("nonce too low")
+    with pytest.raises(TransactionFailed):
+        manager.submit(func, lambda *result: results.append(result))
+
+    # The first transaction was never mined.
+    manager._check_receipts()
+    (receipt, exc), *_ = results
+    assert receipt is None
+    assert isinstance(exc, TransactionFailed)
+
+    web3.eth.get_transaction_count.return_value = 8
+    func = _make_func(HexBytes(b"\x02" * 32))
+    manager.submit(func, lambda *result: results.append(result))
+    assert func.transact.call_args.args[0]["nonce"] == 8
+    assert web3.eth.get_transaction_count.call_count == 3
+
+
+def test_nonce_resynced_on_retry():
+    web3 = _make_web3({})
+    manager = TransactionManager(web3, timeout=60)
+    manager.submit(_make_func(HexBytes(b"\x01" * 32)), lambda *_: None)
+
+    # Someone else sent a transaction with our next nonce.
+    web3.eth.get_transaction_count.return_value = 9
+    func = _make_func(HexBytes(b"\x02" * 32))
+    func.transact.side_effect = [ValueError("nonce too low"), HexBytes(b"\x02" * 32)]
+    assert manager.submit(func, lambda *_: None) == HexBytes(b"\x02" * 32)
+    nonces = [call.args[0]["nonce"] for call in func.transact.call_args_list]
+    assert nonces == [8, 9]
+
+    func = _make_func(HexBytes(b"\x03" * 32))
+    manager.submit(func, lambda *_: None)
+    assert func.transact.call_args.args[0]["nonce"] == 10
+
+
+def test_other_errors_are_not_retried():
+    web3 = _make_web3({})
+    manager = TransactionManager(web3, timeout=60)
+    manager.submit(_make_func(HexBytes(b"\x01" * 32)), lambda *_: None)
+    num_nonce_requests = web3.eth.get_transaction_count.call_count
+
+    func = _make_func(None)
+    func.transact.side_effect = ValueError(
+        {"code": -32000, "message": "insufficient funds for gas * price + value"}
+    )
+    with pytest.raises(TransactionFailed):
+        manager.submit(func, lambda *_: None)
+    assert func.transact.call_count == 1
+    assert web3.eth.get_transaction_count.call_count == num_nonce_requests
+
+
+def test_completion_queue():
+    queue = CompletionQueue()
+    notified = []
+    queue.add_listener(lambda: notified.append(True))
+
+    results = []
+    queue.put(lambda: results.append(1))
+    queue.put(lambda: results.append(2))
+    assert notified == [True, True]
+    assert results == []
+
+    queue.run_pending()
+    assert results == [1, 2]
+    queue.run_pending()
+    assert results == [1, 2]
@@ -9,11 +9,11 @@ from web3.constants import ADDRESS_ZERO
 from web3.types import BlockData, Timestamp, Wei
 
 from beamer.agent.config import Config
-from beamer.agent.events import ClaimMade
+from beamer.agent.events import ClaimMade, RequestFilled
 from beamer.agent.models.claim import Claim
 from beamer.agent.models.request import Request
 from beamer.agent.state_machine import Context
-from beamer.agent.tracker import Tracker
+from beamer.agent.tracker import ClaimTracker, Tracker
 from beamer.agent.typing import (
     URL,
     ChainId,
@@ -25,7 +25,7 @@ from beamer.agent.typing import (
     TokenAmount,
 )
 from beamer.agent.util import TokenChecker
-from beamer.tests.agent.utils import make_address
+from beamer.tests.agent.utils import make_address, make_tx_hash
 from beamer.tests.constants import FILL_ID
 
 SOURCE_CHAIN_ID = ChainId(2)
@@ -73,6 +73,20 @@ def make_request(valid_until: int = TIMESTAMP - 1) -> Request:
     )
 
 
+def make_fill(block_number: int) -> RequestFilled:
+    return RequestFilled(
+        chain_id=TARGET_CHAIN_ID,
+        block_number=BlockNumber(block_number),
+        tx_hash=make_tx_hash(),
+        request_id=REQUEST_ID,
+        fill_id=FILL_ID,
+        source_chain_id=SOURCE_CHAIN_ID,
+        target_token_address=make_address(),
+        filler=make_address(),
+        amount=TokenAmount(123),
+    )
+
+
 def make_claim_unchallenged(
     request: Request,
     claim_id: ClaimId = CLAIM_ID,
@@ -155,7 +169,7 @@ def make_context() -> Tuple[Context, Config]:
 
     context = Context(
         requests=Tracker(),
-        claims=Tracker(),
+        claims=ClaimTracker(),
         source_chain_id=SOURCE_CHAIN_ID,
         target_chain_id=TARGET_CHAIN_ID,
         request_manager=MagicMock(),
@@ -185,4 +199,12 @@ def make_context() -> Tuple[Context, Config]:
         logger=MagicMock(),
     )
     context.request_manager.functions.claimStake().call.return_value = 1  # type: ignore
+    # The contracts are mocked, so call their functions directly instead of
+    # aggregating the calls.
+    for chain_id in (SOURCE_CHAIN_ID, TARGET_CHAIN_ID):
+        aggregator = MagicMock()
+        aggregator.call.side_effect = lambda functions, _block_number: [
+            func.call() for func in functions
+        ]
+        context.call_aggregators[chain_id] = aggregator
     return context, config
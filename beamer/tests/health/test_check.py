@@ -1,9 +1,12 @@
 import dataclasses
 import pickle
 import time
+from types import SimpleNamespace
 
+from eth_typing import BlockNumber
 from web3.types import Wei
 
+from beamer.agent.storage import REORG_SAFETY_DEPTH
 from beamer.agent.typing import Termination
 from beamer.health.check import (
     ChainEventMap,
@@ -12,10 +15,11 @@ from beamer.health.check import (
     Transfer,
     analyze_transfer,
     create_transfers_object,
+    fetch_events,
 )
 from beamer.tests.agent.unit.utils import CLAIM_ID, REQUEST_ID
 from beamer.tests.agent.utils import make_address
-from beamer.tests.health.conftest import SOURCE_CHAIN_ID, TARGET_CHAIN_ID
+from beamer.tests.health.conftest import SOURCE_CHAIN_ID, TARGET_CHAIN_ID, config
 
 
 def test_create_transfers_object(transfer_request, transfer_claim, transfer_fill):
@@ -279,3 +283,46 @@ def test_check_if_challenge_game_multiple_challenges(
     assert len(ctx.notifications) == 2
     assert ctx.notifications[0]["meta"]["message_type"] == NotificationTypes.CHALLENGE_GAME
     assert ctx.notifications[1]["meta"]["message_type"] == NotificationTypes.CHALLENGE_GAME
+
+
+def test_fetch_events_incrementally(monkeypatch, tmp_path, transfer_request):
+    monkeypatch.setattr(
+        "beamer.health.check.get_config",
+        lambda: dict(
+            config, rpcs={SOURCE_CHAIN_ID: ""}, deployment_dir=tmp_path, cache_file_path=tmp_path
+        ),
+    )
+    monkeypatch.setattr(
+        "beamer.agent.contracts.load_deployment_info",
+        lambda _path: {SOURCE_CHAIN_ID: dict(RequestManager=SimpleNamespace(deployment_block=1))},
+    )
+    monkeypatch.setattr(
+        "beamer.health.check.make_web3",
+        lambda _rpc: SimpleNamespace(eth=SimpleNamespace(chain_id=SOURCE_CHAIN_ID)),
+    )
+    contract = SimpleNamespace(address=make_address())
+    monkeypatch.setattr(
+        "beamer.agent.contracts.make_contracts",
+        lambda _web3, _info: dict(RequestManager=contract, FillManager=contract),
+    )
+
+    latest_block = transfer_request.block_number + 2 * REORG_SAFETY_DEPTH
+    start_blocks = []
+
+    class EventFetcher:
+        def __init__(self, _web3, _contracts, start_block):
+            start_blocks.append(start_block)
+            self.synced_block = BlockNumber(latest_block)
+
+        def fetch(self):
+            if start_blocks[-1] <= transfer_request.block_number:
+                return [transfer_request]
+            return []
+
+    monkeypatch.setattr("beamer.agent.events.EventFetcher", EventFetcher)
+
+    assert fetch_events() == {SOURCE_CHAIN_ID: [transfer_request]}
+    # The second run only fetches the blocks after the checkpoint, but still
+    # returns the events fetched before.
+    assert fetch_events() == {SOURCE_CHAIN_ID: [transfer_request]}
+    assert start_blocks == [1, latest_block - REORG_SAFETY_DEPTH + 1]
@@ -0,0 +1,69 @@
+import type {
+  Provider,
+  TransactionRequest,
+  TransactionResponse,
+} from "@ethersproject/providers";
+import { Wallet } from "ethers";
+import type { Deferrable } from "ethers/lib/utils";
+import { promises as fs } from "fs";
+
+// A lock file older than this was left behind by a relayer that crashed while holding it.
+const STALE_LOCK_MS = 60_000;
+const RETRY_INTERVAL_MS = 100;
+
+async function acquireFileLock(path: string): Promise<fs.FileHandle> {
+  for (;;) {
+    try {
+      return await fs.open(path, "wx");
+    } catch (err) {
+      if ((err as NodeJS.ErrnoException).code !== "EEXIST") {
+        throw err;
+      }
+    }
+
+    try {
+      const stats = await fs.stat(path);
+      if (Date.now() - stats.mtimeMs > STALE_LOCK_MS) {
+        await fs.unlink(path);
+        continue;
+      }
+    } catch {
+      // The lock was released in the meantime.
+      continue;
+    }
+    await new Promise((resolve) => setTimeout(resolve, RETRY_INTERVAL_MS));
+  }
+}
+
+export async function withFileLock<T>(path: string, fn: () => Promise<T>): Promise<T> {
+  const handle = await acquireFileLock(path);
+  try {
+    return await fn();
+  } finally {
+    await handle.close();
+    await fs.unlink(path);
+  }
+}
+
+/**
+ * A wallet that sends transactions while holding a lock file.
+ *
+ * The nonce of a transaction is determined right before it is sent, from the number of pending
+ * transactions of the account. Holding the lock from then until the transaction was sent makes
+ * sure that relayers running in parallel for the same account never use the same nonce.
+ */
+export class NonceLockedWallet extends Wallet {
+  constructor(privateKey: string, provider: Provider, readonly lockPath: string) {
+    super(privateKey, provider);
+  }
+
+  connect(provider: Provider): NonceLockedWallet {
+    return new NonceLockedWallet(this.privateKey, provider, this.lockPath);
+  }
+
+  async sendTransaction(
+    transaction: Deferrable<TransactionRequest>,
+  ): Promise<TransactionResponse> {
+    return withFileLock(this.lockPath, () => super.sendTransaction(transaction));
+  }
+}
@@ -0,0 +1,102 @@
+import { createInterface } from "readline";
+
+import { getNetworkId } from "./common/network";
+import { createRelayer } from "./map";
+import type { ProgramOptions } from "./relayer-program";
+import { RelayerProgram, validateArgs } from "./relayer-program";
+import type { BaseRelayerService } from "./services/types";
+
+export type DaemonOptions = Pick<
+  ProgramOptions,
+  "l1RpcUrl" | "walletPrivateKey" | "l1NonceLockFile"
+>;
+
+export type RelayRequest = {
+  id: number;
+  l2RelayFromRpcUrl: string;
+  l2RelayToRpcUrl: string;
+  l2TransactionHash: string;
+};
+
+export type RelayResponse = {
+  id: number | null;
+  success: boolean;
+  error?: string;
+};
+
+/**
+ * Relays transactions requested as JSON lines, one request per line.
+ *
+ * Each request is answered with a single JSON line holding the request's id. Requests are handled
+ * concurrently, so responses may arrive out of order. The relayer services are created once per
+ * rollup RPC URL and reused by all later requests.
+ */
+export class RelayerDaemon {
+  private readonly relayers = new Map<string, Promise<BaseRelayerService>>();
+
+  constructor(readonly options: DaemonOptions) {}
+
+  getRelayer(l2RpcUrl: string): Promise<BaseRelayerService> {
+    let relayer = this.relayers.get(l2RpcUrl);
+    if (!relayer) {
+      relayer = getNetworkId(l2RpcUrl).then((chainId) =>
+        createRelayer(chainId, [
+          this.options.l1RpcUrl,
+          l2RpcUrl,
+          this.options.walletPrivateKey,
+          this.options.l1NonceLockFile,
+        ]),
+      );
+      // Try again with the next request instead of caching the failure.
+      relayer.catch(() => this.relayers.delete(l2RpcUrl));
+      this.relayers.set(l2RpcUrl, relayer);
+    }
+    return relayer;
+  }
+
+  async handle(request: RelayRequest): Promise<RelayResponse> {
+    try {
+      const validationErrors = validateArgs({ ...this.options, ...request, daemon: false });
+      if (validationErrors.length) {
+        throw new Error(validationErrors.join("\n"));
+      }
+
+      const program = new RelayerProgram(
+        await this.getRelayer(request.l2RelayFromRpcUrl),
+        await this.getRelayer(request.l2RelayToRpcUrl),
+        request.l2TransactionHash,
+      );
+      await program.run();
+      return { id: request.id, success: true };
+    } catch (err) {
+      console.error(err);
+      return { id: request.id, success: false, error: String(err) };
+    }
+  }
+
+  async serve(input: NodeJS.ReadableStream, output: (line: string) => void): Promise<void> {
+    const pending = new Set<Promise<void>>();
+    const respond = (response: RelayResponse) => output(JSON.stringify(response));
+
+    for await (const line of createInterface({ input, crlfDelay: Infinity })) {
+      if (!line.trim()) {
+        continue;
+      }
+
+      let request: RelayRequest;
+      try {
+        request = JSON.parse(line);
+      } catch (err) {
+        respond({ id: null, success: false, error: `Invalid request: ${err}` });
+        continue;
+      }
+
+      const done = this.handle(request).then(respond);
+      pending.add(done);
+      done.finally(() => pending.delete(done));
+    }
+
+    // The input was closed, finish the requests that are still running.
+    await Promise.all(pending);
+  }
+}
@@ -10,11 +10,32 @@ export type ProgramOptions = {
   l2TransactionHash: string;
   networkFrom?: string;
   networkTo?: string;
+  l1NonceLockFile?: string;
+  daemon?: boolean;
 };
 
 export function validateArgs(args: ProgramOptions): Array<string> {
   const validationErrors = [];
 
+  if (args.daemon) {
+    // Transactions are requested via stdin.
+    return validationErrors;
+  }
+
+  const requiredOptions = {
+    "--l2-relay-to-rpc-url": args.l2RelayToRpcUrl,
+    "--l2-relay-from-rpc-url": args.l2RelayFromRpcUrl,
+    "--l2-transaction-hash": args.l2TransactionHash,
+  };
+  for (const [option, value] of Object.entries(requiredOptions)) {
+    if (!value) {
+      validationErrors.push(`Missing required option "${option}"`);
+    }
+  }
+  if (validationErrors.length) {
+    return validationErrors;
+  }
+
   if (!args.l2TransactionHash.startsWith("0x") || args.l2TransactionHash.trim().length != 66) {
     validationErrors.push(
       `Invalid argument value for "--l2-transaction-hash": "${args.l2TransactionHash}" doesn't look like a txn hash...`,
@@ -39,11 +60,13 @@ export class RelayerProgram {
       options.l1RpcUrl,
       options.l2RelayFromRpcUrl,
       options.walletPrivateKey,
+      options.l1NonceLockFile,
     ]);
     const relayerTo = createRelayer(toL2ChainId, [
       options.l1RpcUrl,
       options.l2RelayToRpcUrl,
       options.walletPrivateKey,
+      options.l1NonceLockFile,
     ]);
 
     return new this(relayerFrom, relayerTo, options.l2TransactionHash);
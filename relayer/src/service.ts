@@ -2,20 +2,26 @@ import { program } from "commander";
 import { ppid } from "process";
 
 import { killOnParentProcessChange } from "./common/process";
+import { RelayerDaemon } from "./relayer-daemon";
 import type { ProgramOptions } from "./relayer-program";
 import { RelayerProgram, validateArgs } from "./relayer-program";
 
 program
   .requiredOption("--l1-rpc-url <URL>", "RPC Provider URL for layer 1")
-  .requiredOption("--l2-relay-to-rpc-url <URL>", "RPC Provider URL for relay destination rollup")
-  .requiredOption("--l2-relay-from-rpc-url <URL>", "RPC Provider URL for relay source rollup")
+  .option("--l2-relay-to-rpc-url <URL>", "RPC Provider URL for relay destination rollup")
+  .option("--l2-relay-from-rpc-url <URL>", "RPC Provider URL for relay source rollup")
   .requiredOption("--wallet-private-key <hash>", "Private key for the layer 1 wallet")
-  .requiredOption(
-    "--l2-transaction-hash <hash>",
-    "Layer 2 transaction hash that needs to be relayed",
-  )
+  .option("--l2-transaction-hash <hash>", "Layer 2 transaction hash that needs to be relayed")
   .option("--network-from <file_path>", "Path to a file with custom network configuration")
-  .option("--network-to <file_path>", "Path to a file with custom network configuration");
+  .option("--network-to <file_path>", "Path to a file with custom network configuration")
+  .option(
+    "--l1-nonce-lock-file <file_path>",
+    "Lock file shared by relayers of the same account to coordinate layer 1 nonces",
+  )
+  .option(
+    "--daemon",
+    "Keep running and relay the transactions requested on stdin, one JSON object per line",
+  );
 
 program.parse(process.argv);
 
@@ -27,9 +33,31 @@ if (argValidationErrors.length) {
   process.exit(1);
 }
 
+async function runDaemon(startPpid: number) {
+  // Responses are written to stdout, so keep the relayers' output off it.
+  console.log = console.error;
+  const daemon = new RelayerDaemon(args);
+  const respond = (line: string) => process.stdout.write(line + "\n");
+
+  try {
+    await Promise.race([
+      daemon.serve(process.stdin, respond),
+      killOnParentProcessChange(startPpid),
+    ]);
+    process.exit(0);
+  } catch (err) {
+    console.error(err);
+    process.exit(1);
+  }
+}
+
 async function main() {
   const startPpid = ppid;
 
+  if (args.daemon) {
+    return runDaemon(startPpid);
+  }
+
   const relayProgram = await RelayerProgram.createFromArgs(args);
 
   try {
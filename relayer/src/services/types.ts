@@ -2,6 +2,7 @@ import type { Provider } from "@ethersproject/providers";
 import { JsonRpcProvider } from "@ethersproject/providers";
 import { Wallet } from "ethers";
 
+import { NonceLockedWallet } from "../common/nonce-lock";
 import type { ArbitrumRelayerService } from "./arbitrum";
 import type { BobaRelayerService } from "./boba";
 import type { OptimismRelayerService } from "./optimism";
@@ -17,8 +18,11 @@ export abstract class BaseRelayerService {
   readonly l1Wallet: Wallet;
   readonly l2Wallet: Wallet;
 
-  constructor(l1RpcURL: string, l2RpcURL: string, privateKey: string) {
-    this.l1Wallet = new Wallet(privateKey, new JsonRpcProvider(l1RpcURL));
+  constructor(l1RpcURL: string, l2RpcURL: string, privateKey: string, l1NonceLockFile?: string) {
+    const l1Provider = new JsonRpcProvider(l1RpcURL);
+    this.l1Wallet = l1NonceLockFile
+      ? new NonceLockedWallet(privateKey, l1Provider, l1NonceLockFile)
+      : new Wallet(privateKey, l1Provider);
     this.l2Wallet = new Wallet(privateKey, new JsonRpcProvider(l2RpcURL));
   }
 
@@ -0,0 +1,61 @@
+import { existsSync, mkdtempSync, utimesSync, writeFileSync } from "fs";
+import { tmpdir } from "os";
+import { join } from "path";
+
+import { withFileLock } from "@/common/nonce-lock";
+
+function makeLockPath(): string {
+  return join(mkdtempSync(join(tmpdir(), "nonce-lock-")), "relayer.lock");
+}
+
+describe("withFileLock", () => {
+  it("runs the function while holding the lock", async () => {
+    const lockPath = makeLockPath();
+
+    const result = await withFileLock(lockPath, async () => {
+      expect(existsSync(lockPath)).toBe(true);
+      return 42;
+    });
+
+    expect(result).toBe(42);
+    expect(existsSync(lockPath)).toBe(false);
+  });
+
+  it("never runs two functions at the same time", async () => {
+    const lockPath = makeLockPath();
+    const log: Array<string> = [];
+
+    const run = (name: string) =>
+      withFileLock(lockPath, async () => {
+        log.push(`${name} start`);
+        await new Promise((resolve) => setTimeout(resolve, 50));
+        log.push(`${name} end`);
+      });
+    await Promise.all([run("a"), run("b")]);
+
+    expect(log).toEqual(["a start", "a end", "b start", "b end"]);
+  });
+
+  it("releases the lock when the function fails", async () => {
+    const lockPath = makeLockPath();
+
+    await expect(
+      withFileLock(lockPath, async () => {
+        throw new Error("failed");
+      }),
+    ).rejects.toThrow("failed");
+
+    expect(existsSync(lockPath)).toBe(false);
+  });
+
+  it("takes over stale locks", async () => {
+    const lockPath = makeLockPath();
+    writeFileSync(lockPath, "");
+    const staleTime = new Date(Date.now() - 120_000);
+    utimesSync(lockPath, staleTime, staleTime);
+
+    const result = await withFileLock(lockPath, async () => 42);
+
+    expect(result).toBe(42);
+  });
+});
@@ -0,0 +1,94 @@
+import { Readable } from "stream";
+
+import { getNetworkId } from "@/common/network";
+import { SERVICES } from "@/map";
+import type { DaemonOptions } from "@/relayer-daemon";
+import { RelayerDaemon } from "@/relayer-daemon";
+import { RelayerProgram } from "@/relayer-program";
+import {
+  getRandomPrivateKey,
+  getRandomTransactionHash,
+  getRandomUrl,
+} from "~/utils/data_generators";
+
+jest.mock("@/common/network");
+
+const options: DaemonOptions = {
+  l1RpcUrl: getRandomUrl("l1"),
+  walletPrivateKey: getRandomPrivateKey(),
+};
+
+function makeRequest(id: number) {
+  return {
+    id,
+    l2RelayFromRpcUrl: getRandomUrl("l2.from"),
+    l2RelayToRpcUrl: getRandomUrl("l2.to"),
+    l2TransactionHash: getRandomTransactionHash(),
+  };
+}
+
+async function serve(daemon: RelayerDaemon, lines: Array<string>) {
+  const responses: Array<unknown> = [];
+  await daemon.serve(Readable.from(lines.map((line) => line + "\n")), (line) =>
+    responses.push(JSON.parse(line)),
+  );
+  return responses;
+}
+
+describe("RelayerDaemon", () => {
+  beforeEach(() => {
+    console.error = jest.fn();
+    (getNetworkId as jest.Mock).mockResolvedValue(Number(Object.keys(SERVICES)[0]));
+  });
+
+  it("answers every request", async () => {
+    jest.spyOn(RelayerProgram.prototype, "run").mockResolvedValue(undefined);
+    const daemon = new RelayerDaemon(options);
+
+    const responses = await serve(daemon, [
+      JSON.stringify(makeRequest(1)),
+      "",
+      JSON.stringify(makeRequest(2)),
+    ]);
+
+    expect(responses).toEqual([
+      { id: 1, success: true },
+      { id: 2, success: true },
+    ]);
+    expect(RelayerProgram.prototype.run).toHaveBeenCalledTimes(2);
+  });
+
+  it("reports failed relays", async () => {
+    jest.spyOn(RelayerProgram.prototype, "run").mockRejectedValue(new Error("relay failed"));
+    const daemon = new RelayerDaemon(options);
+
+    const responses = await serve(daemon, [JSON.stringify(makeRequest(1))]);
+
+    expect(responses).toEqual([{ id: 1, success: false, error: "Error: relay failed" }]);
+  });
+
+  it("reports invalid requests", async () => {
+    jest.spyOn(RelayerProgram.prototype, "run").mockResolvedValue(undefined);
+    const daemon = new RelayerDaemon(options);
+    const request = { ...makeRequest(1), l2TransactionHash: "0x1234" };
+
+    const responses = await serve(daemon, ["{", JSON.stringify(request)]);
+
+    expect(responses).toMatchObject([
+      { id: null, success: false },
+      { id: 1, success: false },
+    ]);
+    expect(RelayerProgram.prototype.run).not.toHaveBeenCalled();
+  });
+
+  it("reuses the relayer services of a rollup", async () => {
+    const daemon = new RelayerDaemon(options);
+    const rpcUrl = getRandomUrl("l2");
+
+    const relayer = await daemon.getRelayer(rpcUrl);
+
+    expect(await daemon.getRelayer(rpcUrl)).toBe(relayer);
+    expect(await daemon.getRelayer(getRandomUrl("l2"))).not.toBe(relayer);
+    expect(getNetworkId).toHaveBeenCalledTimes(2);
+  });
+});
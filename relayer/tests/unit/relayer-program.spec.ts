@@ -38,6 +38,22 @@ describe("validateArgs", () => {
       ]);
     }
   });
+
+  it("gives an error for missing options", () => {
+    const errors = validateArgs({ l1RpcUrl: getRandomUrl("l1") } as ProgramOptions);
+
+    expect(errors).toEqual([
+      `Missing required option "--l2-relay-to-rpc-url"`,
+      `Missing required option "--l2-relay-from-rpc-url"`,
+      `Missing required option "--l2-transaction-hash"`,
+    ]);
+  });
+
+  it("does not require a transaction in daemon mode", () => {
+    const errors = validateArgs({ l1RpcUrl: getRandomUrl("l1"), daemon: true } as ProgramOptions);
+
+    expect(errors).toEqual([]);
+  });
 });
 
 describe("RelayerProgram", () => {
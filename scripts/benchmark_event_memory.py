@@ -0,0 +1,153 @@
+"""Compare the memory used by decoded events with how events used to be
+represented, i.e. as dataclasses with a ``__dict__`` per instance and a
+string of their own for every address."""
+import dataclasses
+import gc
+import json
+import random
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+import click
+from eth_abi import encode
+from eth_utils import to_checksum_address
+from eth_utils.abi import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3 import Web3
+from web3._utils.events import get_event_data
+
+from beamer.agent.events import _EVENT_TYPES, EventDecoder, _camel_to_snake
+from beamer.agent.typing import ChainId, FillId, RequestId
+
+_EVENT_NAMES = ("RequestCreated", "ClaimMade", "RequestFilled")
+
+
+def _make_legacy_type(event_type: type) -> type:
+    fields: list[Any] = []
+    for field in dataclasses.fields(event_type):
+        if field.default is dataclasses.MISSING:
+            fields.append((field.name, field.type))
+        else:
+            fields.append((field.name, field.type, dataclasses.field(default=field.default)))
+    return dataclasses.make_dataclass(event_type.__name__, fields, frozen=True)
+
+
+_LEGACY_TYPES = {name: _make_legacy_type(type_) for name, type_ in _EVENT_TYPES.items()}
+
+
+def _make_value(abi_type: str, addresses: Sequence[str]) -> Any:
+    if abi_type == "address":
+        return random.choice(addresses)
+    if abi_type == "bytes32":
+        return random.randbytes(32)
+    return random.randrange(2 ** int(abi_type.removeprefix("uint")))
+
+
+def _make_logs(abis: dict[str, Any], num_logs: int, num_addresses: int) -> list[Any]:
+    addresses = [to_checksum_address(random.randbytes(20)) for _ in range(num_addresses)]
+    logs = []
+    for index in range(num_logs):
+        abi = abis[_EVENT_NAMES[index % len(_EVENT_NAMES)]]
+        topics = [HexBytes(event_abi_to_log_topic(abi))]
+        data_types, data_values = [], []
+        for input_ in abi["inputs"]:
+            value = _make_value(input_["type"], addresses)
+            if input_["indexed"]:
+                topics.append(HexBytes(encode([input_["type"]], [value])))
+            else:
+                data_types.append(input_["type"])
+                data_values.append(value)
+        logs.append(
+            dict(
+                topics=topics,
+                data=HexBytes(encode(data_types, data_values)).hex(),
+                blockNumber=index,
+                transactionHash=HexBytes(random.randbytes(32)),
+                logIndex=0,
+                transactionIndex=0,
+                address=addresses[0],
+                blockHash=HexBytes(random.randbytes(32)),
+            )
+        )
+    return logs
+
+
+def _decode_legacy(abis: dict[str, Any], logs: list[Any]) -> list:
+    codec = Web3().codec
+    abis_by_topic = {event_abi_to_log_topic(abi): abi for abi in abis.values()}
+    events = []
+    for log_entry in logs:
+        abi = abis_by_topic[log_entry["topics"][0]]
+        data = get_event_data(codec, abi, log_entry)
+        kwargs = dict(
+            chain_id=ChainId(1),
+            block_number=data.blockNumber,
+            tx_hash=data.transactionHash,
+        )
+        for name, value in data.args.items():
+            name = _camel_to_snake(name)
+            if name == "request_id":
+                value = RequestId(value)
+            elif name == "fill_id":
+                value = FillId(value)
+            kwargs[name] = value
+        events.append(_LEGACY_TYPES[data.event](**kwargs))
+    return events
+
+
+def _measure(decode: Callable[[], list]) -> tuple[int, int]:
+    gc.collect()
+    tracemalloc.start()
+    events = decode()
+    gc.collect()
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(events), size
+
+
+@click.command()
+@click.option(
+    "--logs", "num_logs", type=int, default=10_000, show_default=True, help="Logs to decode."
+)
+@click.option(
+    "--addresses",
+    "num_addresses",
+    type=int,
+    default=1_000,
+    show_default=True,
+    help="Distinct addresses the logs refer to.",
+)
+@click.option(
+    "--deployment-dir",
+    type=click.Path(file_okay=False, dir_okay=True, exists=True, path_type=Path),
+    default=Path(__file__).parents[1] / "deployments" / "mainnet",
+    show_default=True,
+    help="The directory to take the contract ABIs from.",
+)
+def main(num_logs: int, num_addresses: int, deployment_dir: Path) -> None:
+    random.seed(0)
+    w3 = Web3()
+    contracts: list[Any] = []
+    abis = {}
+    for name in ("RequestManager", "FillManager"):
+        abi = json.loads((deployment_dir / f"{name}.json").read_text())["abi"]
+        contracts.append(w3.eth.contract(abi=abi))
+        for entry in abi:
+            if entry["type"] == "event" and entry["name"] in _EVENT_NAMES:
+                abis[entry["name"]] = entry
+
+    logs = _make_logs(abis, num_logs, num_addresses)
+    decoder = EventDecoder(contracts, w3.codec)
+
+    results = dict(
+        legacy=_measure(lambda: _decode_legacy(abis, logs)),
+        current=_measure(lambda: decoder.decode(logs, ChainId(1))),
+    )
+    for name, (count, size) in results.items():
+        print(f"{name:>8}: {size / 2**20:8.1f} MiB for {count} events, {size / count:.0f} B each")
+    print(f"   ratio: {results['current'][1] / results['legacy'][1]:.2f}")
+
+
+if __name__ == "__main__":
+    main()